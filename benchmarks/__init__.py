@@ -0,0 +1,15 @@
+"""
+Load tests for the contacts API.
+
+Seeds N users x M contacts, drives the app either in-process or over HTTP against a running uvicorn,
+and reports throughput and latency percentiles per endpoint::
+
+    python -m benchmarks --users 20 --contacts 500 --requests 2000 --output results.json
+    python -m benchmarks --target http://localhost:8000 --no-seed --baseline results.json --threshold 0.1
+
+The seed writes to the database from ``SQLALCHEMY_DATABASE_URL`` (or ``--database-url``); a live server
+must use the same database. Re-seeding replaces only the ``bench-*`` users and their contacts.
+
+``--startup-budget 1.0`` also times cold starts of a uvicorn worker and fails the run when the median
+exceeds the budget; ``python -m benchmarks.startup`` shows where the import time goes.
+"""
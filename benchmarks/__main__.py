@@ -0,0 +1,6 @@
+import sys
+
+from benchmarks.cli import main
+
+
+sys.exit(main())
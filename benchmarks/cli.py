@@ -0,0 +1,97 @@
+import argparse
+import asyncio
+import os
+
+from benchmarks import report, startup
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Load test the contacts API.")
+    parser.add_argument("--target", default=None,
+                        help="base URL of a running server, e.g. http://localhost:8000; in-process when omitted")
+    parser.add_argument("--database-url", default=None, help="overrides SQLALCHEMY_DATABASE_URL")
+    parser.add_argument("--users", type=int, default=10, help="number of benchmark users")
+    parser.add_argument("--contacts", type=int, default=200, help="contacts per user")
+    parser.add_argument("--seed", type=int, default=42, help="random seed of the data generator")
+    parser.add_argument("--no-seed", dest="seed_data", action="store_false", help="reuse the data of a previous run")
+    parser.add_argument("--seed-only", action="store_true", help="only seed the data, e.g. for benchmarks.plans")
+    parser.add_argument("--create-schema", action="store_true", help="create missing tables before seeding")
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=10, help="requests in flight at once")
+    parser.add_argument("--warmup", type=int, default=20, help="unmeasured requests per endpoint")
+    parser.add_argument("--scenario", action="append", dest="scenarios",
+                        help="endpoint to run, can be repeated; all by default")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="allowed slowdown against the baseline, 0.1 is 10%%")
+    parser.add_argument("--metric", action="append", dest="metrics", choices=sorted(report.METRICS),
+                        help="metric compared against the baseline, can be repeated; p95_ms and throughput by default")
+    parser.add_argument("--startup-budget", type=float, default=startup.TARGET_S,
+                        help=f"fail when a cold start to the first 200 takes longer, in seconds; "
+                             f"{startup.TARGET_S} by default, 0 skips the cold start")
+    parser.add_argument("--startup-runs", type=int, default=3, help="cold starts to take the median of")
+    return parser.parse_args(argv)
+
+
+async def bench(args) -> dict:
+    # settings are read on import, so the app is imported after --database-url is applied
+    from benchmarks import runner
+    from benchmarks.data import bench_users, seed
+    from src.database.db import engine
+
+    if args.create_schema:
+        from src.database.models import Base
+        Base.metadata.create_all(bind=engine)
+    if args.seed_data:
+        print(f"Seeding {args.users} users x {args.contacts} contacts")
+        users = seed(engine, args.users, args.contacts, args.seed)
+    else:
+        users = bench_users(args.users)
+    if args.seed_only:
+        return None
+
+    scenarios = runner.SCENARIOS
+    if args.scenarios:
+        scenarios = [scenario for scenario in scenarios if scenario.name in args.scenarios]
+
+    if args.target:
+        client = runner.live_client(args.target, args.concurrency)
+    else:
+        from main import app
+        client = runner.in_process_client(app)
+    async with client:
+        results = await runner.run(client, scenarios, users, args.requests, args.concurrency, args.warmup)
+    return report.build_report(results, target=args.target or "in-process", users=args.users,
+                               contacts_per_user=args.contacts, requests=args.requests,
+                               concurrency=args.concurrency)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.database_url:
+        os.environ["SQLALCHEMY_DATABASE_URL"] = args.database_url
+    current = asyncio.run(bench(args))
+    if current is None:
+        return 0
+    over_budget = False
+    if args.startup_budget:
+        current["startup"] = cold_start = startup.measure_cold_start(args.startup_runs)
+        print(f"Cold start to first 200: median {cold_start['median_s']:.3f} s, budget {args.startup_budget:.3f} s")
+        over_budget = cold_start["median_s"] > args.startup_budget
+    if args.output:
+        report.save_report(current, args.output)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        regressions = report.compare(report.load_report(args.baseline), current, args.threshold,
+                                     args.metrics or ["p95_ms", "throughput"])
+        if regressions:
+            print("Regressions against the baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against the baseline")
+    if over_budget:
+        print("Cold start is over the budget")
+        return 1
+    return 0
@@ -0,0 +1,93 @@
+import hashlib
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Iterator, List
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.engine import Engine
+
+from src.database.models import Contact, User
+from src.repository.contacts import day_of_year
+
+
+PASSWORD = "benchmark"
+EMAIL_DOMAIN = "bench.example.com"
+
+FIRST_NAMES = (
+    "Olena", "Andrii", "Maria", "Taras", "Iryna", "Dmytro", "Sofia", "Oleksandr", "Anna", "Mykola",
+    "Kateryna", "Yurii", "Natalia", "Serhii", "Oksana", "Ivan", "Daria", "Petro", "Yulia", "Bohdan",
+    "Emma", "Liam", "Olivia", "Noah", "Ava", "Lucas", "Mia", "Mateo", "Chloe", "Jonas",
+)
+LAST_NAMES = (
+    "Shevchenko", "Kovalenko", "Bondarenko", "Tkachenko", "Kravchenko", "Melnyk", "Boyko", "Koval",
+    "Oliynyk", "Lysenko", "Moroz", "Marchenko", "Savchenko", "Rudenko", "Pavlenko", "Smith", "Johnson",
+    "Brown", "Garcia", "Miller", "Davis", "Martinez", "Wilson", "Anderson", "Taylor", "Novak", "Weber",
+)
+
+
+@dataclass
+class BenchUser:
+    username: str
+    email: str
+    password: str = PASSWORD
+
+
+def bench_users(count: int) -> List[BenchUser]:
+    return [BenchUser(username=f"bench-{i}", email=f"bench-{i}@{EMAIL_DOMAIN}") for i in range(count)]
+
+
+def gravatar(email: str) -> str:
+    return f"https://www.gravatar.com/avatar/{hashlib.md5(email.encode()).hexdigest()}"
+
+
+def random_birthday(rng: random.Random) -> date:
+    # uniform over the calendar, so every 7 day window holds about 2% of the contacts
+    start = date(1950, 1, 1)
+    return start + timedelta(days=rng.randrange((date(2005, 12, 31) - start).days))
+
+
+def generate_contacts(user_index: int, count: int, rng: random.Random) -> Iterator[dict]:
+    for i in range(count):
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        birthday = random_birthday(rng)
+        yield {
+            "first_name": first_name,
+            "last_name": last_name,
+            "email": f"{first_name}.{last_name}.{user_index}.{i}@{EMAIL_DOMAIN}".lower(),
+            "phone": f"+380{user_index:04d}{i:06d}",
+            "birthday": birthday,
+            "birthday_doy": day_of_year(birthday),
+            "done": False,
+        }
+
+
+def seed(engine: Engine, users: int, contacts_per_user: int, seed: int = 42, batch_size: int = 1000) -> List[BenchUser]:
+    """
+    Replaces the benchmark users and their contacts with a freshly generated data set.
+
+    All users share one bcrypt hash so seeding does not spend minutes hashing passwords.
+    """
+    from src.services.hashing import get_pwd_context
+
+    rng = random.Random(seed)
+    accounts = bench_users(users)
+    password = get_pwd_context().hash(PASSWORD)
+    with engine.begin() as conn:
+        old_ids = select(User.id).filter(User.email.like(f"bench-%@{EMAIL_DOMAIN}"))
+        conn.execute(delete(Contact).filter(Contact.user_id.in_(old_ids)))
+        conn.execute(delete(User).filter(User.email.like(f"bench-%@{EMAIL_DOMAIN}")))
+        for index, account in enumerate(accounts):
+            user_id = conn.execute(insert(User).values(username=account.username, email=account.email,
+                                                       password=password, avatar=gravatar(account.email),
+                                                       confirmed=True)
+                                   .returning(User.id)).scalar_one()
+            batch = []
+            for contact in generate_contacts(index, contacts_per_user, rng):
+                batch.append({**contact, "user_id": user_id})
+                if len(batch) == batch_size:
+                    conn.execute(insert(Contact), batch)
+                    batch = []
+            if batch:
+                conn.execute(insert(Contact), batch)
+    return accounts
@@ -0,0 +1,194 @@
+"""
+Checks that the repository queries use indexes instead of scanning the whole contacts table.
+
+Runs the queries of ``src.repository.contacts`` for one benchmark user, captures their SQL and prints
+the plan of each one. Exits non-zero when a plan reads ``contacts`` with a sequential scan::
+
+    python -m benchmarks --users 50 --contacts 2000 --seed-only     # the benchmark dataset
+    python -m benchmarks.plans --database-url postgresql://...
+
+Plans depend on the table size and statistics, so run it on the benchmark dataset, not an empty table.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+from datetime import date
+from typing import Callable, List, Tuple
+from unittest.mock import MagicMock
+
+from sqlalchemy import Delete, Select, Update, select
+from sqlalchemy.sql import Executable
+from sqlalchemy.engine import Connection, Engine
+
+
+TABLE = "contacts"
+
+
+class StopCapture(Exception):
+    pass
+
+
+class CapturingSession:
+    """
+    Stands in for the AsyncSession and keeps the SELECTs the repository would run, up to its first write.
+
+    An UPDATE or DELETE finds its rows like a SELECT does, so it is kept as well before the capture stops.
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.statements: List[Executable] = []
+
+    def get_bind(self):
+        return self.engine
+
+    async def execute(self, stmt, params=None):
+        if isinstance(stmt, (Update, Delete)):
+            self.statements.append(stmt)
+            raise StopCapture
+        if not isinstance(stmt, Select):
+            raise StopCapture
+        self.statements.append(stmt)
+        return MagicMock()
+
+    async def stream(self, stmt):
+        self.statements.append(stmt)
+        raise StopCapture
+
+    @asynccontextmanager
+    async def begin_nested(self):
+        yield
+
+    async def delete(self, instance):
+        raise StopCapture
+
+    async def commit(self):
+        raise StopCapture
+
+
+def repository_calls(user) -> List[Tuple[str, Callable]]:
+    from src.repository import contacts as repository_contacts
+    from src.schemas import ContactModel, ContactStatusUpdate, ContactUpdate
+
+    body = ContactModel(first_name="Plan", last_name="Check", email="plan.check@example.com",
+                        phone="+380000000000", birthday=date(1990, 1, 1))
+
+    async def stream_contacts(db):
+        async for _ in repository_contacts.stream_contacts(user, db):
+            pass
+
+    return [
+        ("get_contacts", lambda db: repository_contacts.get_contacts(0, 100, user, db)),
+        ("get_contacts_after_id", lambda db: repository_contacts.get_contacts(0, 100, user, db, after_id=1)),
+        ("get_contact_rows", lambda db: repository_contacts.get_contact_rows(0, 100, user, db)),
+        ("stream_contacts", stream_contacts),
+        ("get_contact", lambda db: repository_contacts.get_contact("Olena", "Melnyk", "olena@example.com", user, db)),
+        ("search_contacts", lambda db: repository_contacts.search_contacts("kov", 20, user, db)),
+        ("get_contact_by_birthday", lambda db: repository_contacts.get_contact_by_birthday(user, db)),
+        ("create_contacts", lambda db: repository_contacts.create_contacts([body], user, db)),
+        ("update_contact",
+         lambda db: repository_contacts.update_contact(1, ContactUpdate(**body.dict(), done=True), user, db)),
+        ("update_status_contact",
+         lambda db: repository_contacts.update_status_contact(1, ContactStatusUpdate(done=True), user, db)),
+        ("remove_contact", lambda db: repository_contacts.remove_contact(1, user, db)),
+    ]
+
+
+async def capture_queries(engine: Engine, user) -> List[Tuple[str, Executable]]:
+    queries = []
+    for name, call in repository_calls(user):
+        session = CapturingSession(engine)
+        try:
+            await call(session)
+        except StopCapture:
+            pass
+        queries.extend((name, stmt) for stmt in session.statements)
+    return queries
+
+
+def explain(conn: Connection, stmt: Executable) -> Tuple[List[str], List[str]]:
+    """
+    Gets the plan of a statement as text lines, plus the sequential scans of ``contacts`` in it.
+    """
+    compiled = stmt.compile(dialect=conn.dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[name] for name in compiled.positiontup)
+    if conn.dialect.name == "postgresql":
+        plan = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {compiled}", params).scalar()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        lines, scans = [], []
+        _walk(plan[0]["Plan"], 0, lines, scans)
+        return lines, scans
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", params).all()
+    lines = [row[-1] for row in rows]
+    # SQLite says SEARCH for index lookups and SCAN for reading the whole table or a whole index
+    return lines, [line for line in lines if line.split()[:2] == ["SCAN", TABLE]]
+
+
+def _walk(node: dict, depth: int, lines: List[str], scans: List[str]) -> None:
+    line = node["Node Type"]
+    if "Relation Name" in node:
+        line += f" on {node['Relation Name']}"
+    if "Index Name" in node:
+        line += f" using {node['Index Name']}"
+    lines.append("  " * depth + line)
+    if node["Node Type"] == "Seq Scan" and node.get("Relation Name") == TABLE:
+        scans.append(line)
+    for child in node.get("Plans", ()):
+        _walk(child, depth + 1, lines, scans)
+
+
+def check_plans(engine: Engine, user, log: Callable[[str], None] = print) -> List[str]:
+    """
+    Explains every captured repository query and lists the ones that scan the whole contacts table.
+    """
+    queries = asyncio.run(capture_queries(engine, user))
+    failures = []
+    with engine.connect() as conn:
+        for name, stmt in queries:
+            lines, scans = explain(conn, stmt)
+            log(f"{name}:")
+            for line in lines:
+                log(f"    {line}")
+            if scans:
+                failures.append(f"{name}: {', '.join(scans)}")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.plans", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--database-url", default=None, help="overrides SQLALCHEMY_DATABASE_URL")
+    parser.add_argument("--user", default="bench-0@bench.example.com", help="email of the user to query for")
+    parser.add_argument("--no-analyze", dest="analyze", action="store_false",
+                        help="do not refresh the table statistics first")
+    args = parser.parse_args(argv)
+    if args.database_url:
+        os.environ["SQLALCHEMY_DATABASE_URL"] = args.database_url
+
+    from src.database.db import engine
+    from src.database.models import User
+
+    with engine.begin() as conn:
+        if args.analyze:
+            conn.exec_driver_sql(f"ANALYZE {TABLE}")
+        user = conn.execute(select(User.id, User.email).filter(User.email == args.user)).first()
+    if user is None:
+        print(f"User {args.user} not found, seed the benchmark dataset first")
+        return 2
+    failures = check_plans(engine, User(id=user.id, email=user.email))
+    if failures:
+        print("Sequential scans of contacts:")
+        for failure in failures:
+            print(f"  {failure}")
+        return 1
+    print("All repository queries use an index")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List
+
+# lower is better for latencies, higher is better for throughput
+METRICS = {"p50_ms": 1, "p95_ms": 1, "p99_ms": 1, "mean_ms": 1, "throughput": -1}
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(results: Dict[str, dict], **meta) -> dict:
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            **meta,
+        },
+        "results": results,
+    }
+
+
+def save_report(report: dict, path: str) -> None:
+    with open(path, "w") as fh:
+        json.dump(report, fh, indent=2)
+
+
+def load_report(path: str) -> dict:
+    with open(path) as fh:
+        return json.load(fh)
+
+
+def compare(baseline: dict, current: dict, threshold: float, metrics: List[str]) -> List[str]:
+    """
+    Lists every endpoint metric that got worse than the baseline by more than ``threshold`` (0.1 is 10%).
+
+    Endpoints missing from either report are skipped, so adding a scenario does not fail the comparison.
+    """
+    regressions = []
+    for name, result in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        for metric in metrics:
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * METRICS[metric]
+            if change > threshold:
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+        if result["errors"] > before["errors"]:
+            regressions.append(f"{name} errors: {before['errors']} -> {result['errors']}")
+    return regressions
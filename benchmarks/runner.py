@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+import math
+from dataclasses import dataclass, field
+from time import perf_counter
+from typing import Callable, Dict, List
+
+import httpx
+
+from benchmarks.data import BenchUser, FIRST_NAMES, LAST_NAMES
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: str
+    params: Callable[[int], dict] = lambda i: {}
+    authenticated: bool = True
+
+
+def _login_form(user: BenchUser) -> dict:
+    return {"username": user.email, "password": user.password}
+
+
+SCENARIOS = [
+    Scenario("login", "POST", "/api/auth/login", authenticated=False),
+    Scenario("read_contacts", "GET", "/api/contacts/", lambda i: {"limit": 100}),
+    Scenario("read_contacts_page", "GET", "/api/contacts/", lambda i: {"limit": 20, "skip": (i * 20) % 400}),
+    Scenario("read_contact_by_birthday", "GET", "/api/contacts/birthday"),
+    Scenario("read_contact", "GET", "/api/contacts/contact",
+             lambda i: {"first_name": FIRST_NAMES[i % len(FIRST_NAMES)]}),
+    Scenario("search_contacts", "GET", "/api/contacts/search",
+             lambda i: {"q": LAST_NAMES[i % len(LAST_NAMES)][:3]}),
+    Scenario("read_me", "GET", "/api/users/me/"),
+]
+
+
+@dataclass
+class Result:
+    name: str
+    latencies: List[float] = field(default_factory=list)
+    errors: int = 0
+    statuses: Dict[int, int] = field(default_factory=dict)
+    elapsed: float = 0.0
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "statuses": {str(code): n for code, n in sorted(self.statuses.items())},
+            "throughput": count / self.elapsed if self.elapsed else 0.0,
+            "mean_ms": sum(latencies) / count * 1000 if count else 0.0,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p95_ms": percentile(latencies, 95) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "max_ms": latencies[-1] * 1000 if count else 0.0,
+        }
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+async def login(client: httpx.AsyncClient, user: BenchUser) -> str:
+    response = await client.post("/api/auth/login", data=_login_form(user))
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, users: List[BenchUser], tokens: List[str],
+                       requests: int, concurrency: int, warmup: int = 0) -> Result:
+    result = Result(scenario.name)
+    counter = itertools.count()
+
+    async def send(i: int) -> httpx.Response:
+        user_index = i % len(users)
+        if scenario.authenticated:
+            return await client.request(scenario.method, scenario.path, params=scenario.params(i),
+                                        headers={"Authorization": f"Bearer {tokens[user_index]}"})
+        return await client.request(scenario.method, scenario.path, data=_login_form(users[user_index]))
+
+    async def worker(total: int, measure: bool) -> None:
+        while (i := next(counter)) < total:
+            start = perf_counter()
+            try:
+                response = await send(i)
+                code = response.status_code
+            except httpx.HTTPError:
+                code = 0
+            if not measure:
+                continue
+            result.latencies.append(perf_counter() - start)
+            result.statuses[code] = result.statuses.get(code, 0) + 1
+            if not 200 <= code < 400:
+                result.errors += 1
+
+    if warmup:
+        await asyncio.gather(*(worker(warmup, False) for _ in range(concurrency)))
+        counter = itertools.count()
+    start = perf_counter()
+    await asyncio.gather(*(worker(requests, True) for _ in range(concurrency)))
+    result.elapsed = perf_counter() - start
+    return result
+
+
+async def run(client: httpx.AsyncClient, scenarios: List[Scenario], users: List[BenchUser], requests: int,
+              concurrency: int, warmup: int = 0, log: Callable[[str], None] = print) -> Dict[str, dict]:
+    tokens = [await login(client, user) for user in users]
+    results = {}
+    for scenario in scenarios:
+        result = await run_scenario(client, scenario, users, tokens, requests, concurrency, warmup)
+        results[scenario.name] = summary = result.summary()
+        log(f"{scenario.name:<26} {summary['throughput']:>8.1f} req/s  p50 {summary['p50_ms']:>7.1f} ms  "
+            f"p95 {summary['p95_ms']:>7.1f} ms  p99 {summary['p99_ms']:>7.1f} ms  errors {summary['errors']}")
+    return results
+
+
+def in_process_client(app) -> httpx.AsyncClient:
+    """
+    Client that calls the ASGI app directly, without sockets or a server process.
+
+    The rate limiter dependencies are disabled here, they would turn the run into 429s.
+    """
+    from src.services.rate_limit import RateLimit
+
+    for route in app.routes:
+        for dependency in getattr(getattr(route, "dependant", None), "dependencies", ()):
+            if isinstance(dependency.call, RateLimit):
+                app.dependency_overrides[dependency.call] = lambda: None
+    # unhandled errors become 500 responses, as they would behind uvicorn
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=60)
+
+
+def live_client(base_url: str, concurrency: int) -> httpx.AsyncClient:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60)
@@ -0,0 +1,149 @@
+"""
+Measures how fast a fresh worker is ready to serve.
+
+Prints where the import time of the app goes, from ``python -X importtime``, and times a cold start: from
+spawning a uvicorn process to the first 200 response. Exits non-zero when the cold start is over budget::
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget 1.0
+    python -m benchmarks.startup --budget 0     # no budget, only measure
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+# a worker is ready in well under a second, the check fails the run once the median cold start is over it
+TARGET_S = 1.0
+
+
+@dataclass
+class ImportTime:
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def parse_importtime(text: str) -> List[ImportTime]:
+    """
+    Parses the ``import time: self | cumulative | module`` lines ``python -X importtime`` writes to stderr.
+    """
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        name = module.rstrip()
+        entries.append(ImportTime(name.strip(), int(self_us), int(cumulative_us), (len(name) - len(name.strip())) // 2))
+    return entries
+
+
+def import_profile(module: str = "main") -> List[ImportTime]:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def summarize(entries: List[ImportTime], module: str, top: int = 15) -> dict:
+    """
+    Totals the import of ``module`` and ranks the top level packages by their own import time.
+    """
+    packages: Dict[str, int] = defaultdict(int)
+    for entry in entries:
+        packages[entry.module.split(".")[0]] += entry.self_us
+    total = next((entry.cumulative_us for entry in entries if entry.module == module), 0)
+    return {
+        "module": module,
+        "total_ms": total / 1000,
+        "modules": len(entries),
+        "packages": [{"package": name, "self_ms": us / 1000}
+                     for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]],
+        "slowest": [{"module": entry.module, "cumulative_ms": entry.cumulative_us / 1000}
+                    for entry in sorted(entries, key=lambda entry: -entry.cumulative_us)[:top]],
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def cold_start(app: str = "main:app", path: str = "/", timeout: float = 30.0) -> float:
+    """
+    Seconds from spawning a uvicorn process to its first 200 response on ``path``.
+    """
+    port = free_port()
+    url = f"http://127.0.0.1:{port}{path}"
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", str(port),
+                                "--log-level", "warning"], env=os.environ.copy())
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(url, timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - start
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError(f"no 200 from {url} within {timeout} seconds")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def measure_cold_start(runs: int = 3, app: str = "main:app", path: str = "/") -> dict:
+    # the first run also warms the OS file cache and the bytecode, the median hides it
+    samples = [cold_start(app, path) for _ in range(runs)]
+    return {"runs": runs, "median_s": statistics.median(samples), "max_s": max(samples)}
+
+
+def main(argv=None, log: Callable[[str], None] = print) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.startup", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--module", default="main", help="module to profile the import of")
+    parser.add_argument("--app", default="main:app", help="ASGI app to cold start")
+    parser.add_argument("--path", default="/", help="path that must answer 200")
+    parser.add_argument("--top", type=int, default=15, help="packages and modules to list")
+    parser.add_argument("--runs", type=int, default=3, help="cold starts to take the median of")
+    parser.add_argument("--budget", type=float, default=TARGET_S,
+                        help=f"seconds the median cold start may take, {TARGET_S} by default, 0 for no budget")
+    parser.add_argument("--no-server", dest="server", action="store_false", help="only profile the imports")
+    args = parser.parse_args(argv)
+
+    summary = summarize(import_profile(args.module), args.module, args.top)
+    log(f"import {summary['module']}: {summary['total_ms']:.0f} ms, {summary['modules']} modules")
+    log("Own import time by package:")
+    for package in summary["packages"]:
+        log(f"  {package['self_ms']:>8.1f} ms  {package['package']}")
+    log("Slowest imports, including what they import:")
+    for module in summary["slowest"]:
+        log(f"  {module['cumulative_ms']:>8.1f} ms  {module['module']}")
+    if not args.server:
+        return 0
+
+    result = measure_cold_start(args.runs, args.app, args.path)
+    log(f"Cold start to first 200: median {result['median_s']:.3f} s, max {result['max_s']:.3f} s "
+        f"over {result['runs']} runs")
+    if args.budget and result["median_s"] > args.budget:
+        log(f"Over the budget of {args.budget:.3f} s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
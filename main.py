@@ -1,9 +1,20 @@
-from fastapi import FastAPI
-from src.routes import contacts, auth, users
-from fastapi_limiter import FastAPILimiter
-import redis.asyncio as redis
+import argparse
+import os
+import tempfile
+from pathlib import Path
+
+from fastapi import FastAPI, Response
+from fastapi.staticfiles import StaticFiles
+from src.routes import contacts, auth, users, internal
 from src.conf.config import settings
-import uvicorn
+from src.database.db import init_db, close_db
+from src.database.shards import init_shards, close_shards
+from src.services.cache import init_redis, close_redis
+from src.services.hashing import password_hasher
+from src.services.email import email_dispatcher
+from src.services.storage import init_storage
+from src.services.metrics import MetricsMiddleware, metrics_dump
+from src.services.rate_limit import rate_limiter
 from fastapi.middleware.cors import CORSMiddleware
 
 
@@ -17,12 +28,19 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
+app.add_middleware(MetricsMiddleware)
 
 
 app.include_router(contacts.router, prefix='/api')
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
+app.include_router(internal.router, prefix='/api')
+
+if settings.avatar_storage == 'local':
+    app.mount(settings.avatar_local_url, StaticFiles(directory=settings.avatar_local_dir, check_dir=False),
+              name='avatars')
 
 
 @app.get("/")
@@ -30,12 +48,70 @@ def read_root():
     return {"Welcome to Contacts"}
 
 
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    return Response(content=metrics_dump.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.on_event("startup")
 async def startup():
-    r = await redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0, encoding="utf-8",
-                          decode_responses=True)
-    await FastAPILimiter.init(r)
+    # runs in every worker process, each one gets its own database and Redis connections
+    await init_db()
+    await init_shards()
+    await init_redis()
+    await rate_limiter.start()
+    await email_dispatcher.start()
+    await metrics_dump.start()
+    init_storage()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await rate_limiter.stop()
+    await email_dispatcher.stop()
+    await metrics_dump.stop()
+    password_hasher.shutdown()
+    await close_redis()
+    await close_shards()
+    await close_db()
+
+
+def run(prod: bool = False) -> None:
+    """
+    Starts the server, either a single reloading development process or the production setup.
+
+    In production uvicorn runs ``settings.uvicorn_workers`` processes (one per CPU when 0), with uvloop and
+    httptools when they are installed. On SIGTERM it stops accepting connections and waits up to
+    ``settings.uvicorn_graceful_timeout`` seconds for in-flight requests before the shutdown handlers run.
+    The workers sum their metrics through ``settings.metrics_multiproc_dir``, emptied here on every start.
+    """
+    # imported here, the workers uvicorn spawns only need the app
+    import uvicorn
+
+    if not prod:
+        uvicorn.run('main:app', port=settings.uvicorn_port, reload=True)
+        return
+    metrics_dir = Path(settings.metrics_multiproc_dir or tempfile.mkdtemp(prefix='contacts-metrics-'))
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    for dump in metrics_dir.glob('*.json'):
+        dump.unlink()
+    # the workers read their settings from the environment
+    os.environ['METRICS_MULTIPROC_DIR'] = str(metrics_dir)
+    uvicorn.run(
+        'main:app',
+        host=settings.uvicorn_host,
+        port=settings.uvicorn_port,
+        workers=settings.uvicorn_workers or os.cpu_count() or 1,
+        loop=settings.uvicorn_loop,
+        http=settings.uvicorn_http,
+        backlog=settings.uvicorn_backlog,
+        timeout_keep_alive=settings.uvicorn_keepalive,
+        timeout_graceful_shutdown=settings.uvicorn_graceful_timeout,
+        proxy_headers=True,
+    )
 
 
 if __name__ == '__main__':
-    uvicorn.run('main:app', port=settings.uvicorn_port, reload=True)   
+    parser = argparse.ArgumentParser(description='Contacts API server')
+    parser.add_argument('--prod', action='store_true', help='run the multi-worker production server')
+    run(parser.parse_args().prod)   
@@ -0,0 +1,65 @@
+"""'Contacts birthday_doy sync'
+
+Revision ID: 189c9d4d2e71
+Revises: 9d2f6b3e8a71
+Create Date: 2026-10-17 21:14:08.502731
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '189c9d4d2e71'
+down_revision = '9d2f6b3e8a71'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 5000
+
+# day of the year on a leap-year calendar, see src.repository.contacts.day_of_year
+DOY = "EXTRACT(DOY FROM make_date(2000, EXTRACT(MONTH FROM {0})::int, EXTRACT(DAY FROM {0})::int))::int"
+
+
+def repair() -> None:
+    # rows written since 866de2c5d3cd by code that did not set the day, one short transaction per batch
+    stale = f"birthday_doy IS DISTINCT FROM {DOY.format('birthday_date')}"
+    if context.is_offline_mode():
+        op.execute(f"UPDATE contacts SET birthday_doy = {DOY.format('birthday_date')} WHERE {stale}")
+        return
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        ids = conn.execute(sa.text(
+            f"SELECT id FROM contacts WHERE id > :last_id AND {stale} ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BATCH_SIZE}).scalars().all()
+        if not ids:
+            break
+        conn.execute(sa.text(
+            f"UPDATE contacts SET birthday_doy = {DOY.format('birthday_date')} "
+            f"WHERE id BETWEEN :first_id AND :last_id AND {stale}"
+        ), {"first_id": ids[0], "last_id": ids[-1]})
+        last_id = ids[-1]
+
+
+def upgrade() -> None:
+    # the database keeps birthday_doy in sync with birthday_date, so the birthday window does not miss rows
+    # written by instances or tools that leave the day NULL or stale
+    with op.get_context().autocommit_block():
+        op.execute(
+            "CREATE OR REPLACE FUNCTION contacts_birthday_doy_sync() RETURNS trigger AS $$ BEGIN "
+            f"NEW.birthday_doy := {DOY.format('NEW.birthday_date')}; "
+            "RETURN NEW; END $$ LANGUAGE plpgsql"
+        )
+        op.execute("DROP TRIGGER IF EXISTS contacts_birthday_doy_sync ON contacts")
+        op.execute(
+            "CREATE TRIGGER contacts_birthday_doy_sync BEFORE INSERT OR UPDATE ON contacts "
+            "FOR EACH ROW EXECUTE FUNCTION contacts_birthday_doy_sync()"
+        )
+        repair()
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS contacts_birthday_doy_sync ON contacts")
+    op.execute("DROP FUNCTION IF EXISTS contacts_birthday_doy_sync()")
@@ -0,0 +1,28 @@
+"""'Contacts search index'
+
+Revision ID: 5cf338648590
+Revises: 866de2c5d3cd
+Create Date: 2026-10-17 11:40:02.553117
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5cf338648590'
+down_revision = '866de2c5d3cd'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute("CREATE EXTENSION IF NOT EXISTS btree_gin")
+    op.create_index('ix_contacts_search_trgm', 'contacts', ['user_id', 'first_name', 'last_name', 'email', 'phone'],
+                    unique=False, postgresql_using='gin',
+                    postgresql_ops={'first_name': 'gin_trgm_ops', 'last_name': 'gin_trgm_ops',
+                                    'email': 'gin_trgm_ops', 'phone': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_search_trgm', table_name='contacts', postgresql_using='gin')
@@ -0,0 +1,33 @@
+"""'Contacts birthday_doy'
+
+Revision ID: 866de2c5d3cd
+Revises: bf544275a258
+Create Date: 2026-10-17 09:12:40.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '866de2c5d3cd'
+down_revision = 'bf544275a258'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday_doy', sa.Integer(), nullable=True))
+
+    # day of the year on a leap-year calendar, see src.repository.contacts.day_of_year
+    op.execute(
+        "UPDATE contacts SET birthday_doy = EXTRACT(DOY FROM make_date(2000, "
+        "split_part(birthday, '-', 2)::int, split_part(birthday, '-', 3)::int))"
+    )
+
+    op.create_index('ix_contacts_user_id_birthday_doy', 'contacts', ['user_id', 'birthday_doy'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id_birthday_doy', table_name='contacts')
+    op.drop_column('contacts', 'birthday_doy')
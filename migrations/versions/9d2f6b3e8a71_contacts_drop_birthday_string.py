@@ -0,0 +1,49 @@
+"""'Contacts drop birthday string'
+
+Revision ID: 9d2f6b3e8a71
+Revises: e4b7d2a91c53
+Create Date: 2026-10-17 19:05:31.840127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d2f6b3e8a71'
+down_revision = 'e4b7d2a91c53'
+branch_labels = None
+depends_on = None
+
+
+# Contract step of c81e5b0f4a29. Run it only after every instance runs the code that maps
+# Contact.birthday to birthday_date, the older code still reads and writes the string column:
+#
+#     alembic upgrade e4b7d2a91c53    # before the deploy
+#     alembic upgrade head            # after it
+
+
+def upgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS contacts_birthday_date_sync ON contacts")
+    op.execute("DROP FUNCTION IF EXISTS contacts_birthday_date_sync()")
+    op.drop_column('contacts', 'birthday')
+
+
+def downgrade() -> None:
+    op.add_column('contacts', sa.Column('birthday', sa.String(length=50), nullable=True))
+    op.execute("UPDATE contacts SET birthday = to_char(birthday_date, 'YYYY-MM-DD')")
+    op.alter_column('contacts', 'birthday', nullable=False)
+    op.execute(
+        "CREATE OR REPLACE FUNCTION contacts_birthday_date_sync() RETURNS trigger AS $$ BEGIN "
+        "IF NEW.birthday_date IS NULL "
+        "OR (TG_OP = 'UPDATE' AND NEW.birthday IS DISTINCT FROM OLD.birthday) THEN "
+        "NEW.birthday_date := NEW.birthday::date; "
+        "ELSIF NEW.birthday IS NULL "
+        "OR (TG_OP = 'UPDATE' AND NEW.birthday_date IS DISTINCT FROM OLD.birthday_date) THEN "
+        "NEW.birthday := to_char(NEW.birthday_date, 'YYYY-MM-DD'); "
+        "END IF; RETURN NEW; END $$ LANGUAGE plpgsql"
+    )
+    op.execute(
+        "CREATE TRIGGER contacts_birthday_date_sync BEFORE INSERT OR UPDATE ON contacts "
+        "FOR EACH ROW EXECUTE FUNCTION contacts_birthday_date_sync()"
+    )
@@ -0,0 +1,38 @@
+"""'Contacts user indexes'
+
+Revision ID: a3f1c9d27e64
+Revises: 5cf338648590
+Create Date: 2026-10-17 14:05:31.870412
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f1c9d27e64'
+down_revision = '5cf338648590'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = {
+    'ix_contacts_user_id_id': ['user_id', 'id'],
+    'ix_contacts_user_id_name': ['user_id', 'last_name', 'first_name'],
+    'ix_contacts_user_id_email': ['user_id', 'email'],
+}
+
+
+def upgrade() -> None:
+    # CONCURRENTLY does not lock the table for writes, but cannot run inside a transaction.
+    # if_not_exists lets a rerun skip the indexes built before an interruption; an index left INVALID
+    # by a failed build has to be dropped by hand first.
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES.items():
+            op.create_index(name, 'contacts', columns, unique=False, if_not_exists=True,
+                            postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name in INDEXES:
+            op.drop_index(name, table_name='contacts', if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,79 @@
+"""'Contacts birthday date'
+
+Revision ID: c81e5b0f4a29
+Revises: a3f1c9d27e64
+Create Date: 2026-10-17 15:22:47.306518
+
+"""
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81e5b0f4a29'
+down_revision = 'a3f1c9d27e64'
+branch_labels = None
+depends_on = None
+
+
+BATCH_SIZE = 5000
+
+
+def backfill() -> None:
+    # one short transaction per batch, rows already converted are skipped, so an interrupted run resumes
+    if context.is_offline_mode():
+        op.execute("UPDATE contacts SET birthday_date = birthday::date WHERE birthday_date IS NULL")
+        return
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        ids = conn.execute(sa.text(
+            "SELECT id FROM contacts WHERE id > :last_id AND birthday_date IS NULL ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": BATCH_SIZE}).scalars().all()
+        if not ids:
+            break
+        conn.execute(sa.text(
+            "UPDATE contacts SET birthday_date = birthday::date "
+            "WHERE id BETWEEN :first_id AND :last_id AND birthday_date IS NULL"
+        ), {"first_id": ids[0], "last_id": ids[-1]})
+        last_id = ids[-1]
+
+
+def upgrade() -> None:
+    # expand only: the string column stays and both columns are kept in sync, so instances still reading
+    # and writing ``birthday`` keep working next to the ones using ``birthday_date``. The old column is
+    # dropped by 9d2f6b3e8a71 once every instance runs the new code.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TABLE contacts ADD COLUMN IF NOT EXISTS birthday_date date")
+        op.execute(
+            "CREATE OR REPLACE FUNCTION contacts_birthday_date_sync() RETURNS trigger AS $$ BEGIN "
+            "IF NEW.birthday_date IS NULL "
+            "OR (TG_OP = 'UPDATE' AND NEW.birthday IS DISTINCT FROM OLD.birthday) THEN "
+            "NEW.birthday_date := NEW.birthday::date; "
+            "ELSIF NEW.birthday IS NULL "
+            "OR (TG_OP = 'UPDATE' AND NEW.birthday_date IS DISTINCT FROM OLD.birthday_date) THEN "
+            "NEW.birthday := to_char(NEW.birthday_date, 'YYYY-MM-DD'); "
+            "END IF; RETURN NEW; END $$ LANGUAGE plpgsql"
+        )
+        op.execute("DROP TRIGGER IF EXISTS contacts_birthday_date_sync ON contacts")
+        op.execute(
+            "CREATE TRIGGER contacts_birthday_date_sync BEFORE INSERT OR UPDATE ON contacts "
+            "FOR EACH ROW EXECUTE FUNCTION contacts_birthday_date_sync()"
+        )
+        backfill()
+        # a validated CHECK lets SET NOT NULL skip the full table scan under an exclusive lock
+        op.execute("ALTER TABLE contacts DROP CONSTRAINT IF EXISTS contacts_birthday_date_not_null")
+        op.execute(
+            "ALTER TABLE contacts ADD CONSTRAINT contacts_birthday_date_not_null "
+            "CHECK (birthday_date IS NOT NULL) NOT VALID"
+        )
+        op.execute("ALTER TABLE contacts VALIDATE CONSTRAINT contacts_birthday_date_not_null")
+
+    op.alter_column('contacts', 'birthday_date', nullable=False)
+    op.drop_constraint('contacts_birthday_date_not_null', 'contacts', type_='check')
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS contacts_birthday_date_sync ON contacts")
+    op.execute("DROP FUNCTION IF EXISTS contacts_birthday_date_sync()")
+    op.drop_column('contacts', 'birthday_date')
@@ -0,0 +1,27 @@
+"""'Users contacts shard'
+
+Revision ID: e4b7d2a91c53
+Revises: c81e5b0f4a29
+Create Date: 2026-10-17 16:40:12.554093
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b7d2a91c53'
+down_revision = 'c81e5b0f4a29'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('contacts_shard', sa.String(length=50), nullable=True))
+    # a constant default does not rewrite the table on Postgres 11+
+    op.add_column('users', sa.Column('contacts_locked', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'contacts_locked')
+    op.drop_column('users', 'contacts_shard')
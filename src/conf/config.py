@@ -1,8 +1,21 @@
+from typing import Dict, List
+
 from pydantic import BaseSettings
 
 
 class Settings(BaseSettings):
     sqlalchemy_database_url: str
+    sqlalchemy_replica_urls: List[str] = []
+    db_replica_check_interval: float = 5.0
+    db_replica_check_timeout: float = 2.0
+    db_replica_stickiness: int = 5
+    contacts_shards: Dict[str, str] = {}
+    contacts_shard_vnodes: int = 128
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
     secret_key: str
     algorithm: str
     mail_username: str
@@ -12,10 +25,53 @@ class Settings(BaseSettings):
     mail_server: str
     redis_host: str
     redis_port: int 
+    # seconds a command of the shared client may wait, a Redis that stops answering then fails the command
+    # like one that is down instead of hanging the requests that use it
+    redis_socket_timeout: float = 0.5
     uvicorn_port: int
+    uvicorn_host: str = "127.0.0.1"
+    uvicorn_workers: int = 0
+    uvicorn_loop: str = "auto"
+    uvicorn_http: str = "auto"
+    uvicorn_keepalive: int = 5
+    uvicorn_backlog: int = 2048
+    uvicorn_graceful_timeout: int = 30
+    # directory the workers of --prod share their metrics through, a temporary one when empty
+    metrics_multiproc_dir: str = ""
+    metrics_dump_interval: float = 1.0
+    refresh_token_ttl: int = 7 * 24 * 3600
+    # bearer token of /api/internal, the endpoints answer 404 while it is empty
+    internal_token: str = ""
     cloudinary_name: str
     cloudinary_api_key: str
     cloudinary_api_secret: str
+    user_cache_ttl: int = 60
+    contacts_cache_ttl: int = 300
+    contacts_version_ttl: int = 3600
+    contacts_fast_json: bool = False
+    birthday_digest_ttl: int = 2 * 24 * 3600
+    birthday_digest_at: str = "00:05"
+    rate_limits: Dict[str, str] = {"read_contacts": "10/60"}
+    rate_limit_sync_interval: float = 1.0
+    rate_limit_redis_timeout: float = 0.5
+    rate_limit_breaker_threshold: int = 3
+    rate_limit_breaker_cooldown: float = 30.0
+    rate_limit_fallback: str = "local"
+    password_hash_pool: str = "thread"
+    password_hash_workers: int = 4
+    password_hash_queue_size: int = 32
+    import_batch_size: int = 500
+    import_max_errors: int = 1000
+    mail_backend: str = "smtp"
+    mail_connections: int = 1
+    mail_batch_size: int = 20
+    mail_max_retries: int = 5
+    mail_retry_backoff: float = 1.0
+    mail_queue_size: int = 10000
+    avatar_storage: str = "cloudinary"
+    avatar_local_dir: str = "static/avatars"
+    avatar_local_url: str = "/static/avatars"
+    avatar_size: int = 250
 
     class Config:
         env_file = ".env"
@@ -1,18 +1,288 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+import asyncio
+from contextvars import ContextVar
+from functools import lru_cache
+from time import perf_counter
+from typing import List
+
+from sqlalchemy import Select, create_engine, event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from src.conf.config import settings
 
 
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def get_async_url(url: str) -> str:
+    """
+    Converts a sync database URL into the matching async driver URL.
+
+    :param url: The database URL, e.g. ``postgresql+psycopg2://...``.
+    :type url: str
+    :return: The URL with an async driver, e.g. ``postgresql+asyncpg://...``.
+    :rtype: str
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and url.drivername != ASYNC_DRIVERS[backend]:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    return url.render_as_string(hide_password=False)
+
+
+class PoolStats:
+    def __init__(self):
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+        self.pool = None
+
+    def record_wait(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.wait_seconds += seconds
+        self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+
+    def record_checkout(self) -> None:
+        if self.pool is not None:
+            self.peak_checked_out = max(self.peak_checked_out, self.pool.checkedout())
+            self.peak_overflow = max(self.peak_overflow, self.overflow())
+
+    def overflow(self) -> int:
+        # QueuePool counts overflow from -pool_size until the pool is full
+        return max(self.pool.overflow(), 0)
+
+    def stats(self) -> dict:
+        result = {
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_seconds": self.wait_seconds / self.checkouts if self.checkouts else 0.0,
+            "max_wait_seconds": self.max_wait_seconds,
+            "peak_checked_out": self.peak_checked_out,
+            "peak_overflow": self.peak_overflow,
+        }
+        if self.pool is not None:
+            result.update(size=self.pool.size(), checked_out=self.pool.checkedout(), overflow=self.overflow(),
+                          max_overflow=settings.db_max_overflow)
+        return result
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedAsyncPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long every checkout waited for a connection.
+    """
+
+    def connect(self):
+        start = perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            # not a checkout, counting its wait would hide the timeouts in the averages
+            pool_stats.timeouts += 1
+            raise
+        pool_stats.record_wait(perf_counter() - start)
+        return connection
+
+
+def get_pool_options(url: str) -> dict:
+    """
+    Builds the connection pool arguments for ``create_engine`` from the settings.
+
+    SQLite keeps the pool SQLAlchemy picks for it, only pre-ping applies.
+
+    :param url: The database URL.
+    :type url: str
+    :return: The keyword arguments for the engine.
+    :rtype: dict
+    """
+    options = {"pool_pre_ping": settings.db_pool_pre_ping}
+    if make_url(url).get_backend_name() != "sqlite":
+        options.update(
+            pool_size=settings.db_pool_size,
+            max_overflow=settings.db_max_overflow,
+            pool_timeout=settings.db_pool_timeout,
+            pool_recycle=settings.db_pool_recycle,
+        )
+    return options
+
+
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
 
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+@lru_cache
+def get_sync_engine() -> Engine:
+    # only tools like the benchmarks use the sync driver, the app does not load it
+    return create_engine(SQLALCHEMY_DATABASE_URL, **get_pool_options(SQLALCHEMY_DATABASE_URL))
+
+
+def __getattr__(name: str):
+    # ``engine`` and ``SessionLocal`` are created on first use
+    if name == "engine":
+        return get_sync_engine()
+    if name == "SessionLocal":
+        return sessionmaker(autocommit=False, autoflush=False, bind=get_sync_engine())
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+async_pool_options = get_pool_options(SQLALCHEMY_DATABASE_URL)
+if "pool_size" in async_pool_options:
+    async_pool_options["poolclass"] = InstrumentedAsyncPool
+async_engine = create_async_engine(get_async_url(SQLALCHEMY_DATABASE_URL), **async_pool_options)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+if isinstance(async_engine.pool, InstrumentedAsyncPool):
+    pool_stats.pool = async_engine.pool
+
+    @event.listens_for(async_engine.sync_engine, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        pool_stats.record_checkout()
+
+    @event.listens_for(async_engine.sync_engine, "engine_disposed")
+    def _on_disposed(engine):
+        # dispose() replaces the pool with a fresh one
+        pool_stats.pool = engine.pool
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_async_engine(get_async_url(url), **get_pool_options(url))
+        self.healthy = True
+        self.picks = 0
+
+
+class ReplicaSet:
+    """
+    Read replicas picked round-robin, skipping the ones whose last health check failed.
+    """
+
+    def __init__(self, urls: List[str], check_interval: float = 5.0, check_timeout: float = 2.0):
+        self.replicas = [Replica(url) for url in urls]
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.position = 0
+        self.task: asyncio.Task | None = None
+
+    def pick(self) -> AsyncEngine | None:
+        for _ in range(len(self.replicas)):
+            replica = self.replicas[self.position % len(self.replicas)]
+            self.position += 1
+            if replica.healthy:
+                replica.picks += 1
+                return replica.engine
+        return None
+
+    async def _ping(self, replica: Replica) -> None:
+        async with replica.engine.connect() as conn:
+            await conn.exec_driver_sql("SELECT 1")
+
+    async def check(self) -> None:
+        for replica in self.replicas:
+            try:
+                await asyncio.wait_for(self._ping(replica), self.check_timeout)
+            except (exc.SQLAlchemyError, OSError, asyncio.TimeoutError) as e:
+                if replica.healthy:
+                    print(f"Replica {replica.url} is down: {e!r}")
+                replica.healthy = False
+            else:
+                replica.healthy = True
+
+    async def _run(self) -> None:
+        while True:
+            await self.check()
+            await asyncio.sleep(self.check_interval)
+
+    async def start(self) -> None:
+        if self.replicas:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def dispose(self, close: bool = True) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose(close=close)
+
+    def stats(self) -> list:
+        return [{"url": replica.url, "healthy": replica.healthy, "picks": replica.picks}
+                for replica in self.replicas]
+
+
+replicas = ReplicaSet(settings.sqlalchemy_replica_urls, check_interval=settings.db_replica_check_interval,
+                      check_timeout=settings.db_replica_check_timeout)
+
+# set once the current request writes, its later reads must see the write and stay on the primary
+read_from_primary: ContextVar[bool] = ContextVar("read_from_primary", default=False)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _on_orm_execute(orm_execute_state):
+    if not orm_execute_state.is_select:
+        read_from_primary.set(True)
+
+
+@event.listens_for(Session, "after_flush")
+def _on_flush(session, flush_context):
+    read_from_primary.set(True)
+
+
+class RoutingSession(Session):
+    """
+    Session that sends plain SELECTs to a replica and everything else to the primary.
+
+    A session sticks to the replica it picked first. Once the request has written anything, or when no
+    replica is healthy, it reads from the primary as well.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        is_read = isinstance(clause, Select) and clause._for_update_arg is None
+        if not is_read or self._flushing or read_from_primary.get():
+            return async_engine.sync_engine
+        if "replica" not in self.info:
+            self.info["replica"] = replicas.pick() or async_engine
+        return self.info["replica"].sync_engine
+
+
+ReadSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, sync_session_class=RoutingSession,
+                                      autoflush=False, expire_on_commit=False)
+
+
+async def init_db() -> None:
+    """
+    Gives the current worker process its own connection pools.
+
+    Connections inherited from a parent process must not be shared, so they are dropped without closing them.
+    """
+    await async_engine.dispose(close=False)
+    await replicas.dispose(close=False)
+    await replicas.start()
+
+
+async def close_db() -> None:
+    await replicas.stop()
+    await replicas.dispose()
+    await async_engine.dispose()
+
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_read_db():
+    """
+    Session for read-only endpoints, served by the replicas when ``settings.sqlalchemy_replica_urls`` is set.
+    """
+    async with ReadSessionLocal() as db:
         yield db
-    finally:
-        db.close()
@@ -1,7 +1,7 @@
-from sqlalchemy import Column, Integer, String, Boolean, func
+from sqlalchemy import Column, Integer, String, Boolean, Index, false, func
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.schema import ForeignKey
-from sqlalchemy.sql.sqltypes import DateTime
+from sqlalchemy.sql.sqltypes import Date, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 
 
@@ -15,13 +15,26 @@ class Contact(Base):
     last_name = Column(String(50), nullable=False)
     email = Column(String(100), nullable=False, unique=True)
     phone = Column(String(50), nullable=False, unique=True)
-    birthday = Column(String(50), nullable=False)
+    # the DATE column has its own name while the migration from the string column is rolled out
+    birthday = Column('birthday_date', Date, key='birthday', nullable=False)
+    birthday_doy = Column(Integer, nullable=True)
     optionaly = Column(String(100), nullable=True)
     done = Column(Boolean, default=False)
     created_at = Column('created_at', DateTime, default=func.now(), nullable=False)
     user_id = Column('user_id', ForeignKey('users.id', ondelete='CASCADE'), default=None)
     user = relationship('User', backref="contacts")    
 
+    __table_args__ = (
+        Index('ix_contacts_user_id_id', 'user_id', 'id'),
+        Index('ix_contacts_user_id_name', 'user_id', 'last_name', 'first_name'),
+        Index('ix_contacts_user_id_email', 'user_id', 'email'),
+        Index('ix_contacts_user_id_birthday_doy', 'user_id', 'birthday_doy'),
+        Index('ix_contacts_search_trgm', 'user_id', 'first_name', 'last_name', 'email', 'phone',
+              postgresql_using='gin',
+              postgresql_ops={'first_name': 'gin_trgm_ops', 'last_name': 'gin_trgm_ops',
+                              'email': 'gin_trgm_ops', 'phone': 'gin_trgm_ops'}),
+    )
+
 
 class User(Base):
     __tablename__ = "users"
@@ -33,3 +46,6 @@ class User(Base):
     avatar = Column(String(255), nullable=True)    
     refresh_token = Column(String(255), nullable=True)
     confirmed = Column(Boolean, default=False)   
+    # shard with the contacts of the user, the hash ring decides while it is not set
+    contacts_shard = Column(String(50), nullable=True)
+    contacts_locked = Column(Boolean, default=False, server_default=false(), nullable=False)
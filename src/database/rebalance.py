@@ -0,0 +1,210 @@
+"""
+Moves the contacts of users between the shards of ``settings.contacts_shards``.
+
+Adding a shard to the hash ring changes the home of about 1/N of the users. Pin every user to the shard
+that holds their contacts before the configuration changes, then move the users whose home changed::
+
+    python -m src.database.rebalance pin            # with the old CONTACTS_SHARDS
+    python -m src.database.rebalance schema         # with the new one, creates the contacts tables
+    python -m src.database.rebalance move --all
+    python -m src.database.rebalance status
+
+A move only blocks the writes of the user being moved, reads keep going to the old shard until it is done.
+"""
+import argparse
+import asyncio
+import sys
+from collections import defaultdict
+from typing import Callable, List, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from src.database.db import async_engine
+from src.database.models import Contact, User
+from src.database.shards import ShardRouter, shard_router
+from src.services.cache import user_cache
+
+
+# Postgres shards hand out contact ids from their own range, ids are kept when contacts move
+SHARD_ID_STEP = 100_000_000
+
+contacts = Contact.__table__
+
+
+async def create_schema(engine: AsyncEngine, index: int) -> None:
+    """
+    Creates the contacts table on a shard, without the foreign key to the users of the primary database.
+    """
+    async with engine.begin() as conn:
+        postgres = conn.dialect.name == "postgresql"
+        if postgres:
+            await conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        await conn.execute(CreateTable(contacts, include_foreign_key_constraints=[], if_not_exists=True))
+        for index_ in contacts.indexes:
+            await conn.execute(CreateIndex(index_, if_not_exists=True))
+        if postgres and index and await conn.scalar(select(func.max(contacts.c.id))) is None:
+            await conn.exec_driver_sql(
+                f"SELECT setval(pg_get_serial_sequence('contacts', 'id'), {index * SHARD_ID_STEP})"
+            )
+
+
+async def fetch(stmt) -> list:
+    async with async_engine.connect() as conn:
+        return (await conn.execute(stmt)).all()
+
+
+async def placements(router: ShardRouter = shard_router) -> List[Tuple[int, str, str, str]]:
+    """
+    Lists every user as ``(id, email, shard with the contacts, home on the hash ring)``.
+    """
+    users = await fetch(select(User.id, User.email, User.contacts_shard).order_by(User.id))
+    return [(user_id, email, shard or router.home(user_id), router.home(user_id)) for user_id, email, shard in users]
+
+
+async def pin_users(router: ShardRouter = shard_router) -> int:
+    """
+    Stores the current shard of every user that is not pinned yet.
+    """
+    by_shard = defaultdict(list)
+    for user_id, email in await fetch(select(User.id, User.email).filter(User.contacts_shard.is_(None))):
+        by_shard[router.home(user_id)].append((user_id, email))
+    for shard, users in by_shard.items():
+        async with async_engine.begin() as conn:
+            await conn.execute(update(User).filter(User.id.in_([user_id for user_id, _ in users]),
+                                                   User.contacts_shard.is_(None))
+                               .values(contacts_shard=shard))
+        # cached users without a pin would follow the new hash ring
+        await user_cache.invalidate(*(email for _, email in users))
+    return sum(map(len, by_shard.values()))
+
+
+async def set_user(user_id: int, email: str, **values) -> None:
+    async with async_engine.begin() as conn:
+        await conn.execute(update(User).filter(User.id == user_id).values(**values))
+    await user_cache.invalidate(email)
+
+
+async def copy_contacts(source: AsyncEngine, target: AsyncEngine, user_id: int, batch_size: int = 1000,
+                        clear_target: bool = True) -> List[int]:
+    """
+    Copies the contacts of a user, after deleting the ones a failed move left on the target if ``clear_target``.
+
+    :return: The ids of the contacts copied.
+    """
+    copied = []
+    async with source.connect() as src, target.begin() as dst:
+        if clear_target:
+            await dst.execute(delete(contacts).filter(contacts.c.user_id == user_id))
+        result = await src.stream(select(contacts).filter(contacts.c.user_id == user_id).order_by(contacts.c.id))
+        async for rows in result.partitions(batch_size):
+            # by column key, row._asdict() uses the column names and contacts.birthday is named birthday_date
+            await dst.execute(insert(contacts), [dict(zip(contacts.c.keys(), row)) for row in rows])
+            copied.extend(row.id for row in rows)
+    return copied
+
+
+async def delete_contacts(engine: AsyncEngine, ids: List[int], batch_size: int = 1000) -> None:
+    for i in range(0, len(ids), batch_size):
+        async with engine.begin() as conn:
+            await conn.execute(delete(contacts).filter(contacts.c.id.in_(ids[i:i + batch_size])))
+
+
+async def move_user(user_id: int, target: str, router: ShardRouter = shard_router, grace: float = 2.0,
+                    batch_size: int = 1000, rounds: int = 3) -> int:
+    """
+    Moves the contacts of a user to another shard.
+
+    The user is locked for writes first, ``grace`` seconds let the requests that loaded the user before
+    the lock finish. The contacts are copied, the user is pinned to the target and unlocked. A request
+    that got past the lock earlier can still write to the old shard, so after another ``grace`` the rows
+    that showed up there since are copied too, for up to ``rounds`` rounds. Only the copied rows are
+    deleted from the old shard. Running a move that failed before the pin starts over.
+
+    :return: The number of contacts moved.
+    :raises RuntimeError: When rows were still written to the old shard in the last round, later ones would
+        stay there.
+    """
+    (email, shard), = await fetch(select(User.email, User.contacts_shard).filter(User.id == user_id))
+    source = shard or router.home(user_id)
+    if source == target:
+        return 0
+    await set_user(user_id, email, contacts_locked=True)
+    try:
+        await asyncio.sleep(grace)
+        copied = await copy_contacts(router.engine(source), router.engine(target), user_id, batch_size)
+    except BaseException:
+        await set_user(user_id, email, contacts_locked=False)
+        raise
+    await set_user(user_id, email, contacts_shard=target, contacts_locked=False)
+    await delete_contacts(router.engine(source), copied, batch_size)
+    moved = len(copied)
+    for _ in range(rounds):
+        await asyncio.sleep(grace)
+        late = await copy_contacts(router.engine(source), router.engine(target), user_id, batch_size,
+                                   clear_target=False)
+        if not late:
+            return moved
+        moved += len(late)
+        await delete_contacts(router.engine(source), late, batch_size)
+    raise RuntimeError(f"contacts of user {user_id} were still written to {source} after {rounds} rounds, "
+                       f"{moved} moved to {target}, later ones stay on {source}")
+
+
+async def run(args, log: Callable[[str], None] = print) -> int:
+    router = shard_router
+    try:
+        if args.command == "schema":
+            for index, name in enumerate(router.names):
+                await create_schema(router.engine(name), index)
+                log(f"{name}: contacts table ready")
+        elif args.command == "pin":
+            log(f"Pinned {await pin_users(router)} users")
+        elif args.command == "status":
+            users = defaultdict(int)
+            misplaced = 0
+            for _, _, shard, home in await placements(router):
+                users[shard] += 1
+                misplaced += shard != home
+            for name in router.names:
+                log(f"{name}: {users.pop(name, 0)} users")
+            for name, count in users.items():
+                log(f"{name}: {count} users, not configured")
+            log(f"{misplaced} users are not on their home shard")
+        elif args.command == "move":
+            for user_id, email, shard, home in await placements(router):
+                if args.users and email not in args.users:
+                    continue
+                target = args.to or home
+                if shard == target:
+                    continue
+                moved = await move_user(user_id, target, router, args.grace, args.batch_size)
+                log(f"{email}: {moved} contacts moved from {shard} to {target}")
+    finally:
+        await router.dispose()
+        await async_engine.dispose()
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.database.rebalance", description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("schema", help="create the contacts table on every shard")
+    commands.add_parser("pin", help="pin the users to their current shard before the shards change")
+    commands.add_parser("status", help="count the users per shard")
+    move = commands.add_parser("move", help="move users to their home shard")
+    who = move.add_mutually_exclusive_group(required=True)
+    who.add_argument("--user", action="append", dest="users", help="email of a user to move, can be repeated")
+    who.add_argument("--all", action="store_true", help="move every user that is not on its home shard")
+    move.add_argument("--to", help="target shard instead of the home shard")
+    move.add_argument("--grace", type=float, default=2.0, help="seconds between locking a user and copying")
+    move.add_argument("--batch-size", type=int, default=1000, help="contacts per INSERT")
+    args = parser.parse_args(argv)
+    if args.command == "move" and args.to and args.to not in shard_router.names:
+        parser.error(f"unknown shard {args.to}")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
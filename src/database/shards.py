@@ -0,0 +1,137 @@
+import bisect
+import hashlib
+from typing import Dict, Iterable, List
+
+from fastapi import Depends, HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
+
+from src.conf.config import settings
+from src.database.db import async_engine, get_async_url, get_db, get_pool_options, get_read_db
+from src.database.models import User
+from src.services.auth import auth_service
+
+
+# name of the only shard while settings.contacts_shards is empty
+PRIMARY = "main"
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent-hash ring. Every node owns ``vnodes`` points, so the keys spread evenly and adding a node
+    moves only the keys the new node takes over, about 1/N of them.
+    """
+
+    def __init__(self, nodes: Iterable[str], vnodes: int = 128):
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def node(self, key) -> str:
+        index = bisect.bisect(self.hashes, _hash(str(key))) % len(self.hashes)
+        return self.nodes[index]
+
+
+class ShardRouter:
+    """
+    Maps users to the database that holds their contacts.
+
+    ``users.contacts_shard`` pins a user to a shard, otherwise the hash ring over the shard names decides.
+    A shard with the URL of ``settings.sqlalchemy_database_url`` is the primary database itself and keeps
+    its sessions and read replicas; every other shard gets its own engine.
+    """
+
+    def __init__(self, urls: Dict[str, str], vnodes: int = 128):
+        urls = urls or {PRIMARY: settings.sqlalchemy_database_url}
+        self.names: List[str] = list(urls)
+        self.urls = {name: make_url(url).render_as_string(hide_password=True) for name, url in urls.items()}
+        self.ring = HashRing(self.names, vnodes)
+        self.primary = next((name for name, url in urls.items() if url == settings.sqlalchemy_database_url), None)
+        self.engines: Dict[str, AsyncEngine] = {
+            name: create_async_engine(get_async_url(url), **get_pool_options(url))
+            for name, url in urls.items() if name != self.primary
+        }
+        self.sessions = {name: async_sessionmaker(engine, class_=AsyncSession, autoflush=False,
+                                                  expire_on_commit=False)
+                         for name, engine in self.engines.items()}
+        self.routed = dict.fromkeys(self.names, 0)
+
+    def home(self, user_id: int) -> str:
+        return self.ring.node(user_id)
+
+    def locate(self, user: User) -> str:
+        return user.contacts_shard or self.home(user.id)
+
+    def engine(self, name: str) -> AsyncEngine:
+        return async_engine if name == self.primary else self.engines[name]
+
+    async def dispose(self, close: bool = True) -> None:
+        for engine in self.engines.values():
+            await engine.dispose(close=close)
+
+    def stats(self) -> list:
+        return [{"name": name, "url": self.urls[name], "primary": name == self.primary, "routed": self.routed[name]}
+                for name in self.names]
+
+
+shard_router = ShardRouter(settings.contacts_shards, settings.contacts_shard_vnodes)
+
+
+async def init_shards() -> None:
+    await shard_router.dispose(close=False)
+
+
+async def close_shards() -> None:
+    await shard_router.dispose()
+
+
+async def get_contacts_db(current_user: User = Depends(auth_service.get_current_user),
+                          db: AsyncSession = Depends(get_db)):
+    """
+    Session on the shard with the contacts of the current user, for endpoints that write them.
+
+    Writes are refused while ``python -m src.database.rebalance`` moves the contacts to another shard.
+    """
+    if current_user.contacts_locked:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Contacts are being moved, try again shortly", headers={"Retry-After": "5"})
+    name = shard_router.locate(current_user)
+    shard_router.routed[name] += 1
+    if name == shard_router.primary:
+        yield db
+        return
+    async with shard_router.sessions[name]() as shard_db:
+        yield shard_db
+
+
+async def ensure_contacts_writable(user: User, db: AsyncSession) -> None:
+    """
+    Fence for long writes such as an import, called between their batches.
+
+    ``get_contacts_db`` only checks the user at the start of the request, this reads the primary database
+    again and stops the writes once a rebalance locked the contacts or moved them to another shard.
+    """
+    shard, locked = (await db.execute(select(User.contacts_shard, User.contacts_locked)
+                                      .filter(User.id == user.id))).one()
+    if locked or (shard or shard_router.home(user.id)) != shard_router.locate(user):
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Contacts are being moved, try again shortly", headers={"Retry-After": "5"})
+
+
+async def get_contacts_read_db(current_user: User = Depends(auth_service.get_current_user),
+                               db: AsyncSession = Depends(get_read_db)):
+    """
+    Session on the shard with the contacts of the current user, for read-only endpoints.
+    """
+    name = shard_router.locate(current_user)
+    shard_router.routed[name] += 1
+    if name == shard_router.primary:
+        yield db
+        return
+    async with shard_router.sessions[name]() as shard_db:
+        yield shard_db
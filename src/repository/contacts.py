@@ -1,14 +1,32 @@
-from datetime import datetime
-from typing import List
-from sqlalchemy import or_, and_
-from sqlalchemy.orm import Session
+import calendar
+from datetime import date, datetime, timedelta
+from typing import AsyncIterator, List, Tuple
+from sqlalchemy import select, insert, update, delete, or_, and_, case, func
+from sqlalchemy.engine import Row
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
 from src.database.models import Contact, User
-from src.schemas import ContactModel, ContactUpdate, ContactStatusUpdate
+from src.schemas import ContactModel, ContactUpdate, ContactStatusUpdate, ContactResponse
+from src.services.cache import contacts_cache
 
 
-async def get_contacts(skip: int, limit: int, user: User, db: Session) -> List[Contact]:
+# the columns of ContactResponse, in the order of its fields
+CONTACT_RESPONSE_COLUMNS = tuple(getattr(Contact, name) for name in ContactResponse.__fields__)
+
+
+def _page(stmt, skip: int, limit: int, user: User, after_id: int | None):
+    stmt = stmt.filter(Contact.user_id == user.id).order_by(Contact.id).limit(limit)
+    if after_id is not None:
+        return stmt.filter(Contact.id > after_id)
+    return stmt.offset(skip)
+
+
+async def get_contacts(skip: int, limit: int, user: User, db: AsyncSession, after_id: int | None = None) -> List[Contact]:
     """
-    Retrieves a list of contacts for a specific user.
+    Retrieves a list of contacts for a specific user ordered by ID.
+
+    When ``after_id`` is given the page starts right after that contact (keyset pagination)
+    and ``skip`` is ignored.
 
     :param skip: The number of contacts to skip.
     :type skip: int
@@ -17,14 +35,62 @@ async def get_contacts(skip: int, limit: int, user: User, db: Session) -> List[C
     :param user: The user to retrieve contacts for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param after_id: The ID of the last contact of the previous page.
+    :type after_id: int | None
     :return: A list of contacts.
     :rtype: List[Contact]
     """
-    return db.query(Contact).filter(Contact.user_id == user.id).offset(skip).limit(limit).all()
+    result = await db.execute(_page(select(Contact), skip, limit, user, after_id))
+    return result.scalars().all()
+
+
+async def get_contact_rows(skip: int, limit: int, user: User, db: AsyncSession, after_id: int | None = None) -> List[Row]:
+    """
+    Retrieves the same page as :func:`get_contacts`, but only the columns of :class:`ContactResponse`
+    as plain rows, without building ORM objects.
+
+    :param skip: The number of contacts to skip.
+    :type skip: int
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
+    :param user: The user to retrieve contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param after_id: The ID of the last contact of the previous page.
+    :type after_id: int | None
+    :return: A list of rows in the order of :data:`CONTACT_RESPONSE_COLUMNS`.
+    :rtype: List[Row]
+    """
+    result = await db.execute(_page(select(*CONTACT_RESPONSE_COLUMNS), skip, limit, user, after_id))
+    return result.all()
 
 
-async def get_contact(first_name: str, last_name: str, email: str, user: User, db: Session) -> List[Contact]:
+async def stream_contacts(user: User, db: AsyncSession, batch_size: int = 1000) -> AsyncIterator[Row]:
+    """
+    Streams all contacts of a specific user from a server-side cursor, ordered by ID.
+
+    Only the columns of :class:`ContactResponse` are selected and rows are fetched ``batch_size`` at a time,
+    so memory use does not depend on the number of contacts.
+
+    :param user: The user to stream contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :param batch_size: The number of rows fetched from the cursor at once.
+    :type batch_size: int
+    :return: An async iterator over the contact rows.
+    :rtype: AsyncIterator[Row]
+    """
+    stmt = select(*CONTACT_RESPONSE_COLUMNS).filter(Contact.user_id == user.id).order_by(Contact.id)\
+        .execution_options(yield_per=batch_size)
+    result = await db.stream(stmt)
+    async for row in result:
+        yield row
+
+
+async def get_contact(first_name: str, last_name: str, email: str, user: User, db: AsyncSession) -> List[Contact]:
     """
     Retrieves a single contact.
 
@@ -37,59 +103,252 @@ async def get_contact(first_name: str, last_name: str, email: str, user: User, d
     :param user: The user to retrieve the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The contact, or None if it does not exist.
     :rtype: Contact | None
     """
-    return db.query(Contact).filter(and_(or_(Contact.first_name == first_name,
-     Contact.last_name == last_name, Contact.email == email), Contact.user_id == user.id)).all()
+    stmt = select(Contact).filter(and_(or_(Contact.first_name == first_name,
+     Contact.last_name == last_name, Contact.email == email), Contact.user_id == user.id))
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+def escape_like(value: str) -> str:
+    """
+    Escapes the LIKE wildcards of a value with a backslash.
+
+    :param value: The value to escape.
+    :type value: str
+    :return: The escaped value.
+    :rtype: str
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+async def search_contacts(query: str, limit: int, user: User, db: AsyncSession) -> List[Contact]:
+    """
+    Searches the contacts of a specific user by a case-insensitive prefix of the first name,
+    last name, email or phone.
+
+    On PostgreSQL the search is served by the trigram index and also returns names similar to the query,
+    ranked by similarity. Other databases only do the prefix match.
+
+    :param query: The text to search for.
+    :type query: str
+    :param limit: The maximum number of contacts to return.
+    :type limit: int
+    :param user: The user to search contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: A list of contacts, best matches first.
+    :rtype: List[Contact]
+    """
+    term = query.strip().lower()
+    pattern = escape_like(term) + "%"
+    names = (Contact.first_name, Contact.last_name)
+    matches = [column.ilike(pattern, escape="\\") for column in names + (Contact.email, Contact.phone)]
+    rank = case(
+        (or_(*(func.lower(column) == term for column in names)), 0),
+        (or_(*matches[:2]), 1),
+        else_=2,
+    )
+    order_by = [rank]
+    if db.get_bind().dialect.name == "postgresql":
+        matches.extend(column.op("%")(term) for column in names)
+        order_by.append(func.greatest(*(func.similarity(column, term) for column in names)).desc())
+    stmt = select(Contact).filter(Contact.user_id == user.id, or_(*matches))\
+        .order_by(*order_by, Contact.last_name, Contact.first_name).limit(limit)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+def day_of_year(birthday: date) -> int:
+    """
+    Gets the day of the year of a birthday on a leap-year calendar.
+
+    Every calendar day, including February 29, keeps the same number regardless of the year,
+    so the value can be stored and indexed once per contact.
+
+    :param birthday: The birthday.
+    :type birthday: date
+    :return: The day of the year, from 1 to 366.
+    :rtype: int
+    """
+    return date(2000, birthday.month, birthday.day).timetuple().tm_yday
+
+
+def birthday_window(today: date, days: int = 7) -> Tuple[int, int]:
+    """
+    Gets the range of birthday days of the year falling within the next days.
+
+    The range wraps around the end of the year when the start is greater than the end.
+    In common years February 29 birthdays are celebrated on March 1.
+
+    :param today: The first day of the window.
+    :type today: date
+    :param days: The number of days after today to include.
+    :type days: int
+    :return: The first and the last day of the year of the window.
+    :rtype: Tuple[int, int]
+    """
+    start = day_of_year(today)
+    if not calendar.isleap(today.year) and (today.month, today.day) == (3, 1):
+        start -= 1
+    return start, day_of_year(today + timedelta(days=days))
+
 
+def _in_birthday_window(start: int, end: int):
+    if start <= end:
+        return Contact.birthday_doy.between(start, end)
+    return or_(Contact.birthday_doy >= start, Contact.birthday_doy <= end)
 
-async def get_contact_by_birthday(user: User, db: Session) -> List[Contact]:
+
+async def get_contact_by_birthday(user: User, db: AsyncSession, today: date | None = None) -> List[Contact]:
     """
-    Gets the list of the contacts selected by certain birthday.
+    Gets the list of the contacts whose birthday falls within the next seven days.
 
     :param user: The user to get the contact by birthday for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
+    :param today: The first day of the window, the current date by default.
+    :type today: date | None
     :return: The list of the contacts, or None if it does not exist.
     :rtype: List[Contact] | None
     """
-    now = datetime.now().date()
-    year_now = now.year
-    query_list = []
-    result = db.query(Contact).all()
-    for res in result:
-        if res.user_id == user.id:
-            b_list = res.birthday.split("-")
-            if 0 <= (datetime(year_now, int(b_list[1]), int(b_list[2])).date()-now).days <= 7:
-                query_list.append(res)
-    return query_list
+    start, end = birthday_window(today or datetime.now().date())
+    stmt = select(Contact).filter(Contact.user_id == user.id, _in_birthday_window(start, end))\
+        .order_by(Contact.birthday_doy < start, Contact.birthday_doy)
+    result = await db.execute(stmt)
+    return result.scalars().all()
+
+
+async def stream_upcoming_birthdays(today: date, db: AsyncSession | AsyncConnection,
+                                    batch_size: int = 1000) -> AsyncIterator[Row]:
+    """
+    Streams the contacts of all users whose birthday falls within the seven days from today.
 
+    The rows are grouped by user, each group in the order of :func:`get_contact_by_birthday`.
 
-async def create_contact(body: ContactModel, user: User, db: Session) -> Contact:
+    :param today: The first day of the window.
+    :type today: date
+    :param db: The database session or connection.
+    :type db: AsyncSession | AsyncConnection
+    :param batch_size: The number of rows fetched from the cursor at once.
+    :type batch_size: int
+    :return: An async iterator over rows of the user id followed by :data:`CONTACT_RESPONSE_COLUMNS`.
+    :rtype: AsyncIterator[Row]
     """
-    Creates a new contact for a specific user.
+    start, end = birthday_window(today)
+    stmt = select(Contact.user_id, *CONTACT_RESPONSE_COLUMNS).filter(_in_birthday_window(start, end))\
+        .order_by(Contact.user_id, Contact.birthday_doy < start, Contact.birthday_doy)\
+        .execution_options(yield_per=batch_size)
+    result = await db.stream(stmt)
+    async for row in result:
+        yield row
+
+
+async def create_contact(body: ContactModel, user: User, db: AsyncSession) -> Row:
+    """
+    Creates a new contact for a specific user with a single INSERT ... RETURNING.
 
     :param body: The data for the contact to create.
     :type body: ContactModel
     :param user: The user to create the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
-    :return: The newly created contact.
-    :rtype: Contact
-    """
-    contact = Contact(first_name=body.first_name, last_name=body.last_name,
-     email=body.email, phone=body.phone, birthday=body.birthday, user_id=user.id)
-    db.add(contact)
-    db.commit()
-    db.refresh(contact)
+    :type db: AsyncSession
+    :return: The newly created contact, with the columns of ContactResponse.
+    :rtype: Row
+    """
+    stmt = insert(Contact).values(first_name=body.first_name, last_name=body.last_name, email=body.email,
+                                  phone=body.phone, birthday=body.birthday, birthday_doy=day_of_year(body.birthday),
+                                  user_id=user.id)\
+        .returning(*CONTACT_RESPONSE_COLUMNS)
+    result = await db.execute(stmt)
+    contact = result.one()
+    await db.commit()
+    await contacts_cache.bump(user.id)
     return contact
 
 
-async def remove_contact(contact_id: int, user: User, db: Session) -> Contact | None:
+async def create_contacts(bodies: List[ContactModel], user: User, db: AsyncSession) -> List[str | None]:
+    """
+    Creates a batch of contacts for a specific user with a single multi-row INSERT.
+
+    Contacts whose email or phone is already taken, in the database or earlier in the batch,
+    are skipped and reported instead of aborting the whole batch.
+
+    :param bodies: The data for the contacts to create.
+    :type bodies: List[ContactModel]
+    :param user: The user to create the contacts for.
+    :type user: User
+    :param db: The database session.
+    :type db: AsyncSession
+    :return: An error message for every skipped contact, or None for every created one, in the order of bodies.
+    :rtype: List[str | None]
+    """
+    emails = {body.email for body in bodies}
+    phones = {body.phone for body in bodies}
+    stmt = select(Contact.email, Contact.phone).filter(or_(Contact.email.in_(emails), Contact.phone.in_(phones)))
+    result = await db.execute(stmt)
+    taken_emails, taken_phones = set(), set()
+    for email, phone in result.all():
+        taken_emails.add(email)
+        taken_phones.add(phone)
+
+    errors = []
+    rows = []
+    for body in bodies:
+        if body.email in taken_emails:
+            errors.append(f"Contact with email {body.email} already exists")
+        elif body.phone in taken_phones:
+            errors.append(f"Contact with phone {body.phone} already exists")
+        else:
+            errors.append(None)
+            taken_emails.add(body.email)
+            taken_phones.add(body.phone)
+            rows.append(dict(first_name=body.first_name, last_name=body.last_name, email=body.email,
+                             phone=body.phone, birthday=body.birthday, birthday_doy=day_of_year(body.birthday),
+                             user_id=user.id))
+    if not rows:
+        return errors
+
+    try:
+        async with db.begin_nested():
+            await db.execute(insert(Contact), rows)
+    except IntegrityError:
+        # a concurrent writer took some of the emails or phones, fall back to one savepoint per row
+        row_errors = []
+        for row in rows:
+            try:
+                async with db.begin_nested():
+                    await db.execute(insert(Contact).values(**row))
+                row_errors.append(None)
+            except IntegrityError:
+                row_errors.append(f"Contact with email {row['email']} or phone {row['phone']} already exists")
+        row_errors = iter(row_errors)
+        errors = [error if error else next(row_errors) for error in errors]
+    await db.commit()
+    await contacts_cache.bump(user.id)
+    return errors
+
+
+async def _write_one(stmt, user: User, db: AsyncSession) -> Row | None:
+    # the WHERE clause matches the contact only for its owner, RETURNING hands back the response columns,
+    # so one round trip does what a SELECT, an ORM flush and a refresh did
+    stmt = stmt.filter(Contact.user_id == user.id).returning(*CONTACT_RESPONSE_COLUMNS)\
+        .execution_options(synchronize_session=False)
+    result = await db.execute(stmt)
+    contact = result.first()
+    if contact:
+        await db.commit()
+        await contacts_cache.bump(user.id)
+    return contact
+
+
+async def remove_contact(contact_id: int, user: User, db: AsyncSession) -> Row | None:
     """
     Removes a single contact with the specified ID for a specific user.
 
@@ -98,17 +357,14 @@ async def remove_contact(contact_id: int, user: User, db: Session) -> Contact |
     :param user: The user to remove the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
-    :return: The removed contact, or Contact if it does not exist.
-    :rtype: Contact | None
+    :type db: AsyncSession
+    :return: The removed contact, or None if it does not exist.
+    :rtype: Row | None
     """
-    contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
-    if contact:
-        db.delete(contact)
-        db.commit()
-    return contact
+    return await _write_one(delete(Contact).filter(Contact.id == contact_id), user, db)
 
-async def update_contact(contact_id: int, body: ContactUpdate, user: User, db: Session) -> Contact | None:
+
+async def update_contact(contact_id: int, body: ContactUpdate, user: User, db: AsyncSession) -> Row | None:
     """
     Updates a single contact with the specified ID for a specific user.
 
@@ -119,23 +375,17 @@ async def update_contact(contact_id: int, body: ContactUpdate, user: User, db: S
     :param user: The user to update the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The updated contact, or None if it does not exist.
-    :rtype: Contact | None
+    :rtype: Row | None
     """
-    contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
-    if contact:
-        contact.first_name=body.first_name,
-        contact.last_name=body.last_name,
-        contact.email=body.email,
-        contact.phone=body.phone, 
-        contact.birthday=body.birthday
-        contact.done=body.done
-        db.commit()
-    return contact
+    stmt = update(Contact).filter(Contact.id == contact_id)\
+        .values(first_name=body.first_name, last_name=body.last_name, email=body.email, phone=body.phone,
+                birthday=body.birthday, birthday_doy=day_of_year(body.birthday), done=body.done)
+    return await _write_one(stmt, user, db)
 
 
-async def update_status_contact(contact_id: int, body: ContactStatusUpdate, user: User, db: Session) -> Contact | None:
+async def update_status_contact(contact_id: int, body: ContactStatusUpdate, user: User, db: AsyncSession) -> Row | None:
     """
     Updates the status (i.e. "done" or "not done") of a single contact with the specified ID for a specific user.
 
@@ -146,12 +396,8 @@ async def update_status_contact(contact_id: int, body: ContactStatusUpdate, user
     :param user: The user to update the contact for.
     :type user: User
     :param db: The database session.
-    :type db: Session
+    :type db: AsyncSession
     :return: The updated contact, or None if it does not exist.
-    :rtype: Contact | None
+    :rtype: Row | None
     """
-    contact = db.query(Contact).filter(Contact.id == contact_id, Contact.user_id == user.id).first()
-    if contact:
-        contact.done = body.done
-        db.commit()
-    return contact
+    return await _write_one(update(Contact).filter(Contact.id == contact_id).values(done=body.done), user, db)
@@ -1,12 +1,19 @@
+from datetime import date
 from typing import List
-from fastapi import APIRouter, HTTPException, Depends, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.db import get_db
-from src.schemas import ContactModel, ContactUpdate, ContactStatusUpdate, ContactResponse
+from src.database.shards import ensure_contacts_writable, get_contacts_db, get_contacts_read_db
+from src.schemas import ContactModel, ContactUpdate, ContactStatusUpdate, ContactResponse, ContactImportResponse
 from src.repository import contacts as repository_contacts
 from src.database.models import User
 from src.services.auth import auth_service
-from fastapi_limiter.depends import RateLimiter
+from src.services.pagination import decode_cursor, next_cursor
+from src.services import contacts_import, contacts_export
+from src.services.cache import birthday_digest, contacts_cache
+from src.conf.config import settings
+from src.services.rate_limit import RateLimit
 
 
 router = APIRouter(prefix='/contacts')
@@ -14,40 +21,97 @@ router = APIRouter(prefix='/contacts')
 
 '''@router.post("/", response_model=ContactResponse, status_code=status.HTTP_201_CREATED, description='No more than 10 requests per minute',
             dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def create_contact(body: ContactModel, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def create_contact(body: ContactModel, db: AsyncSession = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
     return await repository_contacts.create_contact(body, current_user, db)'''
 
 
 @router.post("/", response_model=ContactResponse, status_code=status.HTTP_201_CREATED)
-async def create_contact(body: ContactModel, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def create_contact(body: ContactModel, db: AsyncSession = Depends(get_contacts_db), current_user: User = Depends(auth_service.get_current_user)):
     return await repository_contacts.create_contact(body, current_user, db)
 
 
-@router.get("/", response_model=List[ContactResponse], description='No more than 10 requests per minute',
-            dependencies=[Depends(RateLimiter(times=10, seconds=60))])
-async def read_contacts(skip: int = 0, limit: int = 100, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
-    contacts = await repository_contacts.get_contacts(skip, limit, current_user, db)
-    return contacts
+@router.post("/import", response_model=ContactImportResponse,
+             description='Streams a CSV file with a header row or an NDJSON file in the request body')
+async def import_contacts(request: Request, format: str = Query("csv", regex="^(csv|ndjson)$"),
+                          db: AsyncSession = Depends(get_contacts_db), primary_db: AsyncSession = Depends(get_db),
+                          current_user: User = Depends(auth_service.get_current_user)):
+    # an import can outlast the grace period of a rebalance, every batch checks the lock again
+    return await contacts_import.import_contacts(request.stream(), format, current_user, db,
+                                                 check=lambda: ensure_contacts_writable(current_user, primary_db))
+
+
+@router.get("/export", response_class=StreamingResponse,
+            description='Streams all contacts of the current user as NDJSON or CSV')
+async def export_contacts(format: str = Query("ndjson", regex="^(csv|ndjson)$"),
+                          db: AsyncSession = Depends(get_contacts_read_db), current_user: User = Depends(auth_service.get_current_user)):
+    rows = repository_contacts.stream_contacts(current_user, db)
+    return StreamingResponse(contacts_export.export_contacts(rows, format),
+                             media_type=contacts_export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="contacts.{format}"'})
+
+
+@router.get("/", response_model=List[ContactResponse],
+            description='Rate limited per client, 10 requests per minute by default. Pass the X-Next-Cursor '
+                        'response header back as `cursor` to fetch the next page. Send the ETag back in '
+                        'If-None-Match to get 304 while the contacts are unchanged.',
+            dependencies=[Depends(RateLimit("read_contacts"))])
+async def read_contacts(request: Request, skip: int = 0, limit: int = 100, cursor: str | None = None,
+                        db: AsyncSession = Depends(get_contacts_read_db), current_user: User = Depends(auth_service.get_current_user)):
+    after_id = None
+    if cursor is not None:
+        try:
+            after_id = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    async def load():
+        if settings.contacts_fast_json:
+            contacts = await repository_contacts.get_contact_rows(skip, limit, current_user, db, after_id=after_id)
+            body = contacts_export.render_contact_rows(contacts)
+        else:
+            contacts = await repository_contacts.get_contacts(skip, limit, current_user, db, after_id=after_id)
+            body = contacts_export.render_contacts(contacts)
+        headers = {}
+        next_page = next_cursor(contacts, limit)
+        if next_page:
+            headers["X-Next-Cursor"] = next_page
+        return body, headers
+
+    view = f"list:{limit}:{after_id}" if after_id is not None else f"list:{limit}:skip={skip}"
+    return await contacts_cache.response(request, current_user.id, view, load)
 
 
 @router.get("/contact", response_model=List[ContactResponse])
-async def read_contact(first_name: str | None = None, last_name: str | None = None, email: str | None = None, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def read_contact(first_name: str | None = None, last_name: str | None = None, email: str | None = None, db: AsyncSession = Depends(get_contacts_read_db), current_user: User = Depends(auth_service.get_current_user)):
     contact = await repository_contacts.get_contact(first_name, last_name, email, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
     return contact
 
 
-@router.get("/birthday", response_model=List[ContactResponse])
-async def read_contact_by_birthday(db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
-    contact = await repository_contacts.get_contact_by_birthday(current_user, db)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
-    return contact    
+@router.get("/search", response_model=List[ContactResponse],
+            description='Case-insensitive prefix search over first name, last name, email and phone')
+async def search_contacts(q: str = Query(min_length=1, max_length=100), limit: int = Query(20, ge=1, le=100),
+                          db: AsyncSession = Depends(get_contacts_read_db), current_user: User = Depends(auth_service.get_current_user)):
+    return await repository_contacts.search_contacts(q, limit, current_user, db)
+
+
+@router.get("/birthday", response_model=List[ContactResponse],
+            description='Send the ETag back in If-None-Match to get 304 while the list is unchanged.')
+async def read_contact_by_birthday(request: Request, db: AsyncSession = Depends(get_contacts_read_db),
+                                   current_user: User = Depends(auth_service.get_current_user)):
+    today = date.today()
+
+    async def load():
+        contacts = await repository_contacts.get_contact_by_birthday(current_user, db, today)
+        return contacts_export.render_contacts(contacts)
+
+    # precomputed every day by python -m src.services.birthdays
+    return await birthday_digest.response(request, current_user.id, today, load)
 
 
 @router.put("/{contact_id}", response_model=ContactResponse)
-async def update_contact(body: ContactUpdate, contact_id: int, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def update_contact(body: ContactUpdate, contact_id: int, db: AsyncSession = Depends(get_contacts_db), current_user: User = Depends(auth_service.get_current_user)):
     contact = await repository_contacts.update_contact(contact_id, body, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
@@ -55,7 +119,7 @@ async def update_contact(body: ContactUpdate, contact_id: int, db: Session = Dep
 
 
 @router.patch("/{contact_id}", response_model=ContactResponse)
-async def update_status_contact(body: ContactStatusUpdate, contact_id: int, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def update_status_contact(body: ContactStatusUpdate, contact_id: int, db: AsyncSession = Depends(get_contacts_db), current_user: User = Depends(auth_service.get_current_user)):
     contact = await repository_contacts.update_status_contact(contact_id, body, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
@@ -63,7 +127,7 @@ async def update_status_contact(body: ContactStatusUpdate, contact_id: int, db:
 
 
 @router.delete("/{contact_id}", response_model=ContactResponse)
-async def remove_contact(contact_id: int, db: Session = Depends(get_db), current_user: User = Depends(auth_service.get_current_user)):
+async def remove_contact(contact_id: int, db: AsyncSession = Depends(get_contacts_db), current_user: User = Depends(auth_service.get_current_user)):
     contact = await repository_contacts.remove_contact(contact_id, current_user, db)
     if contact is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Contact not found")
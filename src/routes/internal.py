@@ -0,0 +1,47 @@
+import hmac
+
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+from src.conf.config import settings
+from src.database.db import pool_stats, replicas
+from src.database.shards import shard_router
+from src.services.cache import user_cache, contacts_cache, birthday_digest
+from src.services.hashing import password_hasher
+from src.services.email import email_dispatcher
+from src.services.rate_limit import rate_limiter
+from src.services.tokens import refresh_tokens
+
+
+bearer = HTTPBearer(auto_error=False)
+
+
+async def require_internal_token(credentials: HTTPAuthorizationCredentials | None = Depends(bearer)) -> None:
+    """
+    Lets through requests carrying ``settings.internal_token``, the stats name databases and count every user.
+    """
+    if not settings.internal_token:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND)
+    if credentials is None or not hmac.compare_digest(credentials.credentials.encode(),
+                                                      settings.internal_token.encode()):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid internal token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+router = APIRouter(prefix='/internal', include_in_schema=False, dependencies=[Depends(require_internal_token)])
+
+
+@router.get("/stats")
+async def read_stats():
+    return {
+        "db_pool": pool_stats.stats(),
+        "db_replicas": replicas.stats(),
+        "contacts_shards": shard_router.stats(),
+        "user_cache": user_cache.stats(),
+        "contacts_cache": contacts_cache.stats(),
+        "birthday_digest": {**birthday_digest.stats(), "last_run": await birthday_digest.last_run()},
+        "password_hasher": password_hasher.stats(),
+        "email": email_dispatcher.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "refresh_tokens": refresh_tokens.stats(),
+    }
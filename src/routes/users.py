@@ -1,13 +1,8 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File
-from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, UploadFile, File
 
-from src.database.db import get_db
 from src.database.models import User
-from src.repository import users as repository_users
 from src.services.auth import auth_service
-from src.conf.config import settings
+from src.services.avatar import prepare_avatar, upload_avatar
 from src.schemas import UserDb
 
 router = APIRouter(prefix="/users")
@@ -18,18 +13,13 @@ async def read_users_me(current_user: User = Depends(auth_service.get_current_us
     return current_user
 
 
-@router.patch('/avatar', response_model=UserDb)
-async def update_avatar_user(file: UploadFile = File(), current_user: User = Depends(auth_service.get_current_user),
-                             db: Session = Depends(get_db)):
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-
-    cloudinary.uploader.upload(file.file, public_id=f'ContactsApp/{current_user.username}', overwrite=True)
-    src_url = cloudinary.CloudinaryImage(f'ContactsApp/{current_user.username}')\
-                        .build_url(width=250, height=250, crop='fill')
-    user = await repository_users.update_avatar(current_user.email, src_url, db)
-    return user
+@router.patch('/avatar', response_model=UserDb, status_code=status.HTTP_202_ACCEPTED,
+              description='The avatar is resized and uploaded in the background, the new URL shows up in /users/me/')
+async def update_avatar_user(background_tasks: BackgroundTasks, file: UploadFile = File(),
+                             current_user: User = Depends(auth_service.get_current_user)):
+    try:
+        data = await prepare_avatar(await file.read())
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Avatar must be an image")
+    background_tasks.add_task(upload_avatar, current_user.email, current_user.id, data)
+    return current_user
@@ -1,4 +1,5 @@
 from datetime import datetime, date
+from typing import List
 from pydantic import BaseModel, Field, EmailStr
 
 
@@ -25,6 +26,18 @@ class ContactResponse(ContactModel):
         orm_mode = True
 
 
+class ContactImportError(BaseModel):
+    line: int
+    detail: str
+
+
+class ContactImportResponse(BaseModel):
+    imported: int
+    error_count: int
+    # the first settings.import_max_errors of them
+    errors: List[ContactImportError]
+
+
 class UserModel(BaseModel):
     username: str = Field(min_length=1, max_length=30)
     email: EmailStr
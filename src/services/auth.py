@@ -2,28 +2,28 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.db import get_db
 from src.repository import users as repository_users
+from src.services.cache import user_cache
+from src.services.hashing import password_hasher
 from src.conf.config import settings
-import redis.asyncio as redis
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    hasher = password_hasher
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
-    r = redis.Redis(host=settings.redis_host, port=settings.redis_port, db=0)
+    r = user_cache.r
 
-    def verify_password(self, plain_password, hashed_password):
-        return self.pwd_context.verify(plain_password, hashed_password)
+    async def verify_password(self, plain_password, hashed_password):
+        return await self.hasher.verify(plain_password, hashed_password)
 
 
-    def get_password_hash(self, password: str):
-        return self.pwd_context.hash(password)
+    async def get_password_hash(self, password: str):
+        return await self.hasher.hash(password)
 
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
@@ -48,18 +48,22 @@ class Auth:
         return encoded_refresh_token
 
 
-    async def decode_refresh_token(self, refresh_token: str):
+    async def decode_refresh_claims(self, refresh_token: str) -> dict:
         try:
             payload = jwt.decode(refresh_token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
             if payload['scope'] == 'refresh_token':
-                email = payload['sub']
-                return email
+                return payload
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Invalid scope for token')
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail='Could not validate credentials')
 
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    async def decode_refresh_token(self, refresh_token: str):
+        payload = await self.decode_refresh_claims(refresh_token)
+        return payload['sub']
+
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
         credentials_exception = HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -76,12 +80,21 @@ class Auth:
         except JWTError as e:
             raise credentials_exception
 
-        user = await repository_users.get_user_by_email(email, db)
+        user = await self.get_user(email, db)
         if user is None:
             raise credentials_exception
         return user
 
 
+    async def get_user(self, email: str, db: AsyncSession):
+        user = await user_cache.get(email)
+        if user is None:
+            user = await repository_users.get_user_by_email(email, db)
+            if user is not None:
+                await user_cache.set(user)
+        return user
+
+
     def create_email_token(self, data: dict):
         to_encode = data.copy()
         expire = datetime.utcnow() + timedelta(days=7)
@@ -0,0 +1,43 @@
+import io
+
+from fastapi.concurrency import run_in_threadpool
+from PIL import Image, ImageOps
+
+from src.conf.config import settings
+from src.database.db import AsyncSessionLocal
+from src.repository import users as repository_users
+from src.services.storage import get_storage
+
+
+def make_thumbnail(data: bytes, size: int) -> bytes:
+    """
+    Crops and resizes an image to a ``size`` x ``size`` JPEG.
+
+    Raises ``ValueError`` if the data is not an image, nothing else is stored as an avatar.
+    """
+    # Pillow decodes lazily, a truncated or corrupt file only fails once the pixels are read
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+        thumbnail = ImageOps.fit(image.convert('RGB'), (size, size), Image.LANCZOS)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, format='JPEG', quality=85, optimize=True)
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError("Not an image") from e
+    return buffer.getvalue()
+
+
+async def prepare_avatar(data: bytes) -> bytes:
+    return await run_in_threadpool(make_thumbnail, data, settings.avatar_size)
+
+
+async def upload_avatar(email: str, user_id: int, data: bytes) -> str | None:
+    # keyed on the id: usernames are neither unique nor safe in a path
+    try:
+        url = await run_in_threadpool(get_storage().upload, data, f'ContactsApp/{user_id}')
+    except Exception as e:
+        print(e)
+        return None
+    async with AsyncSessionLocal() as db:
+        await repository_users.update_avatar(email, url, db)
+    return url
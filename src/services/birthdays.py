@@ -0,0 +1,142 @@
+"""
+Precomputes the upcoming birthdays of every user into the birthday digest that ``/contacts/birthday`` serves.
+
+Run it once a day from cron, or keep it running as a worker that rebuilds the digest every day at
+``settings.birthday_digest_at``::
+
+    python -m src.services.birthdays
+    python -m src.services.birthdays --date 2024-01-01
+    python -m src.services.birthdays --daemon --at 00:05
+
+Every run prints how long it took and leaves the numbers in Redis for ``/api/internal/stats``.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import date, datetime, timedelta
+from typing import Callable, List, Tuple
+
+from sqlalchemy import select
+
+from src.conf.config import settings
+from src.database.db import async_engine
+from src.database.models import User
+from src.database.shards import ShardRouter, shard_router
+from src.repository.contacts import stream_upcoming_birthdays
+from src.services.cache import BirthdayDigest, birthday_digest, close_redis
+from src.services.contacts_export import render_contact_rows
+
+
+async def build_digest(day: date, digest: BirthdayDigest = birthday_digest, router: ShardRouter = shard_router,
+                       batch_size: int = 1000) -> dict:
+    """
+    Stores the birthdays of the seven days from ``day`` for every user, an empty list for users without any.
+
+    The contacts versions are read first and the contacts from the primary databases, not the replicas, so a
+    list is only stored when no write happened after it was read. Users created during the run are left to
+    their first request.
+
+    :return: The numbers of the run.
+    """
+    started = time.perf_counter()
+    async with async_engine.connect() as conn:
+        user_ids = (await conn.execute(select(User.id).order_by(User.id))).scalars().all()
+    versions = {}
+    for i in range(0, len(user_ids), batch_size):
+        chunk = user_ids[i:i + batch_size]
+        versions.update(zip(chunk, await digest.versions(chunk)))
+
+    pending: List[Tuple[int, str, bytes]] = []
+    stored = contacts = 0
+
+    async def add(user_id: int, rows: list) -> None:
+        nonlocal stored
+        if user_id in versions:
+            pending.append((user_id, versions.pop(user_id), render_contact_rows(rows)))
+        if len(pending) >= batch_size:
+            stored += await digest.store(day, pending)
+            pending.clear()
+
+    for name in router.names:
+        async with router.engine(name).connect() as conn:
+            current, rows = None, []
+            async for row in stream_upcoming_birthdays(day, conn, batch_size):
+                if row.user_id != current:
+                    if current is not None:
+                        await add(current, rows)
+                    current, rows = row.user_id, []
+                rows.append(row[1:])
+                contacts += 1
+            if current is not None:
+                await add(current, rows)
+    for user_id in list(versions):
+        await add(user_id, [])
+    stored += await digest.store(day, pending)
+
+    run = {
+        "day": day.isoformat(),
+        "users": len(user_ids),
+        "contacts": contacts,
+        "stored": stored,
+        "seconds": round(time.perf_counter() - started, 3),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    await digest.record_run(run)
+    return run
+
+
+def next_run(now: datetime, at: str) -> datetime:
+    hour, minute = map(int, at.split(":"))
+    run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    return run if run > now else run + timedelta(days=1)
+
+
+def describe(run: dict) -> str:
+    return (f"Birthday digest for {run['day']}: {run['stored']} of {run['users']} users stored, "
+            f"{run['contacts']} contacts, in {run['seconds']:.3f} s")
+
+
+async def run_daily(at: str, batch_size: int, log: Callable[[str], None] = print) -> None:
+    # the first run builds the digest of today right away, a restarted worker does not wait a day for it
+    while True:
+        try:
+            log(describe(await build_digest(date.today(), batch_size=batch_size)))
+        except Exception as e:
+            # requests rebuild what is missing, the next run tries again
+            log(f"Birthday digest failed: {e!r}")
+        now = datetime.now()
+        await asyncio.sleep((next_run(now, at) - now).total_seconds())
+
+
+async def run(args, log: Callable[[str], None] = print) -> int:
+    try:
+        if args.daemon:
+            await run_daily(args.at, args.batch_size, log)
+        else:
+            log(describe(await build_digest(args.date or date.today(), batch_size=args.batch_size)))
+    finally:
+        await close_redis()
+        await shard_router.dispose()
+        await async_engine.dispose()
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.services.birthdays", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--date", type=date.fromisoformat, help="day to build the digest for, today by default")
+    parser.add_argument("--daemon", action="store_true", help="keep running and rebuild the digest every day")
+    parser.add_argument("--at", default=settings.birthday_digest_at, help="HH:MM of the daily run of --daemon")
+    parser.add_argument("--batch-size", type=int, default=1000, help="users per Redis round trip")
+    args = parser.parse_args(argv)
+    if args.daemon and args.date:
+        parser.error("--date builds a single digest, it cannot be combined with --daemon")
+    try:
+        datetime.strptime(args.at, "%H:%M")
+    except ValueError:
+        parser.error(f"--at must be HH:MM, not {args.at}")
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
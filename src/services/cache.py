@@ -0,0 +1,400 @@
+import hashlib
+import json
+import time
+from datetime import date, datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+import redis.asyncio as redis
+from fastapi import Request, Response
+
+from src.conf.config import settings
+from src.database.db import read_from_primary
+from src.database.models import User
+from src.services.metrics import InstrumentedRedis
+
+
+class UserCache:
+    """
+    The users the auth path loads on every request, cached as JSON of the columns it needs.
+
+    The password hash and the refresh token are never cached. A cached user is a transient ``User`` that is
+    not attached to any session.
+    """
+
+    # an entry without one of them was written by an older deploy and is treated as a miss
+    FIELDS = ("id", "username", "email", "created_at", "avatar", "confirmed", "contacts_shard", "contacts_locked")
+
+    def __init__(self, r: redis.Redis, ttl: int):
+        self.r = r
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(email: str) -> str:
+        return f"user:{email}"
+
+    @classmethod
+    def dumps(cls, user: User) -> str:
+        data = {field: getattr(user, field) for field in cls.FIELDS}
+        if data["created_at"] is not None:
+            data["created_at"] = data["created_at"].isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def loads(cls, data: bytes) -> User | None:
+        try:
+            fields = json.loads(data)
+        except ValueError:
+            return None
+        if not isinstance(fields, dict) or any(field not in fields for field in cls.FIELDS):
+            return None
+        fields = {field: fields[field] for field in cls.FIELDS}
+        if fields["created_at"] is not None:
+            fields["created_at"] = datetime.fromisoformat(fields["created_at"])
+        return User(**fields)
+
+    async def get(self, email: str) -> User | None:
+        try:
+            data = await self.r.get(self.key(email))
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+            data = None
+        user = self.loads(data) if data is not None else None
+        if user is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return user
+
+    async def set(self, user: User) -> None:
+        try:
+            await self.r.set(self.key(user.email), self.dumps(user), ex=self.ttl)
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+
+    async def invalidate(self, *emails: str) -> None:
+        try:
+            await self.r.delete(*map(self.key, emails))
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ContactsCache:
+    """
+    Per-user version of the contacts, plus serialized list responses stored under that version.
+
+    Every write bumps the version, so the ETags and bodies of older versions stop matching and expire on their own.
+    """
+
+    def __init__(self, r: redis.Redis, ttl: int, version_ttl: int, stickiness: int = 0,
+                 digest: "BirthdayDigest | None" = None):
+        self.r = r
+        self.ttl = ttl
+        # bounds how long a bump lost to a Redis outage can keep serving stale responses
+        self.version_ttl = version_ttl
+        # seconds after a write during which the user's lists are read from the primary, not a lagging replica
+        self.stickiness = stickiness
+        # precomputed responses that a write makes stale
+        self.digest = digest
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.errors = 0
+
+    @staticmethod
+    def version_key(user_id: int) -> str:
+        return f"contacts:version:{user_id}"
+
+    @staticmethod
+    def written_key(user_id: int) -> str:
+        return f"contacts:written:{user_id}"
+
+    @staticmethod
+    def body_key(user_id: int, version: int, view: str) -> str:
+        return f"contacts:body:{user_id}:{version}:{view}"
+
+    @staticmethod
+    def etag(user_id: int, version: int, view: str) -> str:
+        digest = hashlib.sha1(f"{user_id}:{view}".encode()).hexdigest()[:16]
+        return f'W/"{version}-{digest}"'
+
+    async def version(self, user_id: int) -> int | None:
+        # a body cached from a replica that has not seen the last write yet would be stale for the whole ttl,
+        # so right after a write the request reads from the primary
+        key = self.version_key(user_id)
+        try:
+            value, written = await self.r.mget(key, self.written_key(user_id))
+            if written is not None:
+                read_from_primary.set(True)
+            if value is None:
+                # start from the clock, so a version lost with Redis data is never reused
+                await self.r.set(key, time.time_ns(), nx=True, ex=self.version_ttl)
+                value = await self.r.get(key)
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+            return None
+        return int(value) if value is not None else None
+
+    async def bump(self, user_id: int) -> None:
+        key = self.version_key(user_id)
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                pipe.incr(key).expire(key, self.version_ttl)
+                if self.stickiness:
+                    pipe.set(self.written_key(user_id), 1, ex=self.stickiness)
+                if self.digest is not None:
+                    self.digest.discard(pipe, user_id)
+                await pipe.execute()
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+
+    async def get_body(self, user_id: int, version: int, view: str) -> Tuple[bytes, dict] | None:
+        try:
+            data = await self.r.get(self.body_key(user_id, version, view))
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+            data = None
+        cached = None
+        if data is not None:
+            # a line of JSON headers, then the body as it was sent
+            headers, _, body = data.partition(b"\n")
+            try:
+                cached = body, json.loads(headers)
+            except ValueError:
+                pass  # written by an older deploy
+        if cached is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return cached
+
+    async def set_body(self, user_id: int, version: int, view: str, body: bytes, headers: dict) -> None:
+        try:
+            await self.r.set(self.body_key(user_id, version, view), json.dumps(headers).encode() + b"\n" + body,
+                             ex=self.ttl)
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+
+    async def response(self, request: Request, user_id: int, view: str,
+                       load: Callable[[], Awaitable[Tuple[bytes, dict]]]) -> Response:
+        """
+        Answers a contacts list request with 304 when the client's ETag is current, with the cached body
+        when there is one, and otherwise with the body built by ``load``, which is then cached.
+
+        Without Redis every request goes to ``load`` and no ETag is sent.
+        """
+        version = await self.version(user_id)
+        if version is None:
+            body, headers = await load()
+            return Response(body, media_type="application/json", headers=headers)
+        etag = self.etag(user_id, version, view)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+        if_none_match = {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}
+        if etag in if_none_match or "*" in if_none_match:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        cached = await self.get_body(user_id, version, view)
+        if cached is None:
+            cached = await load()
+            await self.set_body(user_id, version, view, *cached)
+        body, extra_headers = cached
+        return Response(body, media_type="application/json", headers={**extra_headers, **headers})
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "errors": self.errors,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+# sets a field only while the user's contacts version is still the one read before the contacts were queried,
+# a write that committed in between bumped it and its deletion of the field must not be undone
+STORE_SCRIPT = """
+local stored = 0
+for i = 2, #KEYS do
+    local at = (i - 2) * 3 + 2
+    if (redis.call('GET', KEYS[i]) or '') == ARGV[at + 1] then
+        redis.call('HSET', KEYS[1], ARGV[at], ARGV[at + 2])
+        stored = stored + 1
+    end
+end
+redis.call('EXPIRE', KEYS[1], ARGV[1])
+return stored
+"""
+
+
+class BirthdayDigest:
+    """
+    Upcoming birthdays of every user, precomputed once a day.
+
+    Each day is a Redis hash of rendered ``/contacts/birthday`` responses by user id, filled by
+    ``python -m src.services.birthdays``, so a request is a single HGET. A contacts write deletes the
+    user's field of today and tomorrow, and the next request rebuilds it from the database.
+    """
+
+    def __init__(self, r: redis.Redis, ttl: int):
+        self.r = r
+        self.ttl = ttl
+        self.store_script = r.register_script(STORE_SCRIPT)
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.stored = 0
+        self.errors = 0
+
+    @staticmethod
+    def key(day: date) -> str:
+        return f"birthdays:{day.isoformat()}"
+
+    @staticmethod
+    def last_run_key() -> str:
+        return "birthdays:last_run"
+
+    @staticmethod
+    def etag(body: bytes) -> str:
+        return f'W/"{hashlib.sha1(body).hexdigest()[:16]}"'
+
+    def discard(self, pipe, user_id: int) -> None:
+        # tomorrow too, the job may already have run for it
+        today = date.today()
+        pipe.hdel(self.key(today), user_id).hdel(self.key(today + timedelta(days=1)), user_id)
+
+    async def versions(self, user_ids: List[int]) -> List[str]:
+        """
+        The contacts versions to pass to :meth:`store`, read before the contacts are queried.
+        """
+        values = await self.r.mget(*map(ContactsCache.version_key, user_ids))
+        return [value.decode() if value is not None else "" for value in values]
+
+    async def store(self, day: date, entries: List[Tuple[int, str, bytes]]) -> int:
+        """
+        Stores ``(user id, version, body)`` entries, skipping the users written to since their version was read.
+
+        :return: The number of entries stored.
+        """
+        if not entries:
+            return 0
+        keys = [self.key(day), *(ContactsCache.version_key(user_id) for user_id, _, _ in entries)]
+        args = [self.ttl]
+        for user_id, version, body in entries:
+            args += [user_id, version, body]
+        stored = await self.store_script(keys=keys, args=args)
+        self.stored += stored
+        return stored
+
+    async def get(self, user_id: int, day: date) -> bytes | None:
+        try:
+            body = await self.r.hget(self.key(day), user_id)
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+            body = None
+        if body is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return body
+
+    async def rebuild(self, user_id: int, day: date, load: Callable[[], Awaitable[bytes]]) -> bytes:
+        try:
+            version, written = await self.r.mget(ContactsCache.version_key(user_id),
+                                                 ContactsCache.written_key(user_id))
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+            return await load()
+        if written is not None:
+            # a replica that has not seen the last write yet would store a stale list for the whole day
+            read_from_primary.set(True)
+        body = await load()
+        try:
+            await self.store(day, [(user_id, version.decode() if version is not None else "", body)])
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+        return body
+
+    async def response(self, request: Request, user_id: int, day: date,
+                       load: Callable[[], Awaitable[bytes]]) -> Response:
+        """
+        Answers with the precomputed list of the day, rebuilt with ``load`` when there is none.
+
+        The ETag is a hash of the body, so it changes only when the list does.
+        """
+        body = await self.get(user_id, day)
+        if body is None:
+            body = await self.rebuild(user_id, day, load)
+        etag = self.etag(body)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+        if_none_match = {tag.strip() for tag in request.headers.get("if-none-match", "").split(",")}
+        if etag in if_none_match or "*" in if_none_match:
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type="application/json", headers=headers)
+
+    async def record_run(self, run: Dict[str, str | int | float]) -> None:
+        await self.r.hset(self.last_run_key(), mapping=run)
+
+    async def last_run(self) -> dict | None:
+        try:
+            run = await self.r.hgetall(self.last_run_key())
+        except redis.RedisError as e:
+            print(e)
+            self.errors += 1
+            return None
+        return {key.decode(): value.decode() for key, value in run.items()} or None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+            "stored": self.stored,
+            "errors": self.errors,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+r = InstrumentedRedis(host=settings.redis_host, port=settings.redis_port, db=0,
+                     socket_timeout=settings.redis_socket_timeout,
+                     socket_connect_timeout=settings.redis_socket_timeout)
+user_cache = UserCache(r, ttl=settings.user_cache_ttl)
+birthday_digest = BirthdayDigest(r, ttl=settings.birthday_digest_ttl)
+contacts_cache = ContactsCache(r, ttl=settings.contacts_cache_ttl, version_ttl=settings.contacts_version_ttl,
+                               stickiness=settings.db_replica_stickiness if settings.sqlalchemy_replica_urls else 0,
+                               digest=birthday_digest)
+
+
+async def init_redis() -> None:
+    # connections are opened on first use in the worker's event loop, none are kept from a parent process
+    r.connection_pool.reset()
+
+
+async def close_redis() -> None:
+    await r.close(close_connection_pool=True)
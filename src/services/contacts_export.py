@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+from datetime import date
+from typing import AsyncIterator, List
+
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy.engine import Row
+
+from src.database.models import Contact
+from src.schemas import ContactResponse
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, without it the fast path falls back to the stdlib encoder
+    orjson = None
+
+
+CHUNK_ROWS = 200
+CONTACT_FIELDS = tuple(ContactResponse.__fields__)
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+async def export_ndjson(rows: AsyncIterator[Row]) -> AsyncIterator[str]:
+    lines = []
+    async for row in rows:
+        lines.append(ContactResponse.from_orm(row).json() + "\n")
+        if len(lines) >= CHUNK_ROWS:
+            yield "".join(lines)
+            lines.clear()
+    if lines:
+        yield "".join(lines)
+
+
+async def export_csv(rows: AsyncIterator[Row]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    fields = list(ContactResponse.__fields__)
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    count = 0
+    async for row in rows:
+        contact = ContactResponse.from_orm(row)
+        writer.writerow({field: value.isoformat() if hasattr(value, "isoformat") else value
+                         for field, value in contact.dict().items()})
+        count += 1
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def export_contacts(rows: AsyncIterator[Row], fmt: str) -> AsyncIterator[str]:
+    if fmt == "csv":
+        return export_csv(rows)
+    return export_ndjson(rows)
+
+
+def render_contacts(contacts: List[Contact]) -> bytes:
+    # same JSON as the List[ContactResponse] response model, rendered once so it can be cached
+    content = jsonable_encoder([ContactResponse.from_orm(contact) for contact in contacts])
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _isoformat(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def render_contact_rows(rows: List[Row]) -> bytes:
+    """
+    Renders rows selected with ``CONTACT_RESPONSE_COLUMNS`` as the same JSON as :func:`render_contacts`,
+    without building and validating a ``ContactResponse`` for every row.
+    """
+    items = [dict(zip(CONTACT_FIELDS, row)) for row in rows]
+    if orjson is not None:
+        return orjson.dumps(items)
+    return json.dumps(items, default=_isoformat, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
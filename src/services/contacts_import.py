@@ -0,0 +1,156 @@
+import codecs
+import csv
+import json
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.conf.config import settings
+from src.database.models import User
+from src.repository import contacts as repository_contacts
+from src.schemas import ContactModel
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    tail = ""
+    number = 0
+    async for chunk in chunks:
+        lines = (tail + decoder.decode(chunk)).split("\n")
+        tail = lines.pop()
+        for line in lines:
+            number += 1
+            yield number, line.rstrip("\r")
+    tail += decoder.decode(b"", final=True)
+    if tail:
+        yield number + 1, tail.rstrip("\r")
+
+
+class LineFeed:
+    """
+    Lines for a ``csv.reader`` that outlives the iteration: it stops when the lines run out and carries on
+    after more are appended, so a quoted field keeps its newlines across lines.
+    """
+
+    def __init__(self):
+        self.lines = deque()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+
+def in_quoted_field(line: str, quoted: bool = False) -> bool:
+    """
+    Whether a CSV record continues on the next line, following the quoting of the default ``csv`` dialect:
+    only a field that starts with a quote is quoted, and a doubled quote inside it is a literal one.
+    """
+    if '"' not in line:
+        return quoted
+    field_start, closing = not quoted, False
+    for c in line:
+        if quoted:
+            if closing:
+                closing = False
+                if c != '"':
+                    quoted = False
+                    field_start = c == ","
+            elif c == '"':
+                closing = True
+        elif c == '"' and field_start:
+            quoted = True
+        else:
+            field_start = c == ","
+    return quoted and not closing
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Tuple[int, dict | str]]:
+    header = None
+    feed = LineFeed()
+    reader = csv.reader(feed)
+    # line the pending CSV record starts on, and whether it ended inside a quoted field
+    start, quoted = 0, False
+    async for number, line in iter_lines(chunks):
+        if not quoted and not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, f"Invalid JSON: {e}"
+                continue
+            yield number, record if isinstance(record, dict) else "Expected a JSON object"
+            continue
+        if not quoted:
+            start = number
+        feed.lines.append(line + "\n")
+        quoted = in_quoted_field(line, quoted)
+        if quoted:
+            continue
+        values = next(reader)
+        if header is None:
+            header = [name.strip() for name in values]
+        elif len(values) != len(header):
+            yield start, f"Expected {len(header)} columns, got {len(values)}"
+        else:
+            yield start, dict(zip(header, values))
+    if quoted:
+        yield start, "Quoted field is not closed"
+
+
+def format_validation_error(err: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in err.errors())
+
+
+async def import_contacts(chunks: AsyncIterator[bytes], fmt: str, user: User, db: AsyncSession,
+                          check: Callable[[], Awaitable[None]] | None = None) -> dict:
+    """
+    Imports the contacts in batches of ``settings.import_batch_size``, awaiting ``check`` before each batch.
+    """
+    imported = 0
+    error_count = 0
+    # only the first settings.import_max_errors errors by line are returned
+    errors = []
+
+    def add_error(number: int, detail: str) -> None:
+        nonlocal error_count
+        error_count += 1
+        errors.append({"line": number, "detail": detail})
+        if len(errors) >= 2 * settings.import_max_errors:
+            errors.sort(key=lambda error: error["line"])
+            del errors[settings.import_max_errors:]
+    batch: List[Tuple[int, ContactModel]] = []
+
+    async def flush():
+        nonlocal imported
+        if check is not None:
+            await check()
+        results = await repository_contacts.create_contacts([body for _, body in batch], user, db)
+        for (number, _), error in zip(batch, results):
+            if error:
+                add_error(number, error)
+            else:
+                imported += 1
+        batch.clear()
+
+    async for number, record in iter_records(chunks, fmt):
+        if isinstance(record, str):
+            add_error(number, record)
+            continue
+        try:
+            batch.append((number, ContactModel(**record)))
+        except ValidationError as err:
+            add_error(number, format_validation_error(err))
+            continue
+        if len(batch) >= settings.import_batch_size:
+            await flush()
+    if batch:
+        await flush()
+    errors.sort(key=lambda error: error["line"])
+    return {"imported": imported, "error_count": error_count, "errors": errors[:settings.import_max_errors]}
@@ -1,36 +1,225 @@
+import asyncio
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from email.utils import formataddr
+from functools import lru_cache
 from pathlib import Path
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+from typing import List
+
+import aiosmtplib
 from pydantic import EmailStr
 from src.services.auth import auth_service
 from src.conf.config import settings
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=settings.mail_username,
-    MAIL_PASSWORD=settings.mail_password,
-    MAIL_FROM=EmailStr(settings.mail_from),
-    MAIL_PORT=settings.mail_port,
-    MAIL_SERVER=settings.mail_server,
-    MAIL_FROM_NAME="Home Work",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+
+# fastapi_mail and jinja2 pull in httpx, dnspython and friends, they are imported when the first email goes out
+@lru_cache
+def get_mail_config():
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=settings.mail_username,
+        MAIL_PASSWORD=settings.mail_password,
+        MAIL_FROM=EmailStr(settings.mail_from),
+        MAIL_PORT=settings.mail_port,
+        MAIL_SERVER=settings.mail_server,
+        MAIL_FROM_NAME="Home Work",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
+    )
+
+
+@lru_cache
+def get_templates():
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+    # jinja2 keeps compiled templates in the environment cache, so each template is parsed once per process
+    return Environment(loader=FileSystemLoader(Path(__file__).parent / 'templates'), autoescape=select_autoescape())
+
+
+@dataclass
+class Email:
+    recipient: str
+    subject: str
+    template_name: str
+    template_body: dict
+    attempts: int = 0
+
+    def render(self) -> EmailMessage:
+        message = EmailMessage()
+        message["Subject"] = self.subject
+        config = get_mail_config()
+        message["From"] = formataddr((config.MAIL_FROM_NAME, config.MAIL_FROM))
+        message["To"] = self.recipient
+        message.set_content(get_templates().get_template(self.template_name).render(**self.template_body), subtype="html")
+        return message
+
+
+class SMTPTransport:
+    """
+    Keeps one SMTP connection open and reuses it for every message, reconnecting after errors.
+    """
+
+    def __init__(self, config=None):
+        self.config = config
+        self.smtp: aiosmtplib.SMTP | None = None
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        if self.smtp is None or not self.smtp.is_connected:
+            self.config = self.config or get_mail_config()
+            self.smtp = aiosmtplib.SMTP(
+                hostname=self.config.MAIL_SERVER,
+                port=self.config.MAIL_PORT,
+                timeout=self.config.TIMEOUT,
+                use_tls=self.config.MAIL_SSL_TLS,
+                start_tls=self.config.MAIL_STARTTLS,
+                validate_certs=self.config.VALIDATE_CERTS,
+            )
+            await self.smtp.connect()
+            if self.config.USE_CREDENTIALS:
+                await self.smtp.login(self.config.MAIL_USERNAME, self.config.MAIL_PASSWORD)
+        return self.smtp
+
+    async def send(self, message: EmailMessage) -> None:
+        smtp = await self.connect()
+        try:
+            await smtp.send_message(message)
+        except (aiosmtplib.SMTPServerDisconnected, OSError):
+            self.smtp = None
+            raise
+
+    async def close(self) -> None:
+        if self.smtp is not None and self.smtp.is_connected:
+            try:
+                await self.smtp.quit()
+            except aiosmtplib.SMTPException:
+                self.smtp.close()
+        self.smtp = None
+
+
+class MemoryTransport:
+    """
+    Local stand-in for the SMTP server: keeps sent messages in ``outbox``.
+    """
+
+    def __init__(self):
+        self.outbox: List[EmailMessage] = []
+
+    async def send(self, message: EmailMessage) -> None:
+        self.outbox.append(message)
+
+    async def close(self) -> None:
+        pass
+
+
+@dataclass
+class EmailDispatcher:
+    connections: int = 1
+    batch_size: int = 20
+    max_retries: int = 5
+    retry_backoff: float = 1.0
+    queue_size: int = 10000
+    backend: str = "smtp"
+    drain_timeout: float = 10.0
+    queue: asyncio.Queue = field(init=False)
+    memory: MemoryTransport = field(init=False, default_factory=MemoryTransport)
+    transports: list = field(init=False, default_factory=list)
+    workers: List[asyncio.Task] = field(init=False, default_factory=list)
+    sent: int = field(init=False, default=0)
+    retried: int = field(init=False, default=0)
+    failed: int = field(init=False, default=0)
+    dropped: int = field(init=False, default=0)
+
+    def __post_init__(self):
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+
+    def make_transport(self):
+        if self.backend == "memory":
+            return self.memory
+        return SMTPTransport()
+
+    def enqueue(self, email: Email) -> None:
+        try:
+            self.queue.put_nowait(email)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"Email queue is full, dropped message to {email.recipient}")
+
+    async def start(self) -> None:
+        for _ in range(self.connections):
+            transport = self.make_transport()
+            self.transports.append(transport)
+            self.workers.append(asyncio.create_task(self._work(transport)))
+
+    async def stop(self) -> None:
+        try:
+            await asyncio.wait_for(self.queue.join(), self.drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"Email queue not drained, {self.queue.qsize()} messages left")
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        for transport in self.transports:
+            await transport.close()
+        self.workers.clear()
+        self.transports.clear()
+
+    async def _work(self, transport) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            for email in batch:
+                try:
+                    await transport.send(email.render())
+                    self.sent += 1
+                except (aiosmtplib.SMTPException, OSError) as err:
+                    self._retry(email, err)
+                except Exception as err:
+                    self.failed += 1
+                    print(f"Cannot send email to {email.recipient}: {err}")
+                finally:
+                    self.queue.task_done()
+
+    def _retry(self, email: Email, err: Exception) -> None:
+        email.attempts += 1
+        if email.attempts > self.max_retries:
+            self.failed += 1
+            print(f"Giving up on email to {email.recipient}: {err}")
+            return
+        self.retried += 1
+        delay = self.retry_backoff * 2 ** (email.attempts - 1)
+        asyncio.get_running_loop().call_later(delay, self.enqueue, email)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend,
+            "queue_depth": self.queue.qsize(),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+email_dispatcher = EmailDispatcher(
+    connections=settings.mail_connections,
+    batch_size=settings.mail_batch_size,
+    max_retries=settings.mail_max_retries,
+    retry_backoff=settings.mail_retry_backoff,
+    queue_size=settings.mail_queue_size,
+    backend=settings.mail_backend,
 )
 
 
 async def send_email(email: EmailStr, username: str, host: str):
-    try:
-        token_verification = auth_service.create_email_token({"sub": email})
-        message = MessageSchema(
-            subject="Confirm your email ",
-            recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
-            subtype=MessageType.html
-        )
-
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="email_template.html")
-    except ConnectionErrors as err:
-        print(err)
+    token_verification = auth_service.create_email_token({"sub": email})
+    email_dispatcher.enqueue(Email(
+        recipient=email,
+        subject="Confirm your email ",
+        template_name="email_template.html",
+        template_body={"host": str(host), "username": username, "token": token_verification},
+    ))
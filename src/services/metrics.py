@@ -0,0 +1,321 @@
+import asyncio
+import json
+import os
+from bisect import bisect_left
+from contextvars import ContextVar
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, Tuple
+
+import redis.asyncio as redis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from src.conf.config import settings
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# seconds spent in the database and in Redis by the current request
+request_timings: ContextVar[dict | None] = ContextVar("request_timings", default=None)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+    def render(self) -> list:
+        lines = self.header()
+        for values, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, values)} {value}")
+        return lines
+
+    def empty(self) -> "Metric":
+        return type(self)(self.name, self.documentation, self.labels)
+
+    def snapshot(self) -> list:
+        return [[list(values), value] for values, value in self.values.items()]
+
+    def merge(self, snapshot: list) -> None:
+        for values, value in snapshot:
+            self.values[tuple(values)] = self.values.get(tuple(values), 0) + value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def inc(self, *labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        self.observations: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        series = self.observations.get(labels)
+        if series is None:
+            series = self.observations[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = self.header()
+        for values, (counts, total, count) in self.observations.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, values, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, values)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, values)} {count}")
+        return lines
+
+    def empty(self) -> "Histogram":
+        return type(self)(self.name, self.documentation, self.labels, self.buckets)
+
+    def snapshot(self) -> list:
+        return [[list(values), *series] for values, series in self.observations.items()]
+
+    def merge(self, snapshot: list) -> None:
+        for values, counts, total, count in snapshot:
+            series = self.observations.get(tuple(values))
+            if series is None:
+                series = self.observations[tuple(values)] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0] = [a + b for a, b in zip(series[0], counts)]
+            series[1] += total
+            series[2] += count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def dump(self, directory: str) -> None:
+        """
+        Writes the metrics of this process to ``<directory>/<pid>.json``, replacing the previous dump at once.
+        """
+        path = Path(directory) / f"{os.getpid()}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({metric.name: metric.snapshot() for metric in self.metrics}))
+        os.replace(tmp, path)
+
+    def render_all(self, directory: str) -> str:
+        """
+        Renders the sum of the dumps of every worker process in ``directory``, this one dumped first.
+
+        The dumps of workers that exited stay, so the counters keep growing when a worker is replaced.
+        """
+        self.dump(directory)
+        merged = Registry()
+        for metric in self.metrics:
+            merged.register(metric.empty())
+        for path in sorted(Path(directory).glob("*.json")):
+            try:
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+            for metric in merged.metrics:
+                metric.merge(snapshot.get(metric.name, []))
+        return merged.render()
+
+
+class MetricsDump:
+    """
+    Dumps the registry every ``interval`` seconds for the ``/metrics`` of the other worker processes.
+
+    Each uvicorn worker keeps its own registry, so under ``main.py --prod`` a scrape answered by one worker
+    would only see that worker's share. With ``settings.metrics_multiproc_dir`` set, every worker dumps its
+    metrics there and ``/metrics`` sums the dumps, at most ``interval`` seconds behind the other workers.
+    """
+
+    def __init__(self, registry: Registry, directory: str, interval: float = 1.0):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.dump()
+
+    def dump(self) -> None:
+        try:
+            self.registry.dump(self.directory)
+        except OSError as e:
+            print(e)
+
+    def render(self) -> str:
+        if not self.directory:
+            return self.registry.render()
+        return self.registry.render_all(self.directory)
+
+    async def start(self) -> None:
+        if self.directory:
+            Path(self.directory).mkdir(parents=True, exist_ok=True)
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+            # the last dump keeps the counters of this worker in the sums
+            requests_in_progress.values.clear()
+            self.dump()
+
+
+registry = Registry()
+requests_total = registry.register(Counter(
+    "http_requests_total", "Number of HTTP requests.", ("method", "route", "status")))
+requests_in_progress = registry.register(Gauge(
+    "http_requests_in_progress", "Number of HTTP requests being served.", ("method",)))
+request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the response is sent.", ("method", "route", "status")))
+request_db_time = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent executing database queries per HTTP request.", ("method", "route")))
+request_redis_time = registry.register(Histogram(
+    "http_request_redis_seconds", "Time spent waiting for Redis per HTTP request.", ("method", "route")))
+metrics_dump = MetricsDump(registry, settings.metrics_multiproc_dir, settings.metrics_dump_interval)
+
+
+def record_time(kind: str, seconds: float) -> None:
+    timings = request_timings.get()
+    if timings is not None:
+        timings[kind] += seconds
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_time("db", perf_counter() - conn.info["query_start"].pop())
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    if context.connection is not None and context.connection.info.get("query_start"):
+        record_time("db", perf_counter() - context.connection.info["query_start"].pop())
+
+
+class InstrumentedRedis(redis.Redis):
+    """
+    Redis client that adds the time of every command to the current request timings.
+    """
+
+    async def execute_command(self, *args, **options):
+        start = perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            record_time("redis", perf_counter() - start)
+
+
+def route_template(scope) -> str:
+    """
+    Finds the path template of the route that served a request, e.g. ``/api/contacts/{contact_id}``.
+    """
+    app = scope.get("app")
+    endpoint = scope.get("endpoint")
+    if app is None or endpoint is None:
+        return "unmatched"
+    templates = getattr(app.state, "route_templates", None)
+    if templates is None:
+        templates = {}
+        for route in app.routes:
+            if hasattr(route, "endpoint"):
+                templates.setdefault(route.endpoint, route.path)
+            elif hasattr(route, "app"):
+                templates.setdefault(route.app, route.path + "/{path}")
+        app.state.route_templates = templates
+    return templates.get(endpoint, "unmatched")
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        timings = {"db": 0.0, "redis": 0.0}
+        token = request_timings.set(timings)
+        start = perf_counter()
+        response = {"status": 500, "recorded": False}
+
+        def record():
+            # background tasks run after the body is sent and are not part of the latency
+            if response["recorded"]:
+                return
+            response["recorded"] = True
+            route = route_template(scope)
+            status = str(response["status"])
+            requests_total.inc(method, route, status)
+            request_duration.observe(perf_counter() - start, method, route, status)
+            request_db_time.observe(timings["db"], method, route)
+            request_redis_time.observe(timings["redis"], method, route)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                record()
+
+        requests_in_progress.inc(method)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            record()
+            requests_in_progress.dec(method)
+            request_timings.reset(token)
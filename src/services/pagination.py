@@ -0,0 +1,27 @@
+import base64
+import json
+from typing import List
+
+from src.database.models import Contact
+
+
+def encode_cursor(contact_id: int) -> str:
+    payload = json.dumps({"id": contact_id}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        contact_id = json.loads(base64.urlsafe_b64decode(padded))["id"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(contact_id, int):
+        raise ValueError("Invalid cursor")
+    return contact_id
+
+
+def next_cursor(contacts: List[Contact], limit: int) -> str | None:
+    if limit > 0 and len(contacts) == limit:
+        return encode_cursor(contacts[-1].id)
+    return None
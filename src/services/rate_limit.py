@@ -0,0 +1,218 @@
+import asyncio
+import time
+from dataclasses import dataclass
+from math import ceil
+from typing import Dict, Tuple
+
+import redis.asyncio as redis
+from fastapi import HTTPException, Request, status
+
+from src.conf.config import settings
+from src.services.cache import r as default_redis
+
+
+def parse_rule(rule: str) -> Tuple[int, int] | None:
+    """
+    Parses a ``"times/seconds"`` rule, e.g. ``"10/60"``. An empty rule or ``"0"`` means no limit.
+    """
+    if not rule or rule == "0":
+        return None
+    times, _, seconds = rule.partition("/")
+    return int(times), int(seconds or 1)
+
+
+@dataclass
+class Bucket:
+    tokens: float
+    updated: float
+    window: int = 0
+    # requests of this worker in the current window that are not in Redis yet
+    pending: int = 0
+    # requests of all workers in the current window, as of the last sync
+    remote: int = 0
+
+
+class CircuitBreaker:
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def open(self) -> bool:
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.cooldown
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.failures >= self.threshold:
+            # after the cooldown the next sync is a trial, another failure opens the breaker again
+            self.opened_at = time.monotonic()
+
+    def state(self) -> str:
+        if self.open:
+            return "open"
+        return "half-open" if self.opened_at is not None else "closed"
+
+
+class HybridRateLimiter:
+    """
+    Rate limiter that decides locally and shares the counts through Redis in the background.
+
+    Every worker keeps a token bucket per client and route, so a request never waits for Redis.
+    Consumption is added to a fixed-window counter in Redis every ``sync_interval`` seconds, and the
+    totals read back limit the clients across all workers. While Redis fails the circuit breaker is open
+    and only the local buckets apply (``fallback="local"``) or nothing is limited (``fallback="open"``).
+    """
+
+    def __init__(self, r: redis.Redis, rules: Dict[str, str], sync_interval: float = 1.0, timeout: float = 0.5,
+                 breaker_threshold: int = 3, breaker_cooldown: float = 30.0, fallback: str = "local"):
+        self.r = r
+        self.rules = {name: parse_rule(rule) for name, rule in rules.items()}
+        self.sync_interval = sync_interval
+        self.timeout = timeout
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.fallback = fallback
+        self.buckets: Dict[Tuple[str, str], Bucket] = {}
+        self.task: asyncio.Task | None = None
+        self.allowed = 0
+        self.limited = 0
+        self.sync_errors = 0
+
+    def hit(self, name: str, client: str) -> float:
+        """
+        Counts a request of a client to a route.
+
+        :return: 0 if the request is allowed, otherwise the seconds until the client may retry.
+        """
+        rule = self.rules.get(name)
+        if rule is None:
+            return 0
+        times, seconds = rule
+        degraded = self.breaker.open
+        if degraded and self.fallback == "open":
+            self.allowed += 1
+            return 0
+
+        now = time.monotonic()
+        window = int(time.time() // seconds)
+        bucket = self.buckets.get((name, client))
+        if bucket is None:
+            bucket = self.buckets[(name, client)] = Bucket(tokens=times, updated=now, window=window)
+        bucket.tokens = min(times, bucket.tokens + (now - bucket.updated) * times / seconds)
+        bucket.updated = now
+        if bucket.window != window:
+            bucket.window, bucket.pending, bucket.remote = window, 0, 0
+
+        if bucket.tokens < 1:
+            retry_after = (1 - bucket.tokens) * seconds / times
+        elif not degraded and bucket.remote + bucket.pending >= times:
+            retry_after = (window + 1) * seconds - time.time()
+        else:
+            bucket.tokens -= 1
+            bucket.pending += 1
+            self.allowed += 1
+            return 0
+        self.limited += 1
+        return max(retry_after, 0.001)
+
+    @staticmethod
+    def redis_key(name: str, client: str, window: int) -> str:
+        return f"ratelimit:{name}:{client}:{window}"
+
+    async def sync(self) -> None:
+        """
+        Adds the pending counts to Redis and reads back the totals of the current windows in one round trip.
+        """
+        if self.breaker.open:
+            return
+        now = time.monotonic()
+        batch = []
+        for key, bucket in list(self.buckets.items()):
+            times, seconds = self.rules[key[0]]
+            if not bucket.pending and now - bucket.updated > seconds:
+                del self.buckets[key]
+                continue
+            batch.append((key, bucket, bucket.window, bucket.pending, seconds))
+            bucket.pending = 0
+        if not batch:
+            return
+        try:
+            async with self.r.pipeline(transaction=False) as pipe:
+                for (name, client), bucket, window, pending, seconds in batch:
+                    redis_key = self.redis_key(name, client, window)
+                    pipe.incrby(redis_key, pending).expire(redis_key, seconds + 1)
+                results = await asyncio.wait_for(pipe.execute(), self.timeout)
+        except (redis.RedisError, OSError, asyncio.TimeoutError) as e:
+            print(f"Rate limiter sync failed: {e!r}")
+            self.sync_errors += 1
+            self.breaker.failure()
+            for _, bucket, window, pending, _ in batch:
+                if bucket.window == window:
+                    bucket.pending += pending
+            return
+        self.breaker.success()
+        for (_, bucket, window, _, _), total in zip(batch, results[::2]):
+            if bucket.window == window:
+                bucket.remote = total
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.sync()
+
+    def stats(self) -> dict:
+        return {
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "sync_errors": self.sync_errors,
+            "breaker": self.breaker.state(),
+            "buckets": len(self.buckets),
+        }
+
+
+rate_limiter = HybridRateLimiter(
+    default_redis,
+    settings.rate_limits,
+    sync_interval=settings.rate_limit_sync_interval,
+    timeout=settings.rate_limit_redis_timeout,
+    breaker_threshold=settings.rate_limit_breaker_threshold,
+    breaker_cooldown=settings.rate_limit_breaker_cooldown,
+    fallback=settings.rate_limit_fallback,
+)
+
+
+def client_id(request: Request) -> str:
+    # X-Forwarded-For is set by the client unless a trusted proxy rewrote it, uvicorn's proxy_headers
+    # already put the address the trusted proxies saw into request.client
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimit:
+    """
+    Route dependency that applies the ``settings.rate_limits`` rule with the given name.
+    """
+
+    def __init__(self, name: str, limiter: HybridRateLimiter = rate_limiter):
+        self.name = name
+        self.limiter = limiter
+
+    async def __call__(self, request: Request):
+        retry_after = self.limiter.hit(self.name, client_id(request))
+        if retry_after:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Too Many Requests",
+                                headers={"Retry-After": str(ceil(retry_after))})
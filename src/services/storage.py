@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from src.conf.config import settings
+
+
+class CloudinaryStorage:
+    def __init__(self, cloud_name: str, api_key: str, api_secret: str):
+        self.credentials = dict(cloud_name=cloud_name, api_key=api_key, api_secret=api_secret)
+        self.configured = False
+
+    def upload(self, data: bytes, public_id: str) -> str:
+        # the cloudinary SDK is imported and configured by the first upload, worker startup stays fast
+        import cloudinary
+        import cloudinary.uploader
+
+        if not self.configured:
+            cloudinary.config(**self.credentials, secure=True)
+            self.configured = True
+        result = cloudinary.uploader.upload(data, public_id=public_id, overwrite=True)
+        return cloudinary.CloudinaryImage(public_id)\
+            .build_url(width=250, height=250, crop='fill', version=result.get('version'))
+
+
+class LocalStorage:
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+
+    def upload(self, data: bytes, public_id: str) -> str:
+        path = (self.root / f'{public_id}.jpg').resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError(f'{public_id} is outside of the avatar directory')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        return f'{self.base_url}/{public_id}.jpg'
+
+
+_storage = None
+
+
+def init_storage():
+    global _storage
+    if settings.avatar_storage == 'local':
+        _storage = LocalStorage(settings.avatar_local_dir, settings.avatar_local_url)
+    else:
+        _storage = CloudinaryStorage(settings.cloudinary_name, settings.cloudinary_api_key,
+                                     settings.cloudinary_api_secret)
+    return _storage
+
+
+def get_storage():
+    return _storage or init_storage()
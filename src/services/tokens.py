@@ -0,0 +1,128 @@
+from uuid import uuid4
+
+import redis.asyncio as redis
+from fastapi import HTTPException, status
+
+from src.conf.config import settings
+from src.services.auth import auth_service
+from src.services.cache import r as default_redis
+
+
+class RefreshTokenStore:
+    """
+    Refresh tokens kept in Redis instead of ``users.refresh_token``.
+
+    Every login starts a token family, one per device. A refresh deletes the presented token and issues
+    the next one of the family, so each token works once. A token that comes back after it was used means
+    two parties hold the family: the whole family is revoked and that device has to log in again.
+    Every key expires with the tokens it belongs to.
+    """
+
+    def __init__(self, r: redis.Redis, ttl: int):
+        self.r = r
+        self.ttl = ttl
+        self.issued = 0
+        self.rotated = 0
+        self.reused = 0
+        self.revoked = 0
+        self.errors = 0
+
+    @staticmethod
+    def token_key(jti: str) -> str:
+        return f"refresh:token:{jti}"
+
+    @staticmethod
+    def family_key(family: str) -> str:
+        return f"refresh:family:{family}"
+
+    @staticmethod
+    def sessions_key(email: str) -> str:
+        return f"refresh:sessions:{email}"
+
+    def _unavailable(self, e: Exception) -> HTTPException:
+        print(e)
+        self.errors += 1
+        return HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                             detail="Sessions are unavailable, try again later", headers={"Retry-After": "5"})
+
+    async def _store(self, email: str, family: str) -> str:
+        jti = uuid4().hex
+        async with self.r.pipeline(transaction=True) as pipe:
+            pipe.set(self.token_key(jti), family, ex=self.ttl)
+            pipe.set(self.family_key(family), email, ex=self.ttl)
+            pipe.sadd(self.sessions_key(email), family).expire(self.sessions_key(email), self.ttl)
+            await pipe.execute()
+        return await auth_service.create_refresh_token(data={"sub": email, "jti": jti, "fam": family},
+                                                       expires_delta=self.ttl)
+
+    async def issue(self, email: str) -> str:
+        """
+        Starts a new token family for a login and returns its first refresh token.
+        """
+        try:
+            token = await self._store(email, uuid4().hex)
+        except redis.RedisError as e:
+            raise self._unavailable(e)
+        self.issued += 1
+        return token
+
+    async def rotate(self, claims: dict) -> str:
+        """
+        Spends the refresh token with the given claims and returns the next token of its family.
+        """
+        invalid = HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid refresh token")
+        jti, family, email = claims.get("jti"), claims.get("fam"), claims["sub"]
+        if jti is None or family is None:
+            raise invalid
+        try:
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.getdel(self.token_key(jti)).exists(self.family_key(family))
+                stored, family_alive = await pipe.execute()
+            if stored is None:
+                if family_alive:
+                    self.reused += 1
+                    await self.revoke_family(email, family)
+                raise invalid
+            if not family_alive:
+                raise invalid
+            token = await self._store(email, family)
+        except redis.RedisError as e:
+            raise self._unavailable(e)
+        self.rotated += 1
+        return token
+
+    async def revoke_family(self, email: str, family: str) -> None:
+        try:
+            async with self.r.pipeline(transaction=True) as pipe:
+                pipe.delete(self.family_key(family)).srem(self.sessions_key(email), family)
+                await pipe.execute()
+        except redis.RedisError as e:
+            raise self._unavailable(e)
+        self.revoked += 1
+
+    async def revoke_all(self, email: str) -> int:
+        """
+        Logs a user out on every device.
+
+        :return: The number of sessions revoked.
+        """
+        try:
+            families = await self.r.smembers(self.sessions_key(email))
+            await self.r.delete(self.sessions_key(email), *(self.family_key(family.decode()) for family in families))
+        except redis.RedisError as e:
+            raise self._unavailable(e)
+        self.revoked += len(families)
+        return len(families)
+
+    def stats(self) -> dict:
+        return {
+            "ttl": self.ttl,
+            "issued": self.issued,
+            "rotated": self.rotated,
+            "reused": self.reused,
+            "revoked": self.revoked,
+            "errors": self.errors,
+        }
+
+
+refresh_tokens = RefreshTokenStore(default_redis, ttl=settings.refresh_token_ttl)
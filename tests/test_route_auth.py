@@ -1,6 +1,8 @@
-from unittest.mock import MagicMock
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
 
 from src.database.models import User
+from src.services.auth import auth_service
 
 
 def test_create_user(client, user, monkeypatch):
@@ -36,10 +38,11 @@ def test_login_user_not_confirmed(client, user):
     assert data["detail"] == "Email not confirmed"
 
 
-def test_login_user(client, session, user):
+def test_login_user(client, session, user, monkeypatch):
     current_user: User = session.query(User).filter(User.email == user.get('email')).first()
     current_user.confirmed = True
     session.commit()
+    monkeypatch.setattr("src.routes.auth.refresh_tokens.issue", AsyncMock(return_value="refresh"))
     response = client.post(
         "/api/auth/login",
         data={"username": user.get('email'), "password": user.get('password')},
@@ -47,6 +50,59 @@ def test_login_user(client, session, user):
     assert response.status_code == 200, response.text
     data = response.json()
     assert data["token_type"] == "bearer"
+    assert data["refresh_token"] == "refresh"
+    session.refresh(current_user)
+    assert current_user.refresh_token is None
+
+
+def test_refresh_token(client, user, monkeypatch):
+    rotate = AsyncMock(return_value="next")
+    monkeypatch.setattr("src.routes.auth.refresh_tokens.rotate", rotate)
+    token = asyncio.run(auth_service.create_refresh_token(data={"sub": user.get('email'), "jti": "t1", "fam": "f1"}))
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    assert response.json()["refresh_token"] == "next"
+    assert rotate.await_args.args[0]["jti"] == "t1"
+
+
+def test_refresh_token_of_unknown_user(client, monkeypatch):
+    rotate, revoke_all = AsyncMock(), AsyncMock(return_value=1)
+    monkeypatch.setattr("src.routes.auth.refresh_tokens.rotate", rotate)
+    monkeypatch.setattr("src.routes.auth.refresh_tokens.revoke_all", revoke_all)
+    token = asyncio.run(auth_service.create_refresh_token(data={"sub": "gone@example.com", "jti": "t1", "fam": "f1"}))
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401, response.text
+    revoke_all.assert_awaited_once_with("gone@example.com")
+    rotate.assert_not_awaited()
+
+
+def test_refresh_token_of_unconfirmed_user(client, session, user, monkeypatch):
+    current_user: User = session.query(User).filter(User.email == user.get('email')).first()
+    current_user.confirmed = False
+    session.commit()
+    revoke_all = AsyncMock(return_value=1)
+    monkeypatch.setattr("src.routes.auth.refresh_tokens.revoke_all", revoke_all)
+    token = asyncio.run(auth_service.create_refresh_token(data={"sub": user.get('email'), "jti": "t1", "fam": "f1"}))
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {token}"})
+    current_user.confirmed = True
+    session.commit()
+    assert response.status_code == 401, response.text
+    revoke_all.assert_awaited_once_with(user.get('email'))
+
+
+def test_refresh_token_rejects_access_token(client, user):
+    token = asyncio.run(auth_service.create_access_token(data={"sub": user.get('email')}))
+    response = client.get("/api/auth/refresh_token", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401, response.text
+
+
+def test_logout(client, user, monkeypatch):
+    revoke_family = AsyncMock()
+    monkeypatch.setattr("src.routes.auth.refresh_tokens.revoke_family", revoke_family)
+    token = asyncio.run(auth_service.create_refresh_token(data={"sub": user.get('email'), "jti": "t1", "fam": "f1"}))
+    response = client.post("/api/auth/logout", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200, response.text
+    revoke_family.assert_awaited_once_with(user.get('email'), "f1")
 
 
 def test_login_wrong_password(client, user):
@@ -0,0 +1,21 @@
+from src.conf.config import settings
+
+
+def test_stats_disabled_without_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "internal_token", "")
+    response = client.get("/api/internal/stats", headers={"Authorization": "Bearer anything"})
+    assert response.status_code == 404, response.text
+
+
+def test_stats_require_token(client, monkeypatch):
+    monkeypatch.setattr(settings, "internal_token", "s3cret")
+    assert client.get("/api/internal/stats").status_code == 401
+    response = client.get("/api/internal/stats", headers={"Authorization": "Bearer wrong"})
+    assert response.status_code == 401, response.text
+
+
+def test_stats(client, monkeypatch):
+    monkeypatch.setattr(settings, "internal_token", "s3cret")
+    response = client.get("/api/internal/stats", headers={"Authorization": "Bearer s3cret"})
+    assert response.status_code == 200, response.text
+    assert "user_cache" in response.json()
@@ -0,0 +1,105 @@
+import random
+import subprocess
+import sys
+import unittest
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, func, select
+
+from benchmarks.data import generate_contacts, seed
+from benchmarks.plans import check_plans
+from benchmarks.report import compare
+from benchmarks.runner import percentile
+from benchmarks.cli import parse_args
+from benchmarks.startup import TARGET_S, main as startup_main, parse_importtime, summarize
+from src.database.models import Base, Contact, User
+
+
+class TestBenchmarkData(unittest.TestCase):
+
+    def test_generate_contacts_is_reproducible(self):
+        first = list(generate_contacts(1, 50, random.Random(7)))
+        second = list(generate_contacts(1, 50, random.Random(7)))
+        self.assertEqual(first, second)
+        self.assertEqual(len({contact["email"] for contact in first}), 50)
+        self.assertEqual(len({contact["phone"] for contact in first}), 50)
+
+    def test_seed_replaces_previous_data(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        seed(engine, 2, 30)
+        users = seed(engine, 3, 10)
+        with engine.connect() as conn:
+            self.assertEqual(conn.execute(select(func.count()).select_from(User)).scalar(), 3)
+            self.assertEqual(conn.execute(select(func.count()).select_from(Contact)).scalar(), 30)
+        self.assertEqual(users[0].email, "bench-0@bench.example.com")
+
+
+class TestQueryPlans(unittest.TestCase):
+
+    def test_repository_queries_use_indexes(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        seed(engine, 5, 200)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("ANALYZE")
+            user_id = conn.execute(select(User.id).filter(User.email == "bench-0@bench.example.com")).scalar()
+        lines = []
+        self.assertEqual(check_plans(engine, User(id=user_id), log=lines.append), [])
+        self.assertIn("get_contact_by_birthday:", lines)
+
+
+class TestBenchmarkReport(unittest.TestCase):
+
+    def test_percentile(self):
+        values = [float(i) for i in range(1, 101)]
+        self.assertEqual(percentile(values, 50), 50.0)
+        self.assertEqual(percentile(values, 99), 99.0)
+        self.assertEqual(percentile([], 95), 0.0)
+
+    def test_compare_reports_regressions(self):
+        baseline = {"results": {"login": {"p95_ms": 100.0, "throughput": 50.0, "errors": 0},
+                                "read_me": {"p95_ms": 10.0, "throughput": 500.0, "errors": 0}}}
+        current = {"results": {"login": {"p95_ms": 105.0, "throughput": 40.0, "errors": 0},
+                               "read_me": {"p95_ms": 20.0, "throughput": 510.0, "errors": 2},
+                               "search_contacts": {"p95_ms": 30.0, "throughput": 100.0, "errors": 0}}}
+        regressions = compare(baseline, current, 0.1, ["p95_ms", "throughput"])
+        self.assertEqual(len(regressions), 3)
+        self.assertTrue(regressions[0].startswith("login throughput"))
+        self.assertTrue(regressions[1].startswith("read_me p95_ms"))
+        self.assertTrue(regressions[2].startswith("read_me errors"))
+
+
+class TestStartup(unittest.TestCase):
+
+    def test_summarize_importtime(self):
+        entries = parse_importtime(
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       300 |        300 |     sqlalchemy.sql\n"
+            "import time:       200 |        500 |   sqlalchemy\n"
+            "import time:       100 |        100 |   src.conf.config\n"
+            "import time:        50 |        650 | main\n"
+        )
+        self.assertEqual([(entry.module, entry.depth) for entry in entries],
+                         [("sqlalchemy.sql", 2), ("sqlalchemy", 1), ("src.conf.config", 1), ("main", 0)])
+        summary = summarize(entries, "main", top=2)
+        self.assertEqual(summary["total_ms"], 0.65)
+        self.assertEqual(summary["packages"], [{"package": "sqlalchemy", "self_ms": 0.5},
+                                               {"package": "src", "self_ms": 0.1}])
+        self.assertEqual(summary["slowest"][0]["module"], "main")
+
+    def test_app_import_skips_heavy_integrations(self):
+        lazy = ["fastapi_mail", "jinja2", "passlib", "cloudinary", "libgravatar", "uvicorn"]
+        code = f"import sys, main; print([name for name in {lazy!r} if name in sys.modules])"
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_cold_start_has_a_budget_by_default(self):
+        self.assertEqual(parse_args([]).startup_budget, TARGET_S)
+        lines = []
+        with patch("benchmarks.startup.import_profile", return_value=[]), \
+                patch("benchmarks.startup.measure_cold_start",
+                      return_value={"runs": 3, "median_s": TARGET_S + 0.1, "max_s": TARGET_S + 0.2}):
+            self.assertEqual(startup_main([], log=lines.append), 1)
+            self.assertEqual(startup_main(["--budget", "0"], log=lines.append), 0)
+        self.assertIn(f"Over the budget of {TARGET_S:.3f} s", lines)
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from datetime import date
+from unittest.mock import patch
+
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from src.database.db import ReplicaSet, RoutingSession, get_async_url
+from src.database.models import Base, Contact
+
+
+class TestReplicaRouting(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        urls = {}
+        for name in ("primary", "replica"):
+            urls[name] = f"sqlite:///{os.path.join(self.tmp.name, name + '.db')}"
+            engine = create_engine(urls[name])
+            Base.metadata.create_all(engine)
+            with engine.begin() as conn:
+                conn.execute(insert(Contact).values(first_name=name, last_name="L", email=f"{name}@example.com",
+                                                    phone=name, birthday=date(1990, 1, 1), user_id=1))
+            engine.dispose()
+        self.primary = create_async_engine(get_async_url(urls["primary"]))
+        self.replicas = ReplicaSet([urls["replica"]])
+        for target, value in (("async_engine", self.primary), ("replicas", self.replicas)):
+            patcher = patch(f"src.database.db.{target}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.Session = async_sessionmaker(self.primary, class_=AsyncSession, sync_session_class=RoutingSession)
+
+    async def asyncTearDown(self):
+        await self.replicas.dispose()
+        await self.primary.dispose()
+        self.tmp.cleanup()
+
+    async def first_names(self, db):
+        return (await db.execute(select(Contact.first_name).order_by(Contact.id))).scalars().all()
+
+    async def test_reads_go_to_replica(self):
+        async with self.Session() as db:
+            self.assertEqual(await self.first_names(db), ["replica"])
+        self.assertEqual(self.replicas.stats()[0]["picks"], 1)
+
+    async def test_read_after_write_stays_on_primary(self):
+        async with self.Session() as db:
+            await db.execute(insert(Contact).values(first_name="new", last_name="L", email="new@example.com",
+                                                    phone="new", birthday=date(1990, 1, 1), user_id=1))
+            self.assertEqual(await self.first_names(db), ["primary", "new"])
+            await db.commit()
+
+    async def test_unhealthy_replica_falls_back_to_primary(self):
+        self.replicas.replicas.append(self.replicas.replicas[0])
+        self.replicas.replicas[0] = ReplicaSet([f"sqlite:///{self.tmp.name}/missing/replica.db"]).replicas[0]
+        await self.replicas.check()
+        self.assertEqual([replica["healthy"] for replica in self.replicas.stats()], [False, True])
+        self.replicas.replicas[1].healthy = False
+        async with self.Session() as db:
+            self.assertEqual(await self.first_names(db), ["primary"])
+        await self.replicas.replicas[0].engine.dispose()
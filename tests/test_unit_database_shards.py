@@ -0,0 +1,150 @@
+import os
+import tempfile
+import unittest
+from collections import Counter
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func, insert, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.database import rebalance
+from src.database.db import get_async_url
+from src.database.models import Contact, User
+from src.database.shards import HashRing, ShardRouter, ensure_contacts_writable, get_contacts_db, shard_router
+
+
+class TestHashRing(unittest.TestCase):
+
+    def test_spreads_keys_evenly(self):
+        ring = HashRing(["a", "b", "c"])
+        counts = Counter(ring.node(user_id) for user_id in range(3000))
+        for node in "abc":
+            self.assertGreater(counts[node], 700)
+
+    def test_new_node_only_takes_keys(self):
+        before = HashRing(["a", "b", "c"])
+        after = HashRing(["a", "b", "c", "d"])
+        moved = [user_id for user_id in range(3000) if before.node(user_id) != after.node(user_id)]
+        self.assertTrue(all(after.node(user_id) == "d" for user_id in moved))
+        self.assertLess(len(moved), 1200)
+
+
+class TestContactsDb(unittest.IsolatedAsyncioTestCase):
+
+    async def test_locked_user_cannot_write(self):
+        user = User(id=1, contacts_locked=True)
+        with self.assertRaises(HTTPException) as e:
+            await get_contacts_db(user, MagicMock()).__anext__()
+        self.assertEqual(e.exception.status_code, 503)
+
+    async def test_primary_shard_uses_the_request_session(self):
+        db = MagicMock()
+        user = User(id=1, contacts_locked=False, contacts_shard=shard_router.primary)
+        self.assertIs(await get_contacts_db(user, db).__anext__(), db)
+
+    async def test_fence_stops_writes_after_lock_or_move(self):
+        user = User(id=1, contacts_locked=False, contacts_shard=shard_router.primary)
+        db = AsyncMock()
+        db.execute.return_value = MagicMock()
+        for placement in [(shard_router.primary, True), ("elsewhere", False)]:
+            db.execute.return_value.one.return_value = placement
+            with self.assertRaises(HTTPException) as e:
+                await ensure_contacts_writable(user, db)
+            self.assertEqual(e.exception.status_code, 503)
+        db.execute.return_value.one.return_value = (shard_router.primary, False)
+        await ensure_contacts_writable(user, db)
+
+
+class TestRebalance(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        url = f"sqlite:///{os.path.join(self.tmp.name, 'primary.db')}"
+        engine = create_engine(url)
+        User.__table__.create(engine)
+        engine.dispose()
+        self.primary = create_async_engine(get_async_url(url))
+        self.router = ShardRouter({name: f"sqlite:///{os.path.join(self.tmp.name, name + '.db')}"
+                                   for name in ("a", "b")})
+        for index, name in enumerate(self.router.names):
+            await rebalance.create_schema(self.router.engine(name), index)
+        for target, value in (("async_engine", self.primary), ("user_cache", AsyncMock())):
+            patcher = patch(f"src.database.rebalance.{target}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        async with self.primary.begin() as conn:
+            await conn.execute(insert(User), [{"id": 1, "username": "val", "email": "val@example.com",
+                                               "password": "secret", "contacts_locked": False}])
+        self.source = self.router.home(1)
+        self.target = next(name for name in self.router.names if name != self.source)
+        async with self.router.engine(self.source).begin() as conn:
+            await conn.execute(insert(Contact), [
+                {"first_name": f"F{i}", "last_name": "L", "email": f"c{i}@example.com", "phone": str(i),
+                 "birthday": date(1990, 1, 1), "birthday_doy": 1, "user_id": 1} for i in range(5)
+            ])
+
+    async def asyncTearDown(self):
+        await self.router.dispose()
+        await self.primary.dispose()
+        self.tmp.cleanup()
+
+    async def count(self, name):
+        async with self.router.engine(name).connect() as conn:
+            return await conn.scalar(select(func.count()).select_from(Contact).filter(Contact.user_id == 1))
+
+    async def user(self):
+        async with self.primary.connect() as conn:
+            return (await conn.execute(select(User.contacts_shard, User.contacts_locked))).one()
+
+    async def test_move_user(self):
+        moved = await rebalance.move_user(1, self.target, self.router, grace=0, batch_size=2)
+        self.assertEqual(moved, 5)
+        self.assertEqual((await self.count(self.source), await self.count(self.target)), (0, 5))
+        self.assertEqual(tuple(await self.user()), (self.target, False))
+
+    async def test_late_writes_to_the_source_are_moved(self):
+        sleeps = 0
+
+        async def sleep(seconds):
+            nonlocal sleeps
+            sleeps += 1
+            if sleeps == 2:
+                # a request that passed the lock before the move writes to the old shard after the copy,
+                # Postgres shards hand out ids from their own ranges
+                async with self.router.engine(self.source).begin() as conn:
+                    await conn.execute(insert(Contact).values(id=1000, first_name="Late", last_name="L", email="late@example.com",
+                                                              phone="late", birthday=date(1990, 1, 1), user_id=1))
+
+        with patch("src.database.rebalance.asyncio.sleep", sleep):
+            moved = await rebalance.move_user(1, self.target, self.router, grace=0, batch_size=2)
+        self.assertEqual(moved, 6)
+        self.assertEqual((await self.count(self.source), await self.count(self.target)), (0, 6))
+
+    async def test_rows_still_written_are_left_on_the_source(self):
+        phones = iter(range(100, 200))
+
+        async def sleep(seconds):
+            async with self.router.engine(self.source).begin() as conn:
+                phone = next(phones)
+                await conn.execute(insert(Contact).values(id=phone, first_name="Late", last_name="L", email=f"{phone}@example.com",
+                                                          phone=str(phone), birthday=date(1990, 1, 1), user_id=1))
+
+        with patch("src.database.rebalance.asyncio.sleep", sleep), self.assertRaises(RuntimeError):
+            await rebalance.move_user(1, self.target, self.router, grace=0, rounds=2)
+        # every row written before the last round was moved, nothing was deleted without being copied
+        self.assertEqual((await self.count(self.source), await self.count(self.target)), (0, 5 + 3))
+
+    async def test_failed_move_unlocks_user(self):
+        with patch("src.database.rebalance.copy_contacts", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                await rebalance.move_user(1, self.target, self.router, grace=0)
+        self.assertEqual(tuple(await self.user()), (None, False))
+        self.assertEqual(await self.count(self.source), 5)
+
+    async def test_pin_users(self):
+        self.assertEqual(await rebalance.pin_users(self.router), 1)
+        self.assertEqual(tuple(await self.user()), (self.source, False))
+        self.assertEqual(await rebalance.placements(self.router), [(1, "val@example.com", self.source, self.source)])
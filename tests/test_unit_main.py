@@ -0,0 +1,32 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import main
+
+
+class TestRun(unittest.TestCase):
+
+    @patch("uvicorn.run")
+    def test_development(self, uvicorn_run):
+        main.run()
+        self.assertTrue(uvicorn_run.call_args.kwargs["reload"])
+        self.assertNotIn("workers", uvicorn_run.call_args.kwargs)
+
+    @patch("main.os.cpu_count", return_value=6)
+    @patch("uvicorn.run")
+    def test_production(self, uvicorn_run, cpu_count):
+        with tempfile.TemporaryDirectory() as metrics_dir, patch.dict(os.environ), \
+                patch.multiple(main.settings, uvicorn_workers=0, uvicorn_keepalive=15, uvicorn_backlog=512,
+                               metrics_multiproc_dir=metrics_dir):
+            Path(metrics_dir, "123.json").write_text("{}")
+            main.run(prod=True)
+            self.assertEqual(os.environ["METRICS_MULTIPROC_DIR"], metrics_dir)
+            self.assertEqual(list(Path(metrics_dir).iterdir()), [])
+        kwargs = uvicorn_run.call_args.kwargs
+        self.assertEqual(kwargs["workers"], 6)
+        self.assertEqual((kwargs["timeout_keep_alive"], kwargs["backlog"]), (15, 512))
+        self.assertEqual((kwargs["loop"], kwargs["http"]), ("auto", "auto"))
+        self.assertNotIn("reload", kwargs)
@@ -1,15 +1,21 @@
 import unittest
-from unittest.mock import MagicMock
+from datetime import date
+from unittest.mock import AsyncMock, MagicMock, patch
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 
-from src.database.models import Contact, User
-from src.schemas import ContactModel, ContactUpdate, ContactStatusUpdate
+from src.database.models import Base, Contact, User
+from src.schemas import ContactModel, ContactUpdate, ContactStatusUpdate, ContactResponse
 from src.repository.contacts import (
     get_contacts,
     get_contact_by_birthday,
+    day_of_year,
+    birthday_window,
     get_contact,
+    search_contacts,
+    escape_like,
     create_contact,
+    create_contacts,
     remove_contact,
     update_contact,
     update_status_contact,
@@ -19,92 +25,219 @@ from src.repository.contacts import (
 class TestContacts(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User(id=1)
+        patcher = patch("src.repository.contacts.contacts_cache", AsyncMock())
+        self.contacts_cache = patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_contacts(self):
         contacts = [Contact(), Contact(), Contact()]
-        self.session.query().filter().offset().limit().all.return_value = contacts
+        self.result.scalars().all.return_value = contacts
         result = await get_contacts(skip=0, limit=10, user=self.user, db=self.session)
         self.assertEqual(result, contacts)
 
+    async def test_get_contacts_after_id(self):
+        contacts = [Contact(id=4), Contact(id=5)]
+        self.result.scalars().all.return_value = contacts
+        result = await get_contacts(skip=0, limit=2, user=self.user, db=self.session, after_id=3)
+        self.assertEqual(result, contacts)
+        stmt = self.session.execute.call_args.args[0]
+        self.assertIsNone(stmt._offset_clause)
+        self.assertIn("contacts.id >", str(stmt))
+
     async def test_get_contact_found(self):
         contact = Contact()
-        self.session.query().filter().all.return_value = contact
+        self.result.scalars().all.return_value = contact
         result = await get_contact(first_name=contact.first_name, last_name=contact.last_name, email=contact.email,
                                    user=self.user, db=self.session)
         self.assertEqual(result, contact) 
 
     async def test_get_contact_not_found(self):
         contact = Contact()
-        self.session.query().filter().all.return_value = None
+        self.result.scalars().all.return_value = None
         result = await get_contact(first_name=contact.first_name, last_name=contact.last_name, email=contact.email,
                                    user=self.user, db=self.session)
         self.assertIsNone(result)
     
+    async def test_search_contacts(self):
+        contacts = [Contact(), Contact()]
+        self.result.scalars().all.return_value = contacts
+        result = await search_contacts(query=' Ol_a ', limit=20, user=self.user, db=self.session)
+        self.assertEqual(result, contacts)
+        sql = str(self.session.execute.call_args.args[0])
+        self.assertIn("lower(contacts.first_name) LIKE lower(", sql)
+        self.assertNotIn("similarity", sql)
+
+    def test_escape_like(self):
+        self.assertEqual(escape_like("50%_a\\b"), "50\\%\\_a\\\\b")
+
     async def test_get_contact_by_birthday(self):
         contact = []
-        self.session.query().all.return_value = contact
+        self.result.scalars().all.return_value = contact
         result = await get_contact_by_birthday(user=self.user, db=self.session)
         self.assertEqual(result, contact)
+
+    def test_day_of_year_ignores_year(self):
+        self.assertEqual(day_of_year(date(1990, 3, 1)), day_of_year(date(2000, 3, 1)))
+        self.assertEqual(day_of_year(date(2000, 2, 29)), 60)
+        self.assertEqual(day_of_year(date(1990, 12, 31)), 366)
+
+    def test_birthday_window(self):
+        self.assertEqual(birthday_window(date(2023, 6, 1)), (153, 160))
+
+    def test_birthday_window_wraps_new_year(self):
+        start, end = birthday_window(date(2023, 12, 28))
+        self.assertEqual((start, end), (363, 4))
+
+    def test_birthday_window_leap_day_in_common_year(self):
+        self.assertEqual(birthday_window(date(2023, 3, 1))[0], day_of_year(date(2000, 2, 29)))
+        start, end = birthday_window(date(2023, 2, 25))
+        self.assertTrue(start <= day_of_year(date(2000, 2, 29)) <= end)
        
     async def test_create_contact(self):
         body = ContactModel(first_name='test_first_name', last_name='test_last_name',
                              email='test@email.com', phone='test_phone',
                                birthday=23-1-1, user_id=self.user.id)
+        contact = MagicMock()
+        self.result.one.return_value = contact
         result = await create_contact(body=body, user=self.user, db=self.session)
-        self.assertEqual(result.first_name, body.first_name)
-        self.assertEqual(result.last_name, body.last_name)
-        self.assertEqual(result.email, body.email)
-        self.assertEqual(result.phone, body.phone)
-        self.assertEqual(result.birthday, body.birthday) 
-        self.assertTrue(hasattr(result, "id"))        
+        self.assertEqual(result, contact)
+        stmt = self.session.execute.call_args.args[0]
+        params = stmt.compile().params
+        self.assertEqual((params["first_name"], params["email"], params["user_id"]),
+                         (body.first_name, body.email, self.user.id))
+        self.assertIn("RETURNING", str(stmt))
+        self.session.refresh.assert_not_called()
+        self.contacts_cache.bump.assert_awaited_once_with(self.user.id)
+
+    async def test_create_contacts_skips_taken(self):
+        bodies = [ContactModel(first_name='first', last_name='last', email=f'test{i}@email.com',
+                               phone=f'phone_{i}', birthday='1990-01-01') for i in range(3)]
+        bodies.append(ContactModel(first_name='first', last_name='last', email='test0@email.com',
+                                   phone='phone_3', birthday='1990-01-01'))
+        self.result.all.return_value = [('test1@email.com', 'other_phone')]
+        result = await create_contacts(bodies=bodies, user=self.user, db=self.session)
+        self.assertEqual(result[0], None)
+        self.assertIn('test1@email.com', result[1])
+        self.assertEqual(result[2], None)
+        self.assertIn('test0@email.com', result[3])
+        rows = self.session.execute.call_args.args[1]
+        self.assertEqual([row['email'] for row in rows], ['test0@email.com', 'test2@email.com'])
+        self.session.commit.assert_awaited_once()
+
+    def assert_scoped_write(self, verb: str):
+        self.session.execute.assert_awaited_once()
+        sql = str(self.session.execute.call_args.args[0])
+        self.assertTrue(sql.startswith(verb), sql)
+        self.assertIn("WHERE contacts.id = :id_1 AND contacts.user_id = :user_id_1 RETURNING", sql)
 
     async def test_remove_contact_found(self):
-        contact = Contact()
-        self.session.query().filter().first.return_value = contact
+        contact = MagicMock()
+        self.result.first.return_value = contact
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertEqual(result, contact)
+        self.assert_scoped_write("DELETE FROM contacts")
+        self.session.commit.assert_awaited_once()
+        self.contacts_cache.bump.assert_awaited_once_with(self.user.id)
 
     async def test_remove_contact_not_found(self):
-        self.session.query().filter().first.return_value = None
+        self.result.first.return_value = None
         result = await remove_contact(contact_id=1, user=self.user, db=self.session)
         self.assertIsNone(result)
+        self.session.commit.assert_not_awaited()
+        self.contacts_cache.bump.assert_not_awaited()
 
     async def test_update_contact_found(self):
         body = ContactUpdate(first_name='test_first_name', last_name='test_last_name',
                              email='test@email.com', phone='test_phone',
                                birthday=23-1-1, done=True, user_id=self.user.id)
-        contact = Contact()
-        self.session.query().filter().first.return_value = contact
-        self.session.commit.return_value = None
+        contact = MagicMock()
+        self.result.first.return_value = contact
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
-        self.assertEqual(result, contact)        
+        self.assertEqual(result, contact)
+        self.assert_scoped_write("UPDATE contacts SET")
+        params = self.session.execute.call_args.args[0].compile().params
+        # plain strings, not the one-element tuples the old trailing commas assigned
+        self.assertEqual((params["first_name"], params["last_name"], params["email"], params["phone"]),
+                         (body.first_name, body.last_name, body.email, body.phone))
+        self.assertEqual(params["birthday_doy"], day_of_year(body.birthday))
 
     async def test_update_contact_not_found(self):
         body = ContactUpdate(first_name='test_first_name', last_name='test_last_name',
                              email='test@email.com', phone='test_phone',
                                birthday=23-1-1, done=True, user_id=self.user.id)
-        self.session.query().filter().first.return_value = None
-        self.session.commit.return_value = None
+        self.result.first.return_value = None
         result = await update_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
+        self.contacts_cache.bump.assert_not_awaited()
 
     async def test_update_status_contact_found(self):
         body = ContactStatusUpdate(done=True)
-        contact = Contact()
-        self.session.query().filter().first.return_value = contact
-        self.session.commit.return_value = None
+        contact = MagicMock()
+        self.result.first.return_value = contact
         result = await update_status_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertEqual(result, contact)
+        self.assert_scoped_write("UPDATE contacts SET done=:done")
+        self.contacts_cache.bump.assert_awaited_once_with(self.user.id)
 
     async def test_update_status_contact_not_found(self):
         body = ContactStatusUpdate(done=True)
-        self.session.query().filter().first.return_value = None
-        self.session.commit.return_value = None
+        self.result.first.return_value = None
         result = await update_status_contact(contact_id=1, body=body, user=self.user, db=self.session)
         self.assertIsNone(result)
 
 
+class TestContactWrites(unittest.IsolatedAsyncioTestCase):
+    """
+    Runs the RETURNING statements against SQLite, the mocks above cannot tell whether they are valid SQL.
+    """
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        self.session = AsyncSession(self.engine, expire_on_commit=False)
+        self.user, self.other = User(id=1), User(id=2)
+        patcher = patch("src.repository.contacts.contacts_cache", AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self):
+        await self.session.close()
+        await self.engine.dispose()
+
+    def body(self, i: int, **kwargs) -> ContactUpdate:
+        return ContactUpdate(**{"first_name": f"First{i}", "last_name": "Last", "email": f"c{i}@example.com",
+                                "phone": f"+38000000{i:04d}", "birthday": date(1990, 3, i + 1), "done": False,
+                                **kwargs})
+
+    async def test_round_trip(self):
+        created = await create_contact(self.body(1), self.user, self.session)
+        self.assertEqual(ContactResponse.from_orm(created).email, "c1@example.com")
+        self.assertTrue(created.id and created.created_at)
+
+        updated = await update_contact(created.id, self.body(2, done=True), self.user, self.session)
+        self.assertEqual(ContactResponse.from_orm(updated).dict(),
+                         {**ContactResponse.from_orm(created).dict(), **self.body(2).dict(exclude={"done"})})
+        status_updated = await update_status_contact(created.id, ContactStatusUpdate(done=False), self.user,
+                                                     self.session)
+        self.assertEqual(status_updated.id, created.id)
+        removed = await remove_contact(created.id, self.user, self.session)
+        self.assertEqual(removed.first_name, "First2")
+        self.assertIsNone(await remove_contact(created.id, self.user, self.session))
+
+    async def test_other_users_contact_is_untouched(self):
+        created = await create_contact(self.body(1), self.user, self.session)
+        self.assertIsNone(await update_contact(created.id, self.body(2), self.other, self.session))
+        self.assertIsNone(await update_status_contact(created.id, ContactStatusUpdate(done=True), self.other,
+                                                      self.session))
+        self.assertIsNone(await remove_contact(created.id, self.other, self.session))
+        await self.session.rollback()
+        contacts = await get_contacts(0, 10, self.user, self.session)
+        self.assertEqual([(contact.first_name, contact.done) for contact in contacts], [("First1", False)])
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,7 +1,7 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, AsyncMock, patch
 
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import User
 from src.schemas import UserModel, ContactUpdate, ContactStatusUpdate
@@ -17,18 +17,23 @@ from src.repository.users import (
 class TestUsers(unittest.IsolatedAsyncioTestCase):
 
     def setUp(self):
-        self.session = MagicMock(spec=Session)
+        self.session = MagicMock(spec=AsyncSession)
+        self.result = MagicMock()
+        self.session.execute.return_value = self.result
         self.user = User()
+        patcher = patch("src.repository.users.user_cache", AsyncMock())
+        self.user_cache = patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_user_by_email(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         result = await get_user_by_email(email=user.email, db=self.session)
         self.assertEqual(result, user)
 
     async def test_get_user_by_email_not_found(self):
         user = User()
-        self.session.query().filter().first.return_value = None
+        self.result.scalars().first.return_value = None
         result = await get_user_by_email(email=user.email, db=self.session)
         self.assertIsNone(result)
 
@@ -43,27 +48,30 @@ class TestUsers(unittest.IsolatedAsyncioTestCase):
        
     async def test_update_token_found(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         self.session.commit.return_value = None
         token='qwerty'
         await update_token(user=user, token=token, db=self.session)
         self.assertTrue(user.refresh_token)
         self.assertEqual(user.refresh_token, token)
+        self.user_cache.invalidate.assert_awaited_once_with(user.email)
 
     async def test_confirmed_email(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         self.session.commit.return_value = None
         email='test@email.com'
         await confirmed_email(email=email, db=self.session)
         self.assertTrue(user.confirmed)
+        self.user_cache.invalidate.assert_awaited_once_with(email)
 
     async def test_update_avatar(self):
         user = User()
-        self.session.query().filter().first.return_value = user
+        self.result.scalars().first.return_value = user
         url = 'http'
         await update_avatar(email=user.email, url=url, db=self.session)
         self.assertTrue(user.avatar)
+        self.user_cache.invalidate.assert_awaited_once_with(user.email)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,71 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from src.services import avatar
+from src.services.avatar import make_thumbnail, upload_avatar
+from src.services.storage import LocalStorage
+
+
+class TestAvatar(unittest.IsolatedAsyncioTestCase):
+
+    def test_make_thumbnail(self):
+        buffer = io.BytesIO()
+        avatar.Image.new('RGB', (800, 600), 'red').save(buffer, 'PNG')
+        data = make_thumbnail(buffer.getvalue(), 250)
+        thumbnail = avatar.Image.open(io.BytesIO(data))
+        self.assertEqual((thumbnail.format, thumbnail.size), ('JPEG', (250, 250)))
+
+    def test_make_thumbnail_not_an_image(self):
+        with self.assertRaises(ValueError):
+            make_thumbnail(b'not an image', 250)
+
+    def test_make_thumbnail_fails_while_decoding(self):
+        buffer = io.BytesIO()
+        avatar.Image.new('RGB', (800, 600), 'red').save(buffer, 'PNG')
+        # Pillow decodes lazily, some corrupt files only fail once the pixels are resized
+        with patch('src.services.avatar.ImageOps.fit', side_effect=OSError('broken data stream')):
+            with self.assertRaises(ValueError):
+                make_thumbnail(buffer.getvalue(), 250)
+
+    def test_local_storage(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = LocalStorage(root, '/static/avatars/')
+            url = storage.upload(b'jpeg', 'ContactsApp/1')
+            self.assertEqual(url, '/static/avatars/ContactsApp/1.jpg')
+            with open(f'{root}/ContactsApp/1.jpg', 'rb') as f:
+                self.assertEqual(f.read(), b'jpeg')
+
+    def test_local_storage_stays_in_root(self):
+        with tempfile.TemporaryDirectory() as root:
+            storage = LocalStorage(f'{root}/avatars', '/static/avatars/')
+            with self.assertRaises(ValueError):
+                storage.upload(b'jpeg', 'ContactsApp/../../x')
+            self.assertFalse(os.path.exists(f'{root}/x.jpg'))
+
+    async def test_upload_avatar(self):
+        storage = MagicMock()
+        storage.upload.return_value = 'http://avatar'
+        update_avatar = AsyncMock()
+        with patch('src.services.avatar.get_storage', return_value=storage), \
+                patch('src.services.avatar.AsyncSessionLocal', MagicMock()), \
+                patch('src.services.avatar.repository_users.update_avatar', update_avatar):
+            url = await upload_avatar('val@example.com', 1, b'jpeg')
+        self.assertEqual(url, 'http://avatar')
+        storage.upload.assert_called_once_with(b'jpeg', 'ContactsApp/1')
+        self.assertEqual(update_avatar.call_args.args[:2], ('val@example.com', 'http://avatar'))
+
+    async def test_upload_avatar_failed(self):
+        storage = MagicMock()
+        storage.upload.side_effect = ConnectionError('cloudinary is down')
+        update_avatar = AsyncMock()
+        with patch('src.services.avatar.get_storage', return_value=storage), \
+                patch('src.services.avatar.repository_users.update_avatar', update_avatar):
+            self.assertIsNone(await upload_avatar('val@example.com', 1, b'jpeg'))
+        update_avatar.assert_not_awaited()
+
+
+if __name__ == '__main__':
+    unittest.main()
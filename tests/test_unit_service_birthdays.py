@@ -0,0 +1,88 @@
+import unittest
+from datetime import date, datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.database.models import Base, Contact, User
+from src.repository.contacts import day_of_year, get_contact_by_birthday
+from src.services.birthdays import build_digest, next_run
+from src.services.cache import BirthdayDigest
+from src.services.contacts_export import render_contacts
+
+
+class TestBuildDigest(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.engine = create_async_engine("sqlite+aiosqlite://")
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.execute(insert(User), [{"id": i, "username": f"user{i}", "email": f"user{i}@example.com",
+                                               "password": "secret"} for i in (1, 2, 3)])
+            await conn.execute(insert(Contact), [
+                {"first_name": name, "last_name": "Last", "email": f"{name}@example.com", "phone": name,
+                 "birthday": birthday, "birthday_doy": day_of_year(birthday), "user_id": user_id}
+                for name, birthday, user_id in [("later", date(1990, 6, 5), 1), ("sooner", date(1985, 6, 2), 1),
+                                                ("december", date(1990, 12, 1), 1), ("other", date(1990, 6, 7), 3),
+                                                ("outside", date(1990, 1, 1), 2)]
+            ])
+        patcher = patch("src.services.birthdays.async_engine", self.engine)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.r = AsyncMock()
+        self.r.mget.side_effect = lambda *keys: [b"5"] * len(keys)
+        self.stored = {}
+
+        async def store(keys, args):
+            for i in range(1, len(args), 3):
+                self.stored[args[i]] = (args[i + 1], args[i + 2])
+            return len(keys) - 1
+
+        self.r.register_script = MagicMock(return_value=store)
+        self.digest = BirthdayDigest(self.r, ttl=3600)
+        self.router = MagicMock(names=["main"], engine=MagicMock(return_value=self.engine))
+        self.day = date(2023, 6, 1)
+
+    async def asyncTearDown(self):
+        await self.engine.dispose()
+
+    async def test_stores_every_user(self):
+        run = await build_digest(self.day, self.digest, self.router, batch_size=2)
+        self.assertEqual((run["users"], run["contacts"], run["stored"]), (3, 3, 3))
+        self.assertEqual(self.stored[2], ("5", b"[]"))
+        self.assertIn(b'"first_name":"other"', self.stored[3][1])
+        self.assertEqual(self.r.hset.call_args.kwargs["mapping"], run)
+
+    async def test_matches_the_response(self):
+        await build_digest(self.day, self.digest, self.router)
+        async with AsyncSession(self.engine) as db:
+            contacts = await get_contact_by_birthday(User(id=1), db, self.day)
+        self.assertEqual([contact.first_name for contact in contacts], ["sooner", "later"])
+        self.assertEqual(self.stored[1][1], render_contacts(contacts))
+
+    async def test_users_created_during_the_run_are_skipped(self):
+        self.r.mget.side_effect = lambda *keys: [None] * len(keys)
+        # a contact of a user the users query did not see, SQLite does not enforce the foreign key
+        async with self.engine.begin() as conn:
+            await conn.execute(insert(Contact).values(first_name="new", last_name="Last", email="new@example.com",
+                                                      phone="new", birthday=date(1990, 6, 3),
+                                                      birthday_doy=day_of_year(date(1990, 6, 3)), user_id=4))
+        run = await build_digest(self.day, self.digest, self.router)
+        self.assertEqual((run["users"], run["contacts"], run["stored"]), (3, 4, 3))
+        self.assertNotIn(4, self.stored)
+        self.assertEqual(self.stored[1][0], "")
+
+
+class TestNextRun(unittest.TestCase):
+
+    def test_later_today(self):
+        self.assertEqual(next_run(datetime(2023, 6, 1, 0, 1), "00:05"), datetime(2023, 6, 1, 0, 5))
+
+    def test_tomorrow(self):
+        self.assertEqual(next_run(datetime(2023, 6, 1, 0, 5), "00:05"), datetime(2023, 6, 2, 0, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,228 @@
+import asyncio
+import pickle
+import unittest
+from datetime import datetime
+from datetime import date, timedelta
+from unittest.mock import AsyncMock, MagicMock
+
+from redis.exceptions import ConnectionError
+
+from src.database.models import User
+from src.database.db import read_from_primary
+from src.conf.config import settings
+from src.services.cache import BirthdayDigest, ContactsCache, UserCache, r
+
+
+class TestUserCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = AsyncMock()
+        self.cache = UserCache(self.r, ttl=60)
+        self.user = User(id=1, username='val', email='val@example.com', password='hash', refresh_token='token',
+                         created_at=datetime(2023, 3, 1, 12), confirmed=True, contacts_locked=False)
+
+    async def test_get_hit(self):
+        self.r.get.return_value = UserCache.dumps(self.user).encode()
+        result = await self.cache.get(self.user.email)
+        self.assertEqual((result.id, result.email, result.created_at, result.contacts_locked),
+                         (1, self.user.email, self.user.created_at, False))
+        self.r.get.assert_awaited_once_with("user:val@example.com")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 0))
+
+    async def test_old_entry_is_a_miss(self):
+        for data in (pickle.dumps(self.user), b'{"id": 1, "email": "val@example.com"}'):
+            self.r.get.return_value = data
+            self.assertIsNone(await self.cache.get(self.user.email))
+        self.assertEqual(self.cache.misses, 2)
+
+    async def test_get_miss(self):
+        self.r.get.return_value = None
+        result = await self.cache.get(self.user.email)
+        self.assertIsNone(result)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    async def test_get_redis_unavailable(self):
+        self.r.get.side_effect = ConnectionError()
+        result = await self.cache.get(self.user.email)
+        self.assertIsNone(result)
+        self.assertEqual((self.cache.misses, self.cache.errors), (1, 1))
+
+    async def test_set(self):
+        await self.cache.set(self.user)
+        self.r.set.assert_awaited_once()
+        self.assertEqual(self.r.set.call_args.kwargs["ex"], 60)
+        data = self.r.set.call_args.args[1]
+        self.assertNotIn("hash", data)
+        self.assertNotIn("token", data)
+
+    async def test_invalidate(self):
+        await self.cache.invalidate(self.user.email)
+        self.r.delete.assert_awaited_once_with("user:val@example.com")
+
+    def test_stats(self):
+        self.cache.hits, self.cache.misses = 3, 1
+        self.assertEqual(self.cache.stats()["hit_ratio"], 0.75)
+
+
+class TestContactsCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = AsyncMock()
+        self.cache = ContactsCache(self.r, ttl=300, version_ttl=3600)
+        self.request = MagicMock()
+        self.request.headers = {}
+        self.load = AsyncMock(return_value=(b'[{"id":1}]', {"X-Next-Cursor": "abc"}))
+
+    async def test_version_starts_from_clock(self):
+        self.r.mget.return_value = [None, None]
+        self.r.get.return_value = b"1700000000000000000"
+        version = await self.cache.version(1)
+        self.assertEqual(version, 1700000000000000000)
+        self.assertTrue(self.r.set.call_args.kwargs["nx"])
+
+    async def test_response_miss_loads_and_caches(self):
+        self.r.mget.return_value = [b"5", None]
+        self.r.get.return_value = None
+        response = await self.cache.response(self.request, 1, "list", self.load)
+        self.load.assert_awaited_once()
+        self.assertEqual(response.body, b'[{"id":1}]')
+        self.assertEqual(response.headers["etag"], ContactsCache.etag(1, 5, "list"))
+        self.assertEqual(response.headers["x-next-cursor"], "abc")
+        self.assertEqual(self.r.set.call_args.args[0], "contacts:body:1:5:list")
+        self.assertEqual(self.r.set.call_args.args[1], b'{"X-Next-Cursor": "abc"}\n[{"id":1}]')
+
+    async def test_pickled_body_is_a_miss(self):
+        self.r.mget.return_value = [b"5", None]
+        self.r.get.return_value = pickle.dumps((b"[]", {}))
+        response = await self.cache.response(self.request, 1, "list", self.load)
+        self.load.assert_awaited_once()
+        self.assertEqual(response.body, b'[{"id":1}]')
+
+    async def test_response_hit_skips_load(self):
+        self.r.mget.return_value = [b"5", None]
+        self.r.get.return_value = b'{"X-Next-Cursor": "abc"}\n[]'
+        response = await self.cache.response(self.request, 1, "list", self.load)
+        self.load.assert_not_awaited()
+        self.assertEqual(response.body, b"[]")
+        self.assertEqual(response.headers["x-next-cursor"], "abc")
+        self.assertEqual(self.cache.hits, 1)
+
+    async def test_recent_write_reads_from_primary(self):
+        self.r.mget.return_value = [b"5", b"1"]
+
+        async def request():
+            await self.cache.version(1)
+            return read_from_primary.get()
+
+        # a task runs in a copy of the context, like a request does
+        self.assertTrue(await asyncio.create_task(request()))
+        self.assertFalse(read_from_primary.get())
+
+    async def test_response_not_modified(self):
+        self.r.mget.return_value = [b"5", None]
+        self.request.headers = {"if-none-match": ContactsCache.etag(1, 5, "list")}
+        response = await self.cache.response(self.request, 1, "list", self.load)
+        self.assertEqual(response.status_code, 304)
+        self.load.assert_not_awaited()
+
+    async def test_response_stale_etag(self):
+        self.r.mget.return_value = [b"6", None]
+        self.r.get.return_value = None
+        self.request.headers = {"if-none-match": ContactsCache.etag(1, 5, "list")}
+        response = await self.cache.response(self.request, 1, "list", self.load)
+        self.assertEqual(response.status_code, 200)
+        self.load.assert_awaited_once()
+
+    async def test_response_redis_unavailable(self):
+        self.r.mget.side_effect = ConnectionError()
+        response = await self.cache.response(self.request, 1, "list", self.load)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("etag", response.headers)
+        self.assertEqual(self.cache.errors, 1)
+
+    async def test_bump_discards_birthday_digest(self):
+        pipe = MagicMock()
+        pipe.__aenter__.return_value = pipe
+        pipe.execute = AsyncMock()
+        self.r.pipeline = MagicMock(return_value=pipe)
+        self.cache.digest = BirthdayDigest(MagicMock(), ttl=60)
+        await self.cache.bump(7)
+        today = date.today()
+        pipe.hdel.assert_any_call(BirthdayDigest.key(today), 7)
+        pipe.hdel.return_value.hdel.assert_called_once_with(BirthdayDigest.key(today + timedelta(days=1)), 7)
+        pipe.execute.assert_awaited_once()
+
+
+class TestBirthdayDigest(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = AsyncMock()
+        self.script = AsyncMock(return_value=1)
+        self.r.register_script = MagicMock(return_value=self.script)
+        self.digest = BirthdayDigest(self.r, ttl=3600)
+        self.request = MagicMock()
+        self.request.headers = {}
+        self.day = date(2023, 6, 1)
+        self.load = AsyncMock(return_value=b'[{"id":1}]')
+
+    async def test_hit_is_a_single_hget(self):
+        self.r.hget.return_value = b"[]"
+        response = await self.digest.response(self.request, 1, self.day, self.load)
+        self.assertEqual(response.body, b"[]")
+        self.assertEqual(response.headers["etag"], BirthdayDigest.etag(b"[]"))
+        self.r.hget.assert_awaited_once_with("birthdays:2023-06-01", 1)
+        self.r.mget.assert_not_awaited()
+        self.load.assert_not_awaited()
+
+    async def test_miss_rebuilds_and_stores(self):
+        self.r.hget.return_value = None
+        self.r.mget.return_value = [b"5", None]
+        response = await self.digest.response(self.request, 1, self.day, self.load)
+        self.assertEqual(response.body, b'[{"id":1}]')
+        self.script.assert_awaited_once_with(keys=["birthdays:2023-06-01", "contacts:version:1"],
+                                             args=[3600, 1, "5", b'[{"id":1}]'])
+        self.assertEqual((self.digest.misses, self.digest.stored), (1, 1))
+
+    async def test_miss_after_write_reads_from_primary(self):
+        self.r.hget.return_value = None
+        self.r.mget.return_value = [None, b"1"]
+
+        async def request():
+            await self.digest.response(self.request, 1, self.day, self.load)
+            return read_from_primary.get()
+
+        self.assertTrue(await asyncio.create_task(request()))
+        self.assertEqual(self.script.call_args.kwargs["args"][2], "")
+
+    async def test_not_modified(self):
+        self.r.hget.return_value = b"[]"
+        self.request.headers = {"if-none-match": BirthdayDigest.etag(b"[]")}
+        response = await self.digest.response(self.request, 1, self.day, self.load)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.digest.not_modified, 1)
+
+    async def test_redis_unavailable(self):
+        self.r.hget.side_effect = ConnectionError()
+        self.r.mget.side_effect = ConnectionError()
+        response = await self.digest.response(self.request, 1, self.day, self.load)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.body, b'[{"id":1}]')
+        self.script.assert_not_awaited()
+        self.assertEqual(self.digest.errors, 2)
+
+    async def test_versions_of_missing_keys_are_empty(self):
+        self.r.mget.return_value = [b"5", None]
+        self.assertEqual(await self.digest.versions([1, 2]), ["5", ""])
+        self.r.mget.assert_awaited_once_with("contacts:version:1", "contacts:version:2")
+
+
+class TestSharedClient(unittest.TestCase):
+
+    def test_commands_time_out(self):
+        kwargs = r.connection_pool.connection_kwargs
+        self.assertEqual(kwargs["socket_timeout"], settings.redis_socket_timeout)
+        self.assertEqual(kwargs["socket_connect_timeout"], settings.redis_socket_timeout)
+
+
+if __name__ == '__main__':
+    unittest.main()
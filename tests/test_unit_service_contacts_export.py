@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+import unittest
+from datetime import date, datetime
+from types import SimpleNamespace
+from typing import List
+from unittest.mock import patch
+
+from pydantic import parse_raw_as
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+from src.database.models import Base, Contact
+from src.repository.contacts import CONTACT_RESPONSE_COLUMNS
+from src.schemas import ContactResponse
+from src.services.contacts_export import export_contacts, render_contacts, render_contact_rows
+
+
+async def rows(count: int):
+    for i in range(count):
+        yield SimpleNamespace(id=i, first_name="Ola", last_name="Nordmann", email=f"ola{i}@example.com",
+                              phone=f"12345{i}", birthday=date(1990, 5, 1), created_at=datetime(2023, 3, 1, 12))
+
+
+class TestContactsExport(unittest.IsolatedAsyncioTestCase):
+
+    async def test_export_ndjson(self):
+        chunks = [chunk async for chunk in export_contacts(rows(250), "ndjson")]
+        self.assertEqual(len(chunks), 2)
+        lines = "".join(chunks).splitlines()
+        self.assertEqual(len(lines), 250)
+        self.assertEqual(json.loads(lines[0]), {
+            "id": 0, "first_name": "Ola", "last_name": "Nordmann", "email": "ola0@example.com",
+            "phone": "123450", "birthday": "1990-05-01", "created_at": "2023-03-01T12:00:00",
+        })
+
+    async def test_export_csv(self):
+        body = "".join([chunk async for chunk in export_contacts(rows(3), "csv")])
+        records = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(records), 3)
+        self.assertEqual(records[2]["email"], "ola2@example.com")
+        self.assertEqual(records[2]["birthday"], "1990-05-01")
+
+    async def test_export_empty(self):
+        body = "".join([chunk async for chunk in export_contacts(rows(0), "ndjson")])
+        self.assertEqual(body, "")
+
+
+class TestRenderContactRows(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(engine)
+        self.db = Session(engine)
+        self.db.add_all([
+            Contact(first_name="Ola", last_name="Nordmann", email="ola@example.com", phone="123450",
+                    birthday=date(1990, 5, 1), created_at=datetime(2023, 3, 1, 12, 0, 0, 123456), user_id=1),
+            Contact(first_name="Ярина", last_name='O"Brien', email="yaryna@example.com", phone="123451",
+                    birthday=date(2000, 2, 29), created_at=datetime(2023, 3, 2), user_id=1),
+        ])
+        self.db.commit()
+        self.addCleanup(self.db.close)
+
+    def test_matches_response_model(self):
+        contacts = self.db.execute(select(Contact).order_by(Contact.id)).scalars().all()
+        rows = self.db.execute(select(*CONTACT_RESPONSE_COLUMNS).order_by(Contact.id)).all()
+        fast = render_contact_rows(rows)
+        self.assertEqual(fast, render_contacts(contacts))
+        self.assertEqual(parse_raw_as(List[ContactResponse], fast),
+                         [ContactResponse.from_orm(contact) for contact in contacts])
+
+    def test_without_orjson(self):
+        rows = self.db.execute(select(*CONTACT_RESPONSE_COLUMNS).order_by(Contact.id)).all()
+        expected = render_contact_rows(rows)
+        with patch("src.services.contacts_export.orjson", None):
+            self.assertEqual(render_contact_rows(rows), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
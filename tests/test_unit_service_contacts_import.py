@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from src.database.models import User
+from src.services.contacts_import import in_quoted_field, iter_records, import_contacts
+
+
+async def chunked(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class TestContactsImport(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.user = User(id=1)
+
+    async def test_iter_records_csv(self):
+        data = "first_name,email\r\nÖla,ola@example.com\r\n\r\nbad\r\nKim,kim@example.com".encode()
+        records = [record async for record in iter_records(chunked(data), "csv")]
+        self.assertEqual(records, [
+            (2, {"first_name": "Öla", "email": "ola@example.com"}),
+            (4, "Expected 2 columns, got 1"),
+            (5, {"first_name": "Kim", "email": "kim@example.com"}),
+        ])
+
+    async def test_iter_records_csv_quoted_newlines(self):
+        data = ('first_name,notes\r\n"Ola","first\r\n\r\n""third"" line"\r\nO"Brien,plain\r\n'
+                'Kim,"open\r\n').encode()
+        records = [record async for record in iter_records(chunked(data), "csv")]
+        self.assertEqual(records, [
+            (2, {"first_name": "Ola", "notes": 'first\n\n"third" line'}),
+            (5, {"first_name": 'O"Brien', "notes": "plain"}),
+            (6, "Quoted field is not closed"),
+        ])
+
+    def test_in_quoted_field(self):
+        self.assertTrue(in_quoted_field('a,"b'))
+        self.assertFalse(in_quoted_field('a,"b""c"'))
+        self.assertTrue(in_quoted_field('a,"b""'))
+        self.assertFalse(in_quoted_field('a,b"c'))
+        self.assertFalse(in_quoted_field('end",x', quoted=True))
+        self.assertTrue(in_quoted_field('still "" open', quoted=True))
+
+    async def test_iter_records_ndjson(self):
+        data = b'{"first_name": "Ola"}\n[1]\n{oops\n'
+        records = [record async for record in iter_records(chunked(data), "ndjson")]
+        self.assertEqual(records[0], (1, {"first_name": "Ola"}))
+        self.assertEqual(records[1], (2, "Expected a JSON object"))
+        self.assertTrue(records[2][1].startswith("Invalid JSON"))
+
+    async def test_import_contacts(self):
+        data = (b"first_name,last_name,email,phone,birthday\n"
+                b"Ola,Nordmann,ola@example.com,1234567,1990-05-01\n"
+                b"Kim,Larsen,not-an-email,7654321,1991-06-02\n"
+                b"Kim,Larsen,kim@example.com,7654321,1991-06-02\n")
+        create_contacts = AsyncMock(return_value=[None, "Contact with phone 7654321 already exists"])
+        with patch("src.services.contacts_import.repository_contacts.create_contacts", create_contacts):
+            result = await import_contacts(chunked(data), "csv", self.user, db=AsyncMock())
+        self.assertEqual(result["imported"], 1)
+        self.assertEqual([error["line"] for error in result["errors"]], [3, 4])
+        self.assertIn("email", result["errors"][0]["detail"])
+        bodies = create_contacts.call_args.args[0]
+        self.assertEqual([body.email for body in bodies], ["ola@example.com", "kim@example.com"])
+
+    async def test_import_contacts_checks_before_each_batch(self):
+        data = b"first_name,last_name,email,phone,birthday\nOla,Nordmann,ola@example.com,1234567,1990-05-01\n"
+        check = AsyncMock(side_effect=RuntimeError("locked"))
+        create_contacts = AsyncMock()
+        with patch("src.services.contacts_import.repository_contacts.create_contacts", create_contacts):
+            with self.assertRaises(RuntimeError):
+                await import_contacts(chunked(data), "csv", self.user, db=AsyncMock(), check=check)
+        create_contacts.assert_not_awaited()
+
+    async def test_import_contacts_caps_errors(self):
+        data = b"first_name\n" + b"x,y\n" * 25
+        with patch("src.services.contacts_import.settings.import_max_errors", 10):
+            result = await import_contacts(chunked(data), "csv", self.user, db=AsyncMock())
+        self.assertEqual(result["error_count"], 25)
+        self.assertEqual([error["line"] for error in result["errors"]], list(range(2, 12)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from aiosmtplib import SMTPServerDisconnected
+
+from src.services.email import EmailDispatcher, Email, send_email, email_dispatcher, get_mail_config, get_templates
+
+
+class TestEmailDispatcher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.dispatcher = EmailDispatcher(batch_size=2, retry_backoff=0.01, max_retries=1, backend="memory")
+        # imported lazily by the first email, which would eat into the retry timings below
+        get_mail_config()
+        get_templates()
+
+    def make_email(self, recipient: str = "val@example.com") -> Email:
+        return Email(recipient=recipient, subject="Confirm your email ", template_name="email_template.html",
+                     template_body={"host": "http://test/", "username": "<val>", "token": "abc"})
+
+    async def test_sends_queued_emails(self):
+        for i in range(3):
+            self.dispatcher.enqueue(self.make_email(f"user{i}@example.com"))
+        self.assertEqual(self.dispatcher.stats()["queue_depth"], 3)
+        await self.dispatcher.start()
+        await self.dispatcher.stop()
+        outbox = self.dispatcher.memory.outbox
+        self.assertEqual([message["To"] for message in outbox],
+                         ["user0@example.com", "user1@example.com", "user2@example.com"])
+        body = outbox[0].get_content()
+        self.assertIn("http://test/api/auth/confirmed_email/abc", body)
+        self.assertIn("&lt;val&gt;", body)
+        self.assertEqual(self.dispatcher.stats()["sent"], 3)
+
+    async def test_retries_with_backoff(self):
+        self.dispatcher.memory.send = AsyncMock(side_effect=[SMTPServerDisconnected("gone"), None])
+        self.dispatcher.enqueue(self.make_email())
+        await self.dispatcher.start()
+        await asyncio.sleep(0.05)
+        await self.dispatcher.stop()
+        self.assertEqual(self.dispatcher.memory.send.await_count, 2)
+        self.assertEqual((self.dispatcher.retried, self.dispatcher.sent, self.dispatcher.failed), (1, 1, 0))
+
+    async def test_gives_up_after_max_retries(self):
+        self.dispatcher.memory.send = AsyncMock(side_effect=SMTPServerDisconnected("gone"))
+        self.dispatcher.enqueue(self.make_email())
+        await self.dispatcher.start()
+        await asyncio.sleep(0.05)
+        await self.dispatcher.stop()
+        self.assertEqual((self.dispatcher.retried, self.dispatcher.failed), (1, 1))
+
+    async def test_send_email_enqueues(self):
+        depth = email_dispatcher.queue.qsize()
+        await send_email("kim@example.com", "kim", "http://test/")
+        self.assertEqual(email_dispatcher.queue.qsize(), depth + 1)
+        queued = [email_dispatcher.queue.get_nowait() for _ in range(depth + 1)]
+        email = queued[-1]
+        self.assertEqual(email.recipient, "kim@example.com")
+        self.assertTrue(email.template_body["token"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+
+from fastapi import HTTPException
+
+from src.services.hashing import PasswordHasher
+
+
+class TestPasswordHasher(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.hasher = PasswordHasher("thread", max_workers=1, max_queue=1)
+        self.addCleanup(self.hasher.shutdown)
+
+    async def test_hash_and_verify(self):
+        hashed = await self.hasher.hash("secret")
+        self.assertTrue(await self.hasher.verify("secret", hashed))
+        self.assertFalse(await self.hasher.verify("wrong", hashed))
+        self.assertEqual(self.hasher.stats()["completed"], 3)
+        self.assertEqual(self.hasher.stats()["in_flight"], 0)
+
+    async def test_rejects_when_saturated(self):
+        release = threading.Event()
+
+        def blocking_hash(password):
+            release.wait()
+            return password
+
+        with patch("src.services.hashing._hash", blocking_hash):
+            running = [asyncio.create_task(self.hasher.hash("secret")) for _ in range(2)]
+            await asyncio.sleep(0)
+            with self.assertRaises(HTTPException) as cm:
+                await self.hasher.hash("secret")
+            release.set()
+            await asyncio.gather(*running)
+        self.assertEqual(cm.exception.status_code, 503)
+        self.assertEqual(self.hasher.stats()["rejected"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
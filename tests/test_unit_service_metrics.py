@@ -0,0 +1,89 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.services import metrics
+from src.services.metrics import Counter, Histogram, MetricsMiddleware, Registry, record_time
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_render_cumulative_buckets(self):
+        histogram = Histogram("latency", "Latency.", ("route",), buckets=(0.1, 1.0))
+        histogram.observe(0.05, "/a")
+        histogram.observe(0.5, "/a")
+        histogram.observe(5, "/a")
+        lines = histogram.render()
+        self.assertIn('latency_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('latency_bucket{route="/a",le="1.0"} 2', lines)
+        self.assertIn('latency_bucket{route="/a",le="+Inf"} 3', lines)
+        self.assertIn('latency_count{route="/a"} 3', lines)
+
+    def test_record_time_outside_request(self):
+        record_time("db", 1.0)
+
+
+class TestMultiprocess(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = Registry()
+        self.requests = self.registry.register(Counter("requests", "Requests.", ("route",)))
+        self.latency = self.registry.register(Histogram("latency", "Latency.", ("route",), buckets=(0.1, 1.0)))
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_render_all_sums_the_workers(self):
+        self.requests.inc("/a", amount=2)
+        self.latency.observe(0.05, "/a")
+        # the dump of another worker
+        other = Registry()
+        other.register(Counter("requests", "Requests.", ("route",))).inc("/a", amount=3)
+        other.register(Histogram("latency", "Latency.", ("route",), buckets=(0.1, 1.0))).observe(0.5, "/a")
+        Path(self.directory.name, "1.json").write_text(
+            json.dumps({metric.name: metric.snapshot() for metric in other.metrics}))
+        lines = self.registry.render_all(self.directory.name).splitlines()
+        self.assertIn('requests{route="/a"} 5', lines)
+        self.assertIn('latency_bucket{route="/a",le="0.1"} 1', lines)
+        self.assertIn('latency_bucket{route="/a",le="1.0"} 2', lines)
+        self.assertIn('latency_count{route="/a"} 2', lines)
+        # the local registry is not changed by rendering
+        self.assertEqual(self.requests.values, {("/a",): 2})
+
+    def test_render_all_skips_unreadable_dumps(self):
+        self.requests.inc("/a")
+        Path(self.directory.name, "2.json").write_text("{trunc")
+        self.assertIn('requests{route="/a"} 1', self.registry.render_all(self.directory.name).splitlines())
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+
+    def setUp(self):
+        for name in ("requests_total", "request_duration", "request_db_time"):
+            original = getattr(metrics, name)
+            copy = type(original)(original.name, original.documentation, original.labels)
+            setattr(metrics, name, copy)
+            self.addCleanup(setattr, metrics, name, original)
+        app = FastAPI()
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/items/{item_id}")
+        async def read_item(item_id: int):
+            record_time("db", 0.25)
+            return {"id": item_id}
+
+        self.client = TestClient(app)
+
+    def test_labels_use_route_template(self):
+        self.client.get("/items/1")
+        self.client.get("/items/2")
+        self.client.get("/missing")
+        self.assertEqual(metrics.requests_total.values, {
+            ("GET", "/items/{item_id}", "200"): 2,
+            ("GET", "unmatched", "404"): 1,
+        })
+        counts, total, count = metrics.request_db_time.observations[("GET", "/items/{item_id}")]
+        self.assertEqual((total, count), (0.5, 2))
@@ -0,0 +1,26 @@
+import unittest
+
+from src.database.models import Contact
+from src.services.pagination import encode_cursor, decode_cursor, next_cursor
+
+
+class TestPagination(unittest.TestCase):
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor(42)), 42)
+
+    def test_decode_invalid_cursor(self):
+        for cursor in ("", "not-a-cursor", encode_cursor("42")):
+            with self.assertRaises(ValueError):
+                decode_cursor(cursor)
+
+    def test_next_cursor_full_page(self):
+        contacts = [Contact(id=1), Contact(id=7)]
+        self.assertEqual(decode_cursor(next_cursor(contacts, limit=2)), 7)
+
+    def test_next_cursor_last_page(self):
+        self.assertIsNone(next_cursor([Contact(id=1)], limit=2))
+
+
+if __name__ == '__main__':
+    unittest.main()
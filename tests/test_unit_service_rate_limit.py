@@ -0,0 +1,96 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from redis.exceptions import ConnectionError
+
+from src.services.rate_limit import CircuitBreaker, HybridRateLimiter, client_id, parse_rule
+
+
+class FakePipeline:
+    def __init__(self, execute):
+        self.execute = execute
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def incrby(self, key, amount):
+        self.commands.append(("incrby", key, amount))
+        return self
+
+    def expire(self, key, seconds):
+        self.commands.append(("expire", key, seconds))
+        return self
+
+
+class TestHybridRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = MagicMock()
+        self.pipe = FakePipeline(AsyncMock())
+        self.r.pipeline.return_value = self.pipe
+        self.limiter = HybridRateLimiter(self.r, {"read": "3/60", "free": "0"}, breaker_threshold=2)
+
+    def test_parse_rule(self):
+        self.assertEqual(parse_rule("10/60"), (10, 60))
+        self.assertIsNone(parse_rule("0"))
+
+    def test_local_bucket(self):
+        self.assertEqual([self.limiter.hit("read", "a") for _ in range(3)], [0, 0, 0])
+        self.assertGreater(self.limiter.hit("read", "a"), 0)
+        self.assertEqual(self.limiter.hit("read", "b"), 0)
+        self.assertEqual(self.limiter.hit("free", "a"), 0)
+        self.assertEqual((self.limiter.allowed, self.limiter.limited), (4, 1))
+
+    async def test_sync_batches_pending_counts(self):
+        self.limiter.hit("read", "a")
+        self.limiter.hit("read", "a")
+        self.pipe.execute.return_value = [3, True]
+        await self.limiter.sync()
+        self.assertEqual(len(self.pipe.commands), 2)
+        self.assertEqual(self.pipe.commands[0][2], 2)
+        # another worker used the third request of the window
+        self.assertGreater(self.limiter.hit("read", "a"), 0)
+
+    async def test_breaker_falls_back_to_local_limits(self):
+        self.pipe.execute.side_effect = ConnectionError()
+        self.limiter.hit("read", "a")
+        await self.limiter.sync()
+        await self.limiter.sync()
+        self.assertEqual(self.limiter.breaker.state(), "open")
+        self.assertEqual(self.limiter.buckets[("read", "a")].pending, 1)
+        await self.limiter.sync()
+        self.assertEqual(self.pipe.execute.await_count, 2)
+        self.assertEqual([self.limiter.hit("read", "a") for _ in range(2)], [0, 0])
+        self.assertGreater(self.limiter.hit("read", "a"), 0)
+
+    async def test_fail_open(self):
+        self.limiter.fallback = "open"
+        self.limiter.breaker.failure()
+        self.limiter.breaker.failure()
+        self.assertEqual([self.limiter.hit("read", "a") for _ in range(5)], [0] * 5)
+
+
+class TestClientId(unittest.TestCase):
+
+    def test_ignores_forwarded_header(self):
+        request = MagicMock()
+        request.headers = {"X-Forwarded-For": "1.2.3.4"}
+        request.client.host = "10.0.0.1"
+        self.assertEqual(client_id(request), "10.0.0.1")
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def test_half_open_after_cooldown(self):
+        breaker = CircuitBreaker(threshold=1, cooldown=30)
+        with patch("src.services.rate_limit.time.monotonic", return_value=100):
+            breaker.failure()
+            self.assertTrue(breaker.open)
+        with patch("src.services.rate_limit.time.monotonic", return_value=131):
+            self.assertEqual(breaker.state(), "half-open")
+        breaker.success()
+        self.assertEqual(breaker.state(), "closed")
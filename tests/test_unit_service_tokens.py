@@ -0,0 +1,134 @@
+import unittest
+from unittest.mock import AsyncMock
+
+from fastapi import HTTPException
+from redis.exceptions import ConnectionError
+
+from src.services.auth import auth_service
+from src.services.tokens import RefreshTokenStore
+
+
+class FakeRedis:
+    """
+    Just enough of Redis for the token store, values are kept as bytes like the real client returns them.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.ttls = {}
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = str(value).encode()
+        self.ttls[key] = ex
+
+    async def getdel(self, key):
+        return self.data.pop(key, None)
+
+    async def exists(self, key):
+        return int(key in self.data)
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member.encode())
+
+    async def srem(self, key, member):
+        self.data.get(key, set()).discard(member.encode())
+
+    async def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    async def expire(self, key, seconds):
+        self.ttls[key] = seconds
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, r):
+        self.r = r
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append(getattr(self.r, name)(*args, **kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        return [await command for command in self.commands]
+
+
+class TestRefreshTokenStore(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.r = FakeRedis()
+        self.store = RefreshTokenStore(self.r, ttl=3600)
+
+    async def claims(self, token):
+        return await auth_service.decode_refresh_claims(token)
+
+    async def test_issue(self):
+        claims = await self.claims(await self.store.issue("val@example.com"))
+        self.assertEqual(claims["sub"], "val@example.com")
+        self.assertEqual(self.r.data[self.store.token_key(claims["jti"])], claims["fam"].encode())
+        self.assertEqual(self.r.data[self.store.family_key(claims["fam"])], b"val@example.com")
+        self.assertEqual(self.r.ttls[self.store.token_key(claims["jti"])], 3600)
+        self.assertEqual(claims["exp"] - claims["iat"], 3600)
+
+    async def test_rotate_keeps_family(self):
+        first = await self.claims(await self.store.issue("val@example.com"))
+        second = await self.claims(await self.store.rotate(first))
+        self.assertEqual(second["fam"], first["fam"])
+        self.assertNotEqual(second["jti"], first["jti"])
+        self.assertNotIn(self.store.token_key(first["jti"]), self.r.data)
+
+    async def test_reuse_revokes_family(self):
+        first = await self.claims(await self.store.issue("val@example.com"))
+        second = await self.claims(await self.store.rotate(first))
+        with self.assertRaises(HTTPException) as e:
+            await self.store.rotate(first)
+        self.assertEqual(e.exception.status_code, 401)
+        self.assertEqual(self.store.reused, 1)
+        # the token the other party got is dead too
+        with self.assertRaises(HTTPException):
+            await self.store.rotate(second)
+
+    async def test_devices_are_independent(self):
+        phone = await self.claims(await self.store.issue("val@example.com"))
+        laptop = await self.claims(await self.store.issue("val@example.com"))
+        await self.store.revoke_family("val@example.com", phone["fam"])
+        with self.assertRaises(HTTPException):
+            await self.store.rotate(phone)
+        await self.store.rotate(laptop)
+
+    async def test_revoke_all(self):
+        tokens = [await self.claims(await self.store.issue("val@example.com")) for _ in range(3)]
+        self.assertEqual(await self.store.revoke_all("val@example.com"), 3)
+        for claims in tokens:
+            with self.assertRaises(HTTPException):
+                await self.store.rotate(claims)
+
+    async def test_token_without_family_is_rejected(self):
+        with self.assertRaises(HTTPException) as e:
+            await self.store.rotate({"sub": "val@example.com", "scope": "refresh_token"})
+        self.assertEqual(e.exception.status_code, 401)
+
+    async def test_redis_down(self):
+        self.r.smembers = AsyncMock(side_effect=ConnectionError("down"))
+        with self.assertRaises(HTTPException) as e:
+            await self.store.revoke_all("val@example.com")
+        self.assertEqual(e.exception.status_code, 503)
+        self.assertEqual(self.store.errors, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()